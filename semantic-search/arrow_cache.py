@@ -0,0 +1,407 @@
+"""
+arrow_cache.py - Columnar Arrow/Parquet cache of the dataset.
+
+Every load of the dataset used to start from ~830k lines of JSON: each
+embedding is 128 numbers as decimal text, and parsing them is most of
+the time db_insert.py and the offline tools spend before doing anything.
+`python arrow_cache.py build` joins the documents and the embeddings once
+and writes them as two columnar tables:
+
+    data/cache/podcast.arrow    id, title
+    data/cache/segment.arrow    id, podcast_id, start_time, end_time, content,
+                                embedding fixed_size_list<float32>[128]
+
+Arrow IPC files are written uncompressed and memory-mapped on read, so
+scan_segments() yields record batches whose buffers point straight into
+the page cache, and embedding_matrix() views a batch's embeddings as an
+(n, 128) float32 array without copying or parsing anything.
+
+With --parquet the tables are written as Parquet instead (zstd, about half
+the size on disk). Parquet is decoded on read, so it isn't zero-copy, but
+it is still far faster than JSON and easy to share with other tools.
+
+Rows are in the order of the embedding files; the cache is rebuilt from
+scratch, not updated. The size and mtime of every source file are kept in
+the schema metadata, and db_insert.py --from-cache refuses a cache whose
+files have changed since (check_cache()). Only this module (and whatever reads the cache)
+needs pyarrow.
+
+Usage:
+    python arrow_cache.py build              # from the extracted files in data/
+    python arrow_cache.py build --from-zip   # from data/*.zip (download_data.py --no-extract)
+    python arrow_cache.py build --from-url   # straight from the download
+    python arrow_cache.py build --parquet    # Parquet instead of Arrow IPC
+    python arrow_cache.py info               # row counts, sizes, schema and staleness
+
+    from arrow_cache import scan_segments, embedding_matrix
+    for batch in scan_segments(columns=["id", "embedding"]):
+        vectors = embedding_matrix(batch)   # (n, 128) float32, zero-copy
+"""
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import numpy as np
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pyarrow as pa
+
+from zip_stream import iter_jsonl
+
+CACHE_DIR = Path(os.path.dirname(__file__)) / "data" / "cache"
+DIMENSIONS = 128
+
+# Rows per record batch (65536 x 128 float32 = 32 MB of embeddings)
+BATCH_ROWS = 65536
+
+PODCAST_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("title", pa.string()),
+])
+
+SEGMENT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("podcast_id", pa.string()),
+    ("start_time", pa.float64()),
+    ("end_time", pa.float64()),
+    ("content", pa.string()),
+    ("embedding", pa.list_(pa.float32(), DIMENSIONS)),
+])
+
+FORMATS = ("arrow", "parquet")
+
+
+class CacheNotFound(FileNotFoundError):
+    """Raised when there is no cache to read; run `arrow_cache.py build`."""
+
+
+class StaleCache(RuntimeError):
+    """Raised when the files a cache was built from have changed since."""
+
+
+# =============================================================================
+# Writing
+# =============================================================================
+class _TableWriter:
+    """Writes record batches to an Arrow IPC file or a Parquet file."""
+
+    def __init__(self, path: Path, schema: pa.Schema, fmt: str):
+        self.path = path
+        self.tmp = path.with_name(path.name + ".tmp")
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.tmp, schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_file(str(self.tmp), schema)
+
+    def write(self, batch: pa.RecordBatch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        """Finish the file and move it into place."""
+        self.writer.close()
+        os.replace(self.tmp, self.path)
+
+
+# =============================================================================
+# Source fingerprint
+# =============================================================================
+# The cache is a snapshot: once download_data.py's delta sync replaces a
+# file, the cache no longer matches data/. build_cache() records the size
+# and modification time of every file it read in the schema metadata of
+# both tables, and check_cache() compares them with what is on disk now.
+# URL sources can't be checked without downloading them again.
+SOURCE_KEY = b"source"
+
+
+def _source_files(source: str, pattern: str) -> Optional[List[Path]]:
+    """The local files a source reads (None for a URL)."""
+    if str(source).startswith(("http://", "https://")):
+        return None
+    path = Path(source)
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.is_file() and fnmatch.fnmatch(p.name, pattern))
+    return [path]
+
+
+def source_fingerprint(raw_source: str, embeddings_source: str) -> dict:
+    """Sources, and size and mtime of each local file they read."""
+    files = {}
+    for source, pattern in ((raw_source, "batch_request*.jsonl"), (embeddings_source, "embedding*.jsonl")):
+        for path in _source_files(source, pattern) or []:
+            stat = path.stat()
+            files[str(path.resolve())] = [stat.st_size, stat.st_mtime_ns]
+    return {"raw_source": str(raw_source), "embeddings_source": str(embeddings_source), "files": files}
+
+
+def _segment_batch(ids, podcast_ids, starts, ends, contents, vectors: np.ndarray) -> pa.RecordBatch:
+    embeddings = pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), DIMENSIONS)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(ids, pa.string()), pa.array(podcast_ids, pa.string()),
+         pa.array(starts, pa.float64()), pa.array(ends, pa.float64()),
+         pa.array(contents, pa.string()), embeddings],
+        schema=SEGMENT_SCHEMA,
+    )
+
+
+def build_cache(raw_source: str, embeddings_source: str, out_dir: Path = CACHE_DIR,
+                fmt: str = "arrow", batch_rows: int = BATCH_ROWS) -> dict:
+    """
+    Convert the JSONL dataset into the columnar cache.
+
+    Parameters:
+    -----------
+    raw_source, embeddings_source : str
+        Where the batch_request and embedding files are: a directory of
+        extracted files, a zip file or a zip URL (see zip_stream.iter_jsonl).
+    out_dir : Path
+        Cache directory; an existing cache in it is replaced.
+    fmt : str
+        "arrow" (IPC file, memory-mapped on read) or "parquet".
+    batch_rows : int
+        Rows per record batch (Arrow) or row group (Parquet).
+
+    Returns:
+    --------
+    dict
+        Row counts, embeddings without a document, sizes and the time taken.
+    """
+    # Imported here: db_insert pulls in the database driver, which readers
+    # of the cache don't need
+    from db_insert import stream_documents
+
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}, got {fmt!r}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+
+    # Taken before reading, so a file replaced during the build shows up as changed
+    metadata = {SOURCE_KEY: json.dumps(source_fingerprint(raw_source, embeddings_source)).encode()}
+    podcasts, documents = stream_documents(raw_source)
+    writer = _TableWriter(out_dir / f"podcast.{fmt}", PODCAST_SCHEMA.with_metadata(metadata), fmt)
+    writer.write(pa.RecordBatch.from_arrays(
+        [pa.array(list(podcasts), pa.string()), pa.array(list(podcasts.values()), pa.string())],
+        schema=PODCAST_SCHEMA))
+    writer.close()
+
+    writer = _TableWriter(out_dir / f"segment.{fmt}", SEGMENT_SCHEMA.with_metadata(metadata), fmt)
+    vectors = np.empty((batch_rows, DIMENSIONS), dtype=np.float32)
+    ids, podcast_ids, starts, ends, contents = [], [], [], [], []
+    rows, missing = 0, []
+    for _, record in iter_jsonl(embeddings_source, "embedding*.jsonl"):
+        segment_id = record["custom_id"]
+        document = documents.get(segment_id)
+        if document is None:
+            missing.append(segment_id)
+            continue
+        start_time, end_time, content, podcast_id = document
+        vectors[len(ids)] = record["response"]["body"]["data"][0]["embedding"]
+        ids.append(segment_id)
+        podcast_ids.append(podcast_id)
+        starts.append(start_time)
+        ends.append(end_time)
+        contents.append(content)
+        if len(ids) == batch_rows:
+            writer.write(_segment_batch(ids, podcast_ids, starts, ends, contents, vectors))
+            rows += len(ids)
+            # pa.array() wraps the buffer without copying, so start a new one
+            vectors = np.empty((batch_rows, DIMENSIONS), dtype=np.float32)
+            ids, podcast_ids, starts, ends, contents = [], [], [], [], []
+    if ids:
+        writer.write(_segment_batch(ids, podcast_ids, starts, ends, contents, vectors[:len(ids)]))
+        rows += len(ids)
+    writer.close()
+
+    # Don't leave a cache of the other format behind to be read by mistake
+    other = FORMATS[1 - FORMATS.index(fmt)]
+    for table in ("podcast", "segment"):
+        (out_dir / f"{table}.{other}").unlink(missing_ok=True)
+
+    stats = {
+        "format": fmt,
+        "podcasts": len(podcasts),
+        "segments": rows,
+        "missing_documents": len(missing),
+        "bytes": sum((out_dir / f"{table}.{fmt}").stat().st_size for table in ("podcast", "segment")),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    if missing:
+        print(f"⚠️  {len(missing):,} embeddings had no document (e.g. {missing[0]}) and were skipped")
+    print(f"🗃️  Cached {rows:,} segments and {len(podcasts):,} podcasts "
+          f"({stats['bytes'] / 1024 ** 2:.1f} MB {fmt}) in {stats['seconds']:.1f}s")
+    return stats
+
+
+# =============================================================================
+# Reading
+# =============================================================================
+def cache_path(table: str, cache_dir: Path = CACHE_DIR) -> Path:
+    """Path of a cached table ("podcast" or "segment"), in whichever format was built."""
+    for fmt in FORMATS:
+        path = Path(cache_dir) / f"{table}.{fmt}"
+        if path.exists():
+            return path
+    raise CacheNotFound(f"No {table} table in {cache_dir}; run `python arrow_cache.py build` first")
+
+
+def scan_table(table: str, cache_dir: Path = CACHE_DIR, columns: Optional[List[str]] = None,
+               batch_rows: int = BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Yield the record batches of a cached table.
+
+    Arrow files are memory-mapped and their batches are read without
+    copying; Parquet files are decoded `batch_rows` rows at a time. Only
+    the requested `columns` are read (all of them by default).
+    """
+    path = cache_path(table, cache_dir)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns)
+        return
+    # The batches keep the mapping alive for as long as they are referenced
+    reader = pa.ipc.open_file(pa.memory_map(str(path), "r"))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        yield batch.select(columns) if columns is not None else batch
+
+
+def scan_segments(cache_dir: Path = CACHE_DIR, columns: Optional[List[str]] = None,
+                  batch_rows: int = BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Yield the cached segments as record batches.
+
+    Example:
+    --------
+    >>> for batch in scan_segments(columns=["id", "embedding"]):
+    ...     ids = batch.column("id").to_pylist()
+    ...     vectors = embedding_matrix(batch)
+    """
+    yield from scan_table("segment", cache_dir, columns, batch_rows)
+
+
+def load_podcasts(cache_dir: Path = CACHE_DIR) -> dict:
+    """podcast_id -> title from the cache."""
+    podcasts = {}
+    for batch in scan_table("podcast", cache_dir):
+        podcasts.update(zip(batch.column("id").to_pylist(), batch.column("title").to_pylist()))
+    return podcasts
+
+
+def embedding_matrix(batch: pa.RecordBatch) -> np.ndarray:
+    """
+    The embedding column of a batch as an (n, 128) float32 array.
+
+    For batches read from an Arrow file this is a read-only view of the
+    memory-mapped file; nothing is copied.
+    """
+    column = batch.column("embedding")
+    # flatten() (unlike .values) respects the batch's offset into the array
+    return column.flatten().to_numpy(zero_copy_only=True).reshape(-1, DIMENSIONS)
+
+
+def cache_info(cache_dir: Path = CACHE_DIR) -> dict:
+    """Row count, size and schema of each cached table."""
+    info = {}
+    for table in ("podcast", "segment"):
+        path = cache_path(table, cache_dir)
+        if path.suffix == ".parquet":
+            import pyarrow.parquet as pq
+            metadata = pq.ParquetFile(path).metadata
+            rows, schema = metadata.num_rows, metadata.schema.to_arrow_schema()
+        else:
+            reader = pa.ipc.open_file(pa.memory_map(str(path), "r"))
+            rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+            schema = reader.schema
+        info[table] = {"path": str(path), "rows": rows, "bytes": path.stat().st_size,
+                       "schema": str(schema.remove_metadata())}
+    return info
+
+
+def cache_source(cache_dir: Path = CACHE_DIR) -> Optional[dict]:
+    """The source fingerprint recorded when the cache was built, or None if there is none."""
+    path = cache_path("segment", cache_dir)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(path).metadata
+    else:
+        metadata = pa.ipc.open_file(pa.memory_map(str(path), "r")).schema.metadata
+    if not metadata or SOURCE_KEY not in metadata:
+        return None
+    return json.loads(metadata[SOURCE_KEY])
+
+
+def check_cache(cache_dir: Path = CACHE_DIR) -> List[str]:
+    """
+    Compare the cache's recorded source files with the files on disk now.
+
+    Returns:
+    --------
+    list of str
+        One line per file that changed, disappeared or was added since the
+        build; empty if the cache is current or its sources are URLs. A
+        cache with no recorded fingerprint can't be checked and counts as
+        stale.
+    """
+    recorded = cache_source(cache_dir)
+    if recorded is None:
+        return ["no source fingerprint recorded"]
+    current = source_fingerprint(recorded["raw_source"], recorded["embeddings_source"])["files"]
+    problems = []
+    for name, (size, mtime_ns) in recorded["files"].items():
+        if name not in current:
+            problems.append(f"missing: {name}")
+        elif current[name] != [size, mtime_ns]:
+            problems.append(f"changed: {name}")
+    problems.extend(f"new: {name}" for name in current if name not in recorded["files"])
+    return problems
+
+
+# =============================================================================
+# Command line
+# =============================================================================
+def cache_sources(origin: str = "dir") -> tuple:
+    """(raw_data, embeddings) sources: "dir" (extracted data/), "zip" or "url"."""
+    from db_insert import DATA_DIR, stream_sources
+    if origin == "dir":
+        return DATA_DIR, DATA_DIR
+    return stream_sources(origin)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = list(sys.argv[1:] if argv is None else argv)
+    command = args[0] if args else "build"
+
+    if command == "build":
+        origin = "zip" if "--from-zip" in args else "url" if "--from-url" in args else "dir"
+        raw_source, embeddings_source = cache_sources(origin)
+        build_cache(raw_source, embeddings_source, fmt="parquet" if "--parquet" in args else "arrow")
+        return 0
+
+    if command == "info":
+        try:
+            info = cache_info()
+        except CacheNotFound as e:
+            print(f"❌ {e}")
+            return 1
+        for table, entry in info.items():
+            print(f"📦 {table}: {entry['rows']:,} rows, {entry['bytes'] / 1024 ** 2:.1f} MB ({entry['path']})")
+            for line in entry["schema"].splitlines():
+                print(f"      {line}")
+        problems = check_cache()
+        if problems:
+            for line in problems:
+                print(f"⚠️  Stale, {line}")
+        else:
+            print("✅ Source files unchanged since the build")
+        return 0
+
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+bench_async.py - Load test the asyncio query engine at different concurrency levels.
+
+Issues NUM_QUERIES random similar_segments() calls through AsyncSearch with
+at most N in flight at once, for each N in CONCURRENCY_LEVELS. Reports
+queries/s and per-query latency percentiles.
+Results are saved to bench_results/async_load.json.
+
+Usage:
+    python bench_async.py
+"""
+
+import sys
+import json
+import time
+import asyncio
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+from search_async import AsyncSearch
+
+# Configuration
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32, 64]
+NUM_QUERIES = 500
+K = 5
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+SAMPLE_IDS_SQL = f"SELECT id FROM segment ORDER BY random() LIMIT {NUM_QUERIES}"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class AsyncLoadTest:
+    def __init__(self):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "num_queries": NUM_QUERIES,
+            "k": K,
+            "levels": {},
+        }
+
+    async def run_level(self, concurrency: int, segment_ids: list) -> dict:
+        """Run all queries with at most `concurrency` in flight."""
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with AsyncSearch(min_size=concurrency, max_size=concurrency) as engine:
+            async def one(segment_id):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await engine.similar_segments(segment_id, k=K)
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(segment_id) for segment_id in segment_ids))
+            elapsed = time.perf_counter() - start
+
+        return {
+            "elapsed": round(elapsed, 3),
+            "queries_per_sec": round(len(segment_ids) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        }
+
+    async def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Async load test: {NUM_QUERIES} queries per level")
+        print("=" * 60)
+        print()
+
+        async with AsyncSearch(max_size=1) as engine:
+            segment_ids = [row[0] for row in await engine.run_query(SAMPLE_IDS_SQL)]
+
+        print(f"  {'concurrency':>11}  {'q/s':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}")
+        for concurrency in CONCURRENCY_LEVELS:
+            result = await self.run_level(concurrency, segment_ids)
+            self.report["levels"][str(concurrency)] = result
+            print(f"  {concurrency:>11}  {result['queries_per_sec']:>8.1f}  {result['p50_ms']:>8.2f}"
+                  f"  {result['p95_ms']:>8.2f}  {result['p99_ms']:>8.2f}")
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "async_load.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        asyncio.run(self.run_tests())
+        self.save_report()
+
+
+if __name__ == "__main__":
+    tester = AsyncLoadTest()
+    try:
+        tester.run()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Load test interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+bench_batch.py - Measure batched kNN throughput against one-query-per-call.
+
+For each batch size, runs the same random segment ids through:
+1. similar_segments() once per segment (one round-trip each)
+2. batch_similar_segments() in batches (one round-trip per batch)
+
+Both paths reuse a single connection so only the query shape differs.
+Results are saved to bench_results/batch_search.json.
+
+Usage:
+    python bench_batch.py
+"""
+
+import sys
+import json
+import time
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+import psycopg2
+
+from search import CONNECTION, similar_segments, batch_similar_segments
+
+# Configuration
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+NUM_QUERIES = 256
+NUM_TRIALS = 3
+K = 5
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+SAMPLE_IDS_SQL = "SELECT id FROM segment ORDER BY random() LIMIT %s"
+
+
+class BatchBenchmark:
+    def __init__(self):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.conn = psycopg2.connect(CONNECTION)
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "num_queries": NUM_QUERIES,
+            "num_trials": NUM_TRIALS,
+            "k": K,
+            "sequential": {},
+            "batched": {},
+        }
+
+    def sample_segment_ids(self) -> list:
+        """Pick random segment ids to query."""
+        with self.conn.cursor() as cursor:
+            cursor.execute(SAMPLE_IDS_SQL, (NUM_QUERIES,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def time_sequential(self, segment_ids: list) -> float:
+        """Run one query per segment. Returns elapsed seconds."""
+        start = time.perf_counter()
+        for segment_id in segment_ids:
+            similar_segments(segment_id, k=K, conn=self.conn, use_cache=False)
+        return time.perf_counter() - start
+
+    def time_batched(self, segment_ids: list, batch_size: int) -> float:
+        """Run the segments in batches. Returns elapsed seconds."""
+        start = time.perf_counter()
+        for i in range(0, len(segment_ids), batch_size):
+            batch_similar_segments(segment_ids[i:i + batch_size], k=K, conn=self.conn, use_cache=False)
+        return time.perf_counter() - start
+
+    def summarize(self, times: list) -> dict:
+        best = min(times)
+        return {
+            "times": [round(t, 4) for t in times],
+            "median_time": round(statistics.median(times), 4),
+            "queries_per_sec": round(NUM_QUERIES / best, 1),
+        }
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Batched kNN: {NUM_QUERIES} queries, {NUM_TRIALS} trials each")
+        print("=" * 60)
+        print()
+
+        segment_ids = self.sample_segment_ids()
+
+        # Warm up the buffer cache so the first configuration isn't penalized
+        batch_similar_segments(segment_ids[:8], k=K, conn=self.conn, use_cache=False)
+
+        times = [self.time_sequential(segment_ids) for _ in range(NUM_TRIALS)]
+        self.report["sequential"] = self.summarize(times)
+        print(f"  sequential      {self.report['sequential']['queries_per_sec']:8.1f} q/s")
+
+        for batch_size in BATCH_SIZES:
+            times = [self.time_batched(segment_ids, batch_size) for _ in range(NUM_TRIALS)]
+            self.report["batched"][str(batch_size)] = self.summarize(times)
+            qps = self.report["batched"][str(batch_size)]["queries_per_sec"]
+            print(f"  batch={batch_size:<4d}      {qps:8.1f} q/s")
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "batch_search.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        try:
+            self.run_tests()
+            self.save_report()
+        finally:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    benchmark = BatchBenchmark()
+    try:
+        benchmark.run()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+bench_cache.py - Load time of the columnar cache against the JSONL files.
+
+Loads every segment id and embedding into an (N, 128) float32 matrix from:
+1. the JSONL files (extracted in data/, or data/embeddings.zip)
+2. the Arrow IPC cache (memory-mapped, zero-copy batches)
+3. the same cache written as Parquet (zstd, decoded on read)
+
+and also times producing db_insert's COPY rows from the JSONL files
+(stream_segment_rows) and from the cache (cache_segment_rows), without
+a database. Results are saved to bench_results/cache_load.json.
+
+The Arrow cache is built first if data/cache has none; the Parquet copy
+is written to a temporary directory and removed afterwards.
+
+Usage:
+    python bench_cache.py
+    python bench_cache.py --from-zip    # JSONL side reads data/*.zip
+"""
+
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from zip_stream import iter_jsonl
+from arrow_cache import (
+    CACHE_DIR, DIMENSIONS, CacheNotFound, build_cache, cache_info, cache_sources,
+    embedding_matrix, scan_segments,
+)
+from db_insert import stream_documents, stream_segment_rows, cache_segment_rows
+
+# Configuration
+REPEATS = 3
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+
+def best_of(fn, repeats: int = REPEATS) -> tuple:
+    """(fastest time in seconds, result of the last run)."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def load_jsonl(source: str) -> tuple:
+    """Segment ids and an (N, 128) float32 matrix from the embedding files."""
+    ids, vectors = [], []
+    for _, record in iter_jsonl(source, "embedding*.jsonl"):
+        ids.append(record["custom_id"])
+        vectors.append(record["response"]["body"]["data"][0]["embedding"])
+    return ids, np.array(vectors, dtype=np.float32).reshape(-1, DIMENSIONS)
+
+
+def load_cache(cache_dir: Path) -> tuple:
+    """Segment ids and an (N, 128) float32 matrix from the cache."""
+    ids, blocks = [], []
+    for batch in scan_segments(cache_dir, columns=["id", "embedding"]):
+        ids.extend(batch.column("id").to_pylist())
+        blocks.append(embedding_matrix(batch))
+    return ids, np.concatenate(blocks) if blocks else np.empty((0, DIMENSIONS), np.float32)
+
+
+def scan_cache(cache_dir: Path) -> float:
+    """Touch every embedding in place (no matrix is assembled)."""
+    return float(sum(embedding_matrix(batch).sum(dtype=np.float64)
+                     for batch in scan_segments(cache_dir, columns=["embedding"])))
+
+
+class CacheBenchmark:
+    def __init__(self, origin: str = "dir"):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.raw_source, self.embeddings_source = cache_sources(origin)
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "jsonl_source": str(self.embeddings_source),
+            "repeats": REPEATS,
+            "sizes_mb": {},
+            "load": {},
+            "copy_rows": {},
+        }
+
+    def ensure_cache(self):
+        try:
+            cache_info()
+        except CacheNotFound:
+            print("🔧 Building the Arrow cache (first run)...")
+            build_cache(self.raw_source, self.embeddings_source)
+
+    def record(self, section: str, name: str, seconds: float, rows: int):
+        self.report[section][name] = {
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(rows / seconds) if seconds else None,
+        }
+        print(f"   {name:<18} {seconds:8.3f}s  {rows / seconds if seconds else 0:>12,.0f} rows/s")
+
+    def run_tests(self, parquet_dir: Path):
+        print()
+        print("=" * 60)
+        print("🧪 Columnar cache vs JSONL load time")
+        print("=" * 60)
+        print()
+
+        self.ensure_cache()
+        build_cache(self.raw_source, self.embeddings_source, out_dir=parquet_dir, fmt="parquet")
+        arrow_bytes = Path(CACHE_DIR / "segment.arrow").stat().st_size
+        self.report["sizes_mb"] = {
+            "arrow": round(arrow_bytes / 1024 ** 2, 1),
+            "parquet": round((parquet_dir / "segment.parquet").stat().st_size / 1024 ** 2, 1),
+        }
+        if Path(self.embeddings_source).is_file():
+            self.report["sizes_mb"]["jsonl_zip"] = round(Path(self.embeddings_source).stat().st_size / 1024 ** 2, 1)
+
+        print()
+        print("📊 ids + (N, 128) float32 matrix:")
+        start = time.perf_counter()
+        jsonl_ids, jsonl_matrix = load_jsonl(self.embeddings_source)
+        jsonl_seconds = time.perf_counter() - start
+        self.record("load", "jsonl", jsonl_seconds, len(jsonl_ids))
+
+        arrow_seconds, (arrow_ids, arrow_matrix) = best_of(lambda: load_cache(CACHE_DIR))
+        rows = len(arrow_ids)
+        self.record("load", "arrow", arrow_seconds, rows)
+        parquet_seconds, (parquet_ids, parquet_matrix) = best_of(lambda: load_cache(parquet_dir))
+        self.record("load", "parquet", parquet_seconds, rows)
+        scan_seconds, _ = best_of(lambda: scan_cache(CACHE_DIR))
+        self.record("load", "arrow_scan_only", scan_seconds, rows)
+
+        # The cache keeps only embeddings that have a document, in file order
+        jsonl_rows = {segment_id: i for i, segment_id in enumerate(jsonl_ids)}
+        order = [jsonl_rows[segment_id] for segment_id in arrow_ids]
+        self.report["matches_jsonl"] = bool(
+            arrow_ids == parquet_ids
+            and np.array_equal(jsonl_matrix[order], arrow_matrix)
+            and np.array_equal(arrow_matrix, parquet_matrix))
+
+        print()
+        print("📊 db_insert COPY rows (no database):")
+        _, documents = stream_documents(self.raw_source)
+        start = time.perf_counter()
+        copy_count = sum(1 for _ in stream_segment_rows(self.embeddings_source, documents, False, []))
+        self.record("copy_rows", "jsonl", time.perf_counter() - start, copy_count)
+        cache_seconds, copy_count = best_of(lambda: sum(1 for _ in cache_segment_rows(CACHE_DIR, False)))
+        self.record("copy_rows", "arrow", cache_seconds, copy_count)
+
+        self.report["segments"] = rows
+        self.report["speedup"] = {
+            "arrow_load": round(jsonl_seconds / arrow_seconds, 1),
+            "parquet_load": round(jsonl_seconds / parquet_seconds, 1),
+            "arrow_copy_rows": round(self.report["copy_rows"]["jsonl"]["seconds"] / cache_seconds, 1),
+        }
+        print()
+        print(f"⚡ Arrow loads {self.report['speedup']['arrow_load']}x faster than JSONL "
+              f"(Parquet {self.report['speedup']['parquet_load']}x); "
+              f"COPY rows {self.report['speedup']['arrow_copy_rows']}x faster")
+        print(f"{'✅' if self.report['matches_jsonl'] else '❌'} Cached embeddings "
+              f"{'match' if self.report['matches_jsonl'] else 'do NOT match'} the JSONL files")
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "cache_load.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as parquet_dir:
+            self.run_tests(Path(parquet_dir))
+        self.save_report()
+
+
+if __name__ == "__main__":
+    benchmark = CacheBenchmark("zip" if "--from-zip" in sys.argv[1:] else "dir")
+    try:
+        benchmark.run()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+bench_farthest.py - Measure exact farthest-neighbour search (Q2) speedups.
+
+Compares three ways of finding the 5 most DISSIMILAR segments:
+1. SQL:        ORDER BY distance DESC (always a sequential scan)
+2. NumPy:      blocked brute-force scan from search_numpy.py
+3. IVF bounds: IVFIndex.search_farthest(), which skips clusters that
+               provably can't contain a top-k result, and falls back to a
+               full scan when too few of them can be skipped
+
+The pruned search must return exactly the brute-force answer; any mismatch
+is reported, along with the speedup over NumPy brute force and how often
+the search fell back to a full scan. Results are saved to bench_results/farthest.json.
+
+Run `python search_numpy.py export` first. The SQL column is skipped if the
+database isn't reachable.
+
+Usage:
+    python bench_farthest.py
+"""
+
+import sys
+import json
+import time
+import statistics
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from search_numpy import NumpySearch
+from ivf_index import IVFIndex, IVF_DIR
+
+# Configuration
+Q2_SEGMENT = "267:476"
+NUM_RANDOM = 50
+NUM_SQL = 5
+K = 5
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+
+class FarthestBenchmark:
+    def __init__(self):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.backend = NumpySearch()
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "k": K,
+            "num_queries": NUM_RANDOM + 1,
+            "rows": len(self.backend),
+            "sql": None,
+            "numpy_bruteforce": {},
+            "ivf_bounds": {},
+            "mismatches": 0,
+        }
+
+    def load_index(self) -> IVFIndex:
+        if not (IVF_DIR / "meta.json").exists():
+            print("🔧 Building IVF index (first run)...")
+            IVFIndex.build(self.backend.embeddings).save(IVF_DIR)
+        return IVFIndex.load(IVF_DIR)
+
+    def time_sql(self, segment_ids: list):
+        """Time search.similar_segments(direction='desc'), or None without a database."""
+        try:
+            import search
+            search.similar_segments(segment_ids[0], k=K, direction="desc", use_cache=False)
+        except Exception as e:
+            print(f"   ⚠️  Skipping SQL timing: {e}")
+            return None
+        times = []
+        for segment_id in segment_ids[:NUM_SQL]:
+            start = time.perf_counter()
+            search.similar_segments(segment_id, k=K, direction="desc", use_cache=False)
+            times.append(time.perf_counter() - start)
+        return {"median_ms": round(statistics.median(times) * 1000, 2)}
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Farthest-neighbour search, k={K}, {len(self.backend):,} segments")
+        print("=" * 60)
+        print()
+
+        index = self.load_index()
+        rng = np.random.default_rng(0)
+        rows = [self.backend.row_of(Q2_SEGMENT)] + \
+            [int(r) for r in rng.choice(len(self.backend), NUM_RANDOM, replace=False)]
+        embeddings = self.backend.embeddings
+
+        brute_times, ivf_times, scanned, fallbacks = [], [], [], 0
+        for row in rows:
+            start = time.perf_counter()
+            (expected, _), = self.backend.topk(embeddings[row], K, largest=True, exclude=[row])
+            brute_times.append(time.perf_counter() - start)
+
+            stats = {}
+            start = time.perf_counter()
+            found, _ = index.search_farthest(embeddings[row], K, exclude=row, stats=stats)
+            ivf_times.append(time.perf_counter() - start)
+            scanned.append(stats["rows_scanned"] / len(self.backend))
+            fallbacks += stats["brute_force"]
+
+            if expected.tolist() != found.tolist():
+                self.report["mismatches"] += 1
+
+        segment_ids = [str(self.backend.segment_ids[row]) for row in rows]
+        self.report["sql"] = self.time_sql(segment_ids)
+        self.report["numpy_bruteforce"] = {"median_ms": round(statistics.median(brute_times) * 1000, 2)}
+        brute = self.report["numpy_bruteforce"]["median_ms"]
+        ivf = round(statistics.median(ivf_times) * 1000, 2)
+        self.report["ivf_bounds"] = {
+            "median_ms": ivf,
+            "speedup": round(brute / ivf, 2),
+            "mean_fraction_scanned": round(statistics.mean(scanned), 4),
+            "brute_force_share": round(fallbacks / len(rows), 4),
+        }
+
+        if self.report["sql"]:
+            print(f"  SQL seq scan      {self.report['sql']['median_ms']:9.2f} ms")
+        print(f"  NumPy brute force {brute:9.2f} ms")
+        print(f"  IVF bounds        {ivf:9.2f} ms  ({self.report['ivf_bounds']['speedup']:.2f}x, "
+              f"{self.report['ivf_bounds']['mean_fraction_scanned']:.1%} of rows scanned)")
+        print(f"  Full-scan fallback on {fallbacks}/{len(rows)} queries")
+        if self.report["mismatches"]:
+            print(f"  ❌ {self.report['mismatches']} queries differ from brute force")
+        else:
+            print("  ✓ All results identical to brute force")
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "farthest.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        self.run_tests()
+        self.save_report()
+        return 0 if self.report["mismatches"] == 0 else 1
+
+
+if __name__ == "__main__":
+    benchmark = FarthestBenchmark()
+    try:
+        sys.exit(benchmark.run())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
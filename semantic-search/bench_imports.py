@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+bench_imports.py - Import-time check for the command-line scripts.
+
+Imports each module in a fresh interpreter with `python -X importtime`, so
+nothing is cached between runs, and reports its cumulative import time.
+Fails (exit code 1) when a module
+- pulls in one of its FORBIDDEN heavy dependencies (pandas, numpy,
+  datasets, ...), which should only load inside the functions that use
+  them, or
+- takes longer than its budget in IMPORT_BUDGETS_MS (best of REPEATS runs).
+
+The dependency check is what guards against regressions; the time budgets
+are generous so that slower machines don't fail them.
+Results are saved to bench_results/import_time.json.
+
+Usage:
+    python bench_imports.py
+    python bench_imports.py search db_query   # only these modules
+"""
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+# Configuration
+REPEATS = 3
+HEAVY = ("pandas", "numpy", "datasets", "tqdm", "asyncpg")
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+# module -> (budget in ms, heavy packages it must not import)
+IMPORT_BUDGETS_MS = {
+    "utils": (250, HEAVY),
+    "db_check": (250, HEAVY),
+    "db_query": (250, HEAVY),
+    "db_build": (250, HEAVY),
+    "search": (250, HEAVY),
+    "explain": (250, HEAVY),
+    "query_cache": (250, HEAVY),
+    "search_service": (400, HEAVY),
+    # pandas and numpy load only in the steps that use them, so the
+    # streaming ingest paths start as fast as the other scripts
+    "db_insert": (250, HEAVY),
+}
+
+
+def import_profile(module: str) -> dict:
+    """
+    Import a module in a new interpreter and parse -X importtime's output.
+
+    Returns:
+    --------
+    dict
+        'ms': cumulative import time of the module itself, and
+        'packages': the top-level package of every module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    total_us, packages = None, set()
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module and not name[1:].startswith(" "):
+            total_us = int(cumulative)
+    return {"ms": round(total_us / 1000, 1) if total_us is not None else None, "packages": packages}
+
+
+def check_module(module: str) -> dict:
+    budget_ms, forbidden = IMPORT_BUDGETS_MS[module]
+    runs = [import_profile(module) for _ in range(REPEATS)]
+    best_ms = min(run["ms"] for run in runs)
+    heavy = sorted(set(forbidden) & runs[0]["packages"])
+    return {
+        "best_ms": best_ms,
+        "budget_ms": budget_ms,
+        "heavy_imports": heavy,
+        "ok": best_ms <= budget_ms and not heavy,
+    }
+
+
+def main(argv=None) -> int:
+    modules = list(argv if argv is not None else sys.argv[1:]) or list(IMPORT_BUDGETS_MS)
+    unknown = [m for m in modules if m not in IMPORT_BUDGETS_MS]
+    if unknown:
+        print(f"Unknown modules {unknown}; choose from {list(IMPORT_BUDGETS_MS)}")
+        return 1
+
+    print()
+    print("=" * 60)
+    print(f"⏱️  Import time (best of {REPEATS}, python -X importtime)")
+    print("=" * 60)
+    report = {"timestamp": datetime.now().isoformat(), "python": sys.version.split()[0], "modules": {}}
+    for module in modules:
+        try:
+            result = check_module(module)
+        except RuntimeError as e:
+            result = {"error": str(e), "ok": False}
+            print(f"   ❌ {module:<15} {e}")
+        else:
+            status = "✅" if result["ok"] else "❌"
+            print(f"   {status} {module:<15} {result['best_ms']:8.1f} ms  (budget {result['budget_ms']} ms)"
+                  + (f"  imports {', '.join(result['heavy_imports'])}" if result["heavy_imports"] else ""))
+        report["modules"][module] = result
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    report_file = RESULTS_DIR / "import_time.json"
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Results saved: {report_file}")
+    print()
+    return 0 if all(r["ok"] for r in report["modules"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
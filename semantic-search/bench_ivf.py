@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+bench_ivf.py - Recall and latency of the IVF index against exact search.
+
+Uses the Q1-Q4 query segments plus random segments. For each nprobe
+setting, compares IVFIndex.search() with the exact blocked scan in
+search_numpy.py and reports recall@k and per-query latency.
+Results are saved to bench_results/ivf.json.
+
+Run `python search_numpy.py export` first. The index is built (and saved)
+on the first run and memory-mapped on later runs.
+
+Usage:
+    python bench_ivf.py
+"""
+
+import sys
+import json
+import time
+import statistics
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from search_numpy import NumpySearch, QUERY_SEGMENTS
+from ivf_index import IVFIndex, IVF_DIR
+
+# Configuration
+NPROBES = [1, 2, 4, 8, 16, 32, 64, 128]
+NUM_RANDOM = 100
+K = 5
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class IVFBenchmark:
+    def __init__(self):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.backend = NumpySearch()
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "k": K,
+            "num_random": NUM_RANDOM,
+            "query_segments": QUERY_SEGMENTS,
+            "index": {},
+            "exact": {},
+            "nprobe": {},
+        }
+
+    def load_index(self) -> IVFIndex:
+        """Load the saved index, building it first if needed."""
+        if not (IVF_DIR / "meta.json").exists():
+            print("🔧 Building IVF index (first run)...")
+            IVFIndex.build(self.backend.embeddings).save(IVF_DIR)
+        start = time.perf_counter()
+        index = IVFIndex.load(IVF_DIR)
+        self.report["index"] = dict(index.meta, load_seconds=round(time.perf_counter() - start, 4))
+        print(f"   Loaded {index.n_lists} lists in {self.report['index']['load_seconds'] * 1000:.1f} ms")
+        return index
+
+    def query_rows(self) -> list:
+        rng = np.random.default_rng(0)
+        rows = [self.backend.row_of(segment_id) for segment_id in QUERY_SEGMENTS]
+        return rows + [int(r) for r in rng.choice(len(self.backend), NUM_RANDOM, replace=False)]
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 IVF recall/latency vs exact search (k={K})")
+        print("=" * 60)
+        print()
+
+        index = self.load_index()
+        rows = self.query_rows()
+        embeddings = self.backend.embeddings
+
+        truth = []
+        times = []
+        for row in rows:
+            start = time.perf_counter()
+            (found, _), = self.backend.topk(embeddings[row], K, exclude=[row])
+            times.append(time.perf_counter() - start)
+            truth.append(set(found.tolist()))
+        self.report["exact"] = {
+            "p50_ms": round(percentile(times, 50) * 1000, 3),
+            "p95_ms": round(percentile(times, 95) * 1000, 3),
+        }
+        print(f"\n  {'exact':>8}  recall 1.000  p50 {self.report['exact']['p50_ms']:8.3f} ms")
+
+        for nprobe in NPROBES:
+            times = []
+            recalls = []
+            for row, expected in zip(rows, truth):
+                start = time.perf_counter()
+                found, _ = index.search(embeddings[row], K, nprobe=nprobe, exclude=row)
+                times.append(time.perf_counter() - start)
+                recalls.append(len(expected & set(found.tolist())) / K)
+            result = {
+                "recall": round(statistics.mean(recalls), 4),
+                "recall_query_segments": round(statistics.mean(recalls[:len(QUERY_SEGMENTS)]), 4),
+                "p50_ms": round(percentile(times, 50) * 1000, 3),
+                "p95_ms": round(percentile(times, 95) * 1000, 3),
+            }
+            self.report["nprobe"][str(nprobe)] = result
+            print(f"  nprobe={nprobe:<3d} recall {result['recall']:.3f}  p50 {result['p50_ms']:8.3f} ms"
+                  f"  (Q1-Q4 recall {result['recall_query_segments']:.3f})")
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "ivf.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        self.run_tests()
+        self.save_report()
+
+
+if __name__ == "__main__":
+    benchmark = IVFBenchmark()
+    try:
+        benchmark.run()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+bench_queries.py - Query latency across vector index configurations.
+
+For each index configuration in db_build.INDEX_CONFIGS (no index, HNSW,
+IVFFlat, halfvec HNSW), rebuilds the index and times:
+- the Q1-Q6 query shapes from db_query.py (through search.py)
+- similar-segment queries for randomly chosen segments
+
+Each workload runs ITERATIONS times with a warm cache and COLD_ITERATIONS
+times cold (a new connection per query, and the tables' shared buffers
+evicted first when pg_buffercache_evict() is available - PostgreSQL 17+.
+The OS page cache can't be dropped from here, so "cold" means "not in
+shared_buffers"). Reports p50/p95/p99 latency and serial QPS.
+
+Results are saved to bench_results/query_latency.json. Run with
+--save-baseline to store them as the baseline; later runs flag any
+workload whose p95 is more than REGRESSION_TOLERANCE slower than it.
+
+The index configurations are rebuilt in place, so run this against a
+database you don't mind re-indexing. The last configuration in the list
+is left in place afterwards.
+
+Usage:
+    python bench_queries.py
+    python bench_queries.py --configs none,hnsw --iterations 50
+    python bench_queries.py --save-baseline
+"""
+
+import sys
+import json
+import time
+import random
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+import psycopg2
+
+import search
+from db_build import INDEX_CONFIGS, apply_index_config
+from search_numpy import QUERY_SEGMENTS, QUERY_PODCAST
+
+# Configuration
+CONFIGS = ["none", "ivfflat", "halfvec_hnsw", "hnsw"]
+ITERATIONS = 20
+COLD_ITERATIONS = 5
+NUM_RANDOM = ITERATIONS
+K = 5
+REGRESSION_TOLERANCE = 0.25     # p95 may be up to 25% slower than baseline...
+REGRESSION_MIN_MS = 1.0         # ...or 1 ms, whichever is larger
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+BASELINE_FILE = RESULTS_DIR / "query_latency_baseline.json"
+
+SAMPLE_IDS_SQL = "SELECT id FROM segment ORDER BY random() LIMIT %s"
+
+HAS_EVICT_SQL = "SELECT to_regproc('pg_buffercache_evict') IS NOT NULL"
+
+EVICT_SQL = """
+SELECT count(pg_buffercache_evict(b.bufferid))
+FROM pg_buffercache b
+WHERE b.reldatabase = (SELECT oid FROM pg_database WHERE datname = current_database())
+  AND b.relfilenode IN (
+      SELECT pg_relation_filenode(c.oid)
+      FROM pg_class c
+      WHERE c.oid IN ('segment'::regclass, 'podcast'::regclass)
+         OR c.oid IN (SELECT indexrelid FROM pg_index
+                      WHERE indrelid IN ('segment'::regclass, 'podcast'::regclass))
+  )
+"""
+
+INDEX_SIZE_SQL = "SELECT coalesce(sum(pg_relation_size(indexrelid)), 0)::bigint FROM pg_index WHERE indrelid = 'segment'::regclass"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def segment_search(config: str):
+    """The similar_segments() call that can use `config`'s index."""
+    if config == "halfvec_hnsw":
+        # The halfvec index only serves queries ordered by the halfvec cast
+        return lambda segment_id, conn: search.similar_segments(
+            segment_id, K, conn=conn, use_cache=False, mode="rerank", ann="halfvec")
+    return lambda segment_id, conn: search.similar_segments(segment_id, K, conn=conn, use_cache=False)
+
+
+class QueryLatencyBenchmark:
+    def __init__(self, configs: list = CONFIGS, iterations: int = ITERATIONS, save_baseline: bool = False):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.configs = configs
+        self.iterations = iterations
+        self.save_baseline = save_baseline
+        self.conn = psycopg2.connect(search.CONNECTION)
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "iterations": iterations,
+            "cold_iterations": COLD_ITERATIONS,
+            "k": K,
+            "cold_method": None,
+            "configs": {},
+            "regressions": [],
+        }
+
+    def workloads(self, config: str, random_ids: list) -> dict:
+        """Workload name -> function(iteration, conn) running one query."""
+        segments = segment_search(config)
+        q1, q3, q4 = QUERY_SEGMENTS
+        return {
+            "Q1": lambda i, conn: segments(q1, conn),
+            "Q2": lambda i, conn: search.similar_segments(q1, K, "desc", conn=conn, use_cache=False),
+            "Q3": lambda i, conn: segments(q3, conn),
+            "Q4": lambda i, conn: segments(q4, conn),
+            "Q5": lambda i, conn: search.similar_episodes_to_segment(
+                QUERY_SEGMENTS[i % len(QUERY_SEGMENTS)], K, conn=conn, use_cache=False),
+            "Q6": lambda i, conn: search.similar_episodes(QUERY_PODCAST, K, conn=conn, use_cache=False),
+            "random": lambda i, conn: segments(random_ids[i % len(random_ids)], conn),
+        }
+
+    def evict(self) -> None:
+        if self.report["cold_method"] == "evict_shared_buffers":
+            with self.conn.cursor() as cursor:
+                cursor.execute(EVICT_SQL)
+                cursor.fetchone()
+
+    def summarize(self, latencies: list) -> dict:
+        return {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+            "qps": round(len(latencies) / sum(latencies), 1),
+        }
+
+    def time_warm(self, query) -> dict:
+        query(0, self.conn)  # warm-up, not timed
+        latencies = []
+        for i in range(self.iterations):
+            start = time.perf_counter()
+            query(i, self.conn)
+            latencies.append(time.perf_counter() - start)
+        return self.summarize(latencies)
+
+    def time_cold(self, query) -> dict:
+        latencies = []
+        for i in range(COLD_ITERATIONS):
+            self.evict()
+            start = time.perf_counter()
+            conn = psycopg2.connect(search.CONNECTION)
+            try:
+                query(i, conn)
+            finally:
+                conn.close()
+            latencies.append(time.perf_counter() - start)
+        return self.summarize(latencies)
+
+    def apply_config(self, config: str) -> dict:
+        """Build the config's index. Returns build info, or the skip reason."""
+        start = time.perf_counter()
+        try:
+            with self.conn.cursor() as cursor:
+                apply_index_config(cursor, config)
+                cursor.execute(INDEX_SIZE_SQL)
+                index_bytes = cursor.fetchone()[0]
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            return {"skipped": str(e).strip().splitlines()[0]}
+        return {
+            "build_seconds": round(time.perf_counter() - start, 2),
+            "index_mb": round(index_bytes / 1e6, 1),
+        }
+
+    def run_config(self, config: str, random_ids: list):
+        print(f"\n🔧 {config}: building index...")
+        result = self.apply_config(config)
+        self.report["configs"][config] = result
+        if "skipped" in result:
+            print(f"   ⚠️  Skipped: {result['skipped']}")
+            return
+        print(f"   Built in {result['build_seconds']} s ({result['index_mb']} MB of indexes on segment)")
+
+        result["warm"], result["cold"] = {}, {}
+        for name, query in self.workloads(config, random_ids).items():
+            warm = result["warm"][name] = self.time_warm(query)
+            cold = result["cold"][name] = self.time_cold(query)
+            print(f"   {name:<7} warm p50 {warm['p50_ms']:9.2f}  p95 {warm['p95_ms']:9.2f}  "
+                  f"p99 {warm['p99_ms']:9.2f} ms  {warm['qps']:8.1f} q/s | cold p50 {cold['p50_ms']:9.2f} ms")
+
+    def compare_baseline(self):
+        """Flag workloads whose p95 got slower than the stored baseline."""
+        if not BASELINE_FILE.exists():
+            print("   No baseline yet (run with --save-baseline to store one)")
+            return
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        for config, result in self.report["configs"].items():
+            base = baseline.get("configs", {}).get(config, {})
+            for phase in ("warm", "cold"):
+                for name, stats in result.get(phase, {}).items():
+                    before = base.get(phase, {}).get(name)
+                    if not before:
+                        continue
+                    allowed = max(before["p95_ms"] * (1 + REGRESSION_TOLERANCE), before["p95_ms"] + REGRESSION_MIN_MS)
+                    if stats["p95_ms"] > allowed:
+                        self.report["regressions"].append({
+                            "config": config, "phase": phase, "workload": name,
+                            "baseline_p95_ms": before["p95_ms"], "p95_ms": stats["p95_ms"],
+                        })
+        if self.report["regressions"]:
+            print(f"   ❌ {len(self.report['regressions'])} regressions against {BASELINE_FILE.name}:")
+            for r in self.report["regressions"]:
+                print(f"      {r['config']}/{r['phase']}/{r['workload']}: "
+                      f"p95 {r['baseline_p95_ms']} -> {r['p95_ms']} ms")
+        else:
+            print(f"   ✓ No regressions against {BASELINE_FILE.name}")
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Query latency: {', '.join(self.configs)} "
+              f"({self.iterations} warm / {COLD_ITERATIONS} cold iterations)")
+        print("=" * 60)
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(HAS_EVICT_SQL)
+            has_evict = cursor.fetchone()[0]
+            cursor.execute(SAMPLE_IDS_SQL, (max(NUM_RANDOM, self.iterations),))
+            random_ids = [row[0] for row in cursor.fetchall()]
+        self.conn.commit()
+        self.report["cold_method"] = "evict_shared_buffers" if has_evict else "new_connection"
+        if not has_evict:
+            print("   ⚠️  pg_buffercache_evict() not available: cold runs only use a fresh connection")
+        random.shuffle(random_ids)
+
+        for config in self.configs:
+            self.run_config(config, random_ids)
+        print()
+        self.compare_baseline()
+        print()
+
+    def save_report(self):
+        """Save full report as JSON (and as the baseline if asked)."""
+        report_file = self.results_dir / "query_latency.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        if self.save_baseline:
+            with open(BASELINE_FILE, 'w') as f:
+                json.dump(self.report, f, indent=2)
+            print(f"📁 Baseline saved: {BASELINE_FILE}")
+        print()
+
+    def run(self) -> int:
+        try:
+            self.run_tests()
+            self.save_report()
+        finally:
+            self.conn.close()
+        return 1 if self.report["regressions"] else 0
+
+
+def parse_args(argv: list) -> dict:
+    args = {"configs": CONFIGS, "iterations": ITERATIONS, "save_baseline": False}
+    argv = list(argv)
+    while argv:
+        flag = argv.pop(0)
+        if flag == "--save-baseline":
+            args["save_baseline"] = True
+        elif flag == "--configs" and argv:
+            args["configs"] = argv.pop(0).split(",")
+        elif flag == "--iterations" and argv:
+            args["iterations"] = int(argv.pop(0))
+        else:
+            raise SystemExit(__doc__)
+    unknown = [c for c in args["configs"] if c not in INDEX_CONFIGS]
+    if unknown:
+        raise SystemExit(f"Unknown index configs {unknown}; choose from {list(INDEX_CONFIGS)}")
+    return args
+
+
+if __name__ == "__main__":
+    benchmark = QueryLatencyBenchmark(**parse_args(sys.argv[1:]))
+    try:
+        sys.exit(benchmark.run())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+bench_service.py - Load test the HTTP search service, batched vs. per-request.
+
+Sends NUM_REQUESTS random /segments/<id> requests to search_service.py from
+N client threads at once, for each N in CONCURRENCY_LEVELS, twice: once
+through the micro-batcher and once with ?batch=0 (one SQL query per
+request, the baseline). Each client thread keeps one keep-alive
+connection. Reports requests/s, p50/p95/p99 latency and the mean batch
+size the server formed.
+
+By default a service is started in a subprocess with --no-cache, so repeated
+ids don't turn into cache hits. Pass --url to load test a running one.
+Results are saved to bench_results/service_load.json.
+
+Usage:
+    python bench_service.py
+    python bench_service.py --url http://127.0.0.1:8452 --requests 2000
+"""
+
+import sys
+import json
+import time
+import random
+import statistics
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from search import CONNECTION
+
+# Configuration
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+NUM_REQUESTS = 1000
+K = 5
+PORT = 8453
+STARTUP_TIMEOUT = 30
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+SAMPLE_IDS_SQL = "SELECT id FROM segment ORDER BY random() LIMIT %s"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ServiceLoadTest:
+    def __init__(self, url: str = None, num_requests: int = NUM_REQUESTS):
+        self.results_dir = RESULTS_DIR
+        self.results_dir.mkdir(exist_ok=True)
+        self.url = url
+        self.num_requests = num_requests
+        self.process = None
+        self.local = threading.local()
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "url": url,
+            "num_requests": num_requests,
+            "k": K,
+            "levels": {},
+        }
+
+    # -------------------------------------------------------------------------
+    # Service and client plumbing
+    # -------------------------------------------------------------------------
+    def start_service(self):
+        """Start search_service.py in a subprocess and wait until it answers."""
+        script = Path(__file__).parent / "search_service.py"
+        self.process = subprocess.Popen(
+            [sys.executable, str(script), "--port", str(PORT), "--no-cache"],
+            stdout=subprocess.DEVNULL,
+        )
+        self.url = f"http://127.0.0.1:{PORT}"
+        self.report["url"] = self.url
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("search_service.py exited during startup")
+            try:
+                self.get("/health")
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"search_service.py did not answer within {STARTUP_TIMEOUT}s")
+
+    def stop_service(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def get(self, path: str) -> dict:
+        """GET a path over this thread's keep-alive connection."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            address = urlsplit(self.url)
+            conn = self.local.conn = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            body = json.loads(response.read())
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status} {body.get('error')}")
+        return body
+
+    # -------------------------------------------------------------------------
+    # Load levels
+    # -------------------------------------------------------------------------
+    def run_level(self, concurrency: int, segment_ids: list, batch: bool) -> dict:
+        """Send every request with `concurrency` client threads."""
+        suffix = f"?k={K}" + ("" if batch else "&batch=0")
+
+        def one(segment_id):
+            start = time.perf_counter()
+            self.get(f"/segments/{segment_id}{suffix}")
+            return time.perf_counter() - start
+
+        before = self.get("/stats")["batching"]
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            start = time.perf_counter()
+            latencies = list(clients.map(one, segment_ids))
+            elapsed = time.perf_counter() - start
+        after = self.get("/stats")["batching"]
+
+        batches = after["batches"] - before["batches"]
+        return {
+            "elapsed": round(elapsed, 3),
+            "requests_per_sec": round(len(segment_ids) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+            "mean_batch": round((after["requests"] - before["requests"]) / batches, 2) if batches else None,
+        }
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Search service load test: {self.num_requests} requests per level")
+        print("=" * 60)
+
+        conn = psycopg2.connect(CONNECTION)
+        with conn.cursor() as cursor:
+            cursor.execute(SAMPLE_IDS_SQL, (self.num_requests,))
+            segment_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        # Reuse ids if the table is small, so every level sends the same load
+        segment_ids = [segment_ids[i % len(segment_ids)] for i in range(self.num_requests)]
+        random.shuffle(segment_ids)
+
+        if self.url is None:
+            print("   Starting search_service.py --no-cache ...")
+            self.start_service()
+        print(f"   Target: {self.url}")
+        print()
+
+        print(f"  {'concurrency':>11}  {'mode':<8}  {'req/s':>8}  {'p50 ms':>8}  {'p95 ms':>8}  "
+              f"{'p99 ms':>8}  {'batch':>6}")
+        for concurrency in CONCURRENCY_LEVELS:
+            level = self.report["levels"][str(concurrency)] = {}
+            for mode, batch in (("single", False), ("batched", True)):
+                result = level[mode] = self.run_level(concurrency, segment_ids, batch)
+                mean_batch = f"{result['mean_batch']:.1f}" if batch and result["mean_batch"] else "-"
+                print(f"  {concurrency:>11}  {mode:<8}  {result['requests_per_sec']:>8.1f}  "
+                      f"{result['p50_ms']:>8.2f}  {result['p95_ms']:>8.2f}  {result['p99_ms']:>8.2f}  "
+                      f"{mean_batch:>6}")
+            level["speedup"] = round(level["batched"]["requests_per_sec"] / level["single"]["requests_per_sec"], 2)
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.results_dir / "service_load.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Results saved: {report_file}")
+        print()
+
+    def run(self):
+        try:
+            self.run_tests()
+            self.save_report()
+        finally:
+            self.stop_service()
+
+
+def parse_args(argv: list) -> dict:
+    args = {"url": None, "num_requests": NUM_REQUESTS}
+    argv = list(argv)
+    while argv:
+        flag = argv.pop(0)
+        if flag == "--url" and argv:
+            args["url"] = argv.pop(0).rstrip("/")
+        elif flag == "--requests" and argv:
+            args["num_requests"] = int(argv.pop(0))
+        else:
+            raise SystemExit(__doc__)
+    return args
+
+
+if __name__ == "__main__":
+    tester = ServiceLoadTest(**parse_args(sys.argv[1:]))
+    try:
+        tester.run()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Load test interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -12,7 +12,7 @@ Usage:
 """
 
 import psycopg2
-from utils import get_connection_string
+from utils import get_connection_string, CREATE_GENERATION_TABLE
 
 # Get database connection
 CONNECTION = get_connection_string()
@@ -29,7 +29,7 @@ CREATE_EXTENSION = "CREATE EXTENSION IF NOT EXISTS vector"
 # HELPER: Drop tables if you want to start over
 # =============================================================================
 # Run drop_tables() if you need to reset your database and try again
-DROP_TABLES = "DROP TABLE IF EXISTS segment, podcast CASCADE"
+DROP_TABLES = "DROP TABLE IF EXISTS segment_window, segment, podcast CASCADE"
 
 def drop_tables():
     """Drop all tables to start fresh. Useful when debugging."""
@@ -89,6 +89,131 @@ CREATE_SEGMENT_TABLE = """
 """
 
 
+# =============================================================================
+# OPTIONAL: Indexes for filtered search
+# =============================================================================
+# search.filtered_similar_segments() restricts results by podcast and time.
+# These b-tree indexes let the pre-filter and per-podcast strategies read
+# only the matching rows, and give the planner the statistics it uses to
+# estimate how selective a filter is.
+#
+# segment_position_idx orders each episode's segments by position (the "115"
+# in "89:115"), so the context window around a search hit is one range scan.
+CREATE_FILTER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS segment_podcast_id_idx ON segment (podcast_id)",
+    "CREATE INDEX IF NOT EXISTS segment_start_time_idx ON segment (start_time)",
+    "CREATE INDEX IF NOT EXISTS segment_position_idx ON segment (podcast_id, (split_part(id, ':', 2)::int))",
+]
+
+def create_filter_indexes(cursor):
+    """Create the filtered-search and context-window indexes, if the segment table exists yet."""
+    cursor.execute("SELECT to_regclass('segment')")
+    if cursor.fetchone()[0] is None:
+        return
+    print("  → Creating filtered-search indexes...")
+    for statement in CREATE_FILTER_INDEXES:
+        cursor.execute(statement)
+
+
+# =============================================================================
+# OPTIONAL: Sliding-window table
+# =============================================================================
+# Whisper segments are only a few seconds long. segment_window groups runs of
+# consecutive segments into windows with an averaged embedding and the joined
+# text, so a coarse search has several times fewer rows to look at (see
+# search.similar_segments(mode="window")). db_insert.build_segment_windows()
+# fills it; segment_ids maps each window back to its segments, in order.
+CREATE_WINDOW_TABLE = """
+CREATE TABLE IF NOT EXISTS segment_window (
+    id TEXT PRIMARY KEY,
+    podcast_id TEXT NOT NULL REFERENCES podcast(id),
+    start_time FLOAT NOT NULL,
+    end_time FLOAT NOT NULL,
+    content TEXT NOT NULL,
+    embedding VECTOR(128) NOT NULL,
+    segment_ids TEXT[] NOT NULL
+)
+"""
+
+CREATE_WINDOW_INDEX = (
+    "CREATE INDEX IF NOT EXISTS segment_window_embedding_hnsw ON segment_window "
+    "USING hnsw (embedding vector_l2_ops)"
+)
+
+
+# =============================================================================
+# OPTIONAL: Vector index configurations
+# =============================================================================
+# Alternative ways to index segment.embedding, compared by bench_queries.py.
+# Only one is meant to be active at a time: apply_index_config() drops the
+# others first. {lists} is filled in from the table size (rows / 1000, the
+# pgvector recommendation for IVFFlat up to ~1M rows).
+#
+# halfvec_hnsw indexes a 16-bit copy of each vector (pgvector >= 0.7). Queries
+# only use it when they order by the same expression - see
+# search.similar_segments(mode="rerank", ann="halfvec").
+#
+# hnsw_ip is an inner-product index. On embeddings normalized at ingest
+# (db_insert.NORMALIZE_EMBEDDINGS) it serves metric='cosine' searches.
+#
+# hnsw_canonical and hnsw_ip_canonical are partial indexes that leave out
+# the near-duplicates marked by dedup.py (they need the canonical_id column).
+# They only serve similar_segments(dedup=True), whose WHERE clause implies
+# their predicate.
+INDEX_CONFIGS = {
+    "none": [],
+    "hnsw": [
+        "CREATE INDEX segment_embedding_hnsw ON segment "
+        "USING hnsw (embedding vector_l2_ops)",
+    ],
+    "ivfflat": [
+        "CREATE INDEX segment_embedding_ivfflat ON segment "
+        "USING ivfflat (embedding vector_l2_ops) WITH (lists = {lists})",
+    ],
+    "halfvec_hnsw": [
+        "CREATE INDEX segment_embedding_halfvec_hnsw ON segment "
+        "USING hnsw ((embedding::halfvec(128)) halfvec_l2_ops)",
+    ],
+    "hnsw_ip": [
+        "CREATE INDEX segment_embedding_hnsw_ip ON segment "
+        "USING hnsw (embedding vector_ip_ops)",
+    ],
+    "hnsw_canonical": [
+        "CREATE INDEX segment_embedding_hnsw_canonical ON segment "
+        "USING hnsw (embedding vector_l2_ops) WHERE canonical_id IS NULL",
+    ],
+    "hnsw_ip_canonical": [
+        "CREATE INDEX segment_embedding_hnsw_ip_canonical ON segment "
+        "USING hnsw (embedding vector_ip_ops) WHERE canonical_id IS NULL",
+    ],
+}
+
+VECTOR_INDEX_NAMES = [
+    "segment_embedding_hnsw",
+    "segment_embedding_ivfflat",
+    "segment_embedding_halfvec_hnsw",
+    "segment_embedding_hnsw_ip",
+    "segment_embedding_hnsw_canonical",
+    "segment_embedding_hnsw_ip_canonical",
+]
+
+def apply_index_config(cursor, name: str):
+    """
+    Replace whichever INDEX_CONFIGS index is present with config `name`.
+
+    Indexes created some other way are left alone.
+    """
+    if name not in INDEX_CONFIGS:
+        raise ValueError(f"Unknown index config {name!r}; choose from {list(INDEX_CONFIGS)}")
+    for index_name in VECTOR_INDEX_NAMES:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    cursor.execute("SELECT count(*) FROM segment")
+    lists = max(1, cursor.fetchone()[0] // 1000)
+    for statement in INDEX_CONFIGS[name]:
+        cursor.execute(statement.format(lists=lists))
+    cursor.execute("ANALYZE segment")
+
+
 # =============================================================================
 # STEP 4: Execute the SQL statements
 # =============================================================================
@@ -110,6 +235,12 @@ def main():
     # print("  → Creating segment table...")
     # cursor.execute(CREATE_SEGMENT_TABLE)
     
+    create_filter_indexes(cursor)
+    
+    # Load counter that search.py's result cache checks (see utils.py)
+    print("  → Creating ingest_generation table...")
+    cursor.execute(CREATE_GENERATION_TABLE)
+    
     conn.commit()
     cursor.close()
     conn.close()
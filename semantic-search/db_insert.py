@@ -12,16 +12,40 @@ Run this script AFTER db_build.py has created the tables.
 
 Usage:
     python db_insert.py
+    python db_insert.py --normalize   # normalize embeddings already loaded
+    python db_insert.py --windows     # (re)build the segment_window table
+    python db_insert.py --from-zip    # stream data/*.zip, no extracted files needed
+    python db_insert.py --from-url    # stream the archives from GitHub straight into COPY
+    python db_insert.py --from-cache  # load the Arrow/Parquet cache (arrow_cache.py build)
+    python db_insert.py --profile     # time + peak memory per stage
+    python db_insert.py --profile --cprofile   # ...and cProfile the slowest
 """
 
+import io
 import os
+import math
+import sys
 import json
 import glob
-import pandas as pd
-from tqdm import tqdm
-from datasets import load_dataset
+import time
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
 
-from utils import get_connection_string, fast_pg_insert, vector_to_pg_format
+import psycopg2
+
+import metrics
+
+from utils import (
+    get_connection_string, fast_pg_insert, copy_rows, vector_to_pg_format,
+    normalize_embeddings, stream_query, bump_generation,
+)
+from zip_stream import iter_jsonl
+
+# pandas, tqdm, dedup (numpy), search and db_build are imported inside the
+# functions that use them, so the streaming paths (--from-zip, --from-url,
+# --from-cache) and arrow_cache.py don't load them (see bench_imports.py)
 
 # Get database connection
 CONNECTION = get_connection_string()
@@ -29,6 +53,24 @@ CONNECTION = get_connection_string()
 # Path to the data directory (download using download_data.sh first)
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 
+# Store unit-length embeddings plus their original length (embedding_norm).
+# Cosine search then reduces to an inner product (<#>) and can use an
+# inner-product index; search.py rebuilds exact L2 from the stored norms.
+NORMALIZE_EMBEDDINGS = False
+
+# Mark near-duplicate segments after loading (see dedup.py), so searches can
+# skip them with similar_segments(dedup=True).
+DEDUP_SEGMENTS = False
+
+# Build the segment_window table after loading (see build_segment_windows).
+BUILD_WINDOWS = False
+
+# Record wall time, CPU time and peak memory per stage (see stage()), and
+# optionally a cProfile of the slowest one. Set by --profile / --cprofile.
+PROFILE_STAGES = False
+PROFILE_CPROFILE = False
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "bench_results")
+
 
 # =============================================================================
 # REFERENCE: Sample data structures
@@ -180,6 +222,7 @@ def load_documents():
 
 def prepare_dataframes(documents, embeddings):
     """Prepare DataFrames for podcast and segment tables."""
+    import pandas as pd
     
     # TODO: Create podcast_df with unique podcasts
     podcast_df = None
@@ -201,6 +244,7 @@ def prepare_dataframes(documents, embeddings):
 
 def insert_data(podcast_df, segment_df):
     """Insert data into the database."""
+    from tqdm import tqdm
     
     # TODO: Insert podcast data
     # fast_pg_insert(podcast_df, CONNECTION, 'podcast', ['id', 'title'])
@@ -213,36 +257,489 @@ def insert_data(podcast_df, segment_df):
     # for i in tqdm(range(0, len(segment_df), 10000)):
     #     chunk = segment_df.iloc[i:i+10000]
     #     fast_pg_insert(chunk, CONNECTION, 'segment', [...])
+    #
+    # With NORMALIZE_EMBEDDINGS on, segment_df also has an 'embedding_norm'
+    # column (see normalize_segment_df) - add it to the column list.
     
     pass
 
 
+# =============================================================================
+# OPTIONAL: L2-normalized embeddings
+# =============================================================================
+# search.py treats the table as normalized when the embedding_norm column
+# exists, so every row must have its norm filled in once it does.
+ADD_NORM_COLUMN = "ALTER TABLE segment ADD COLUMN IF NOT EXISTS embedding_norm REAL"
+
+MISSING_NORMS = "SELECT count(*) FROM segment WHERE embedding_norm IS NULL"
+
+NORMALIZE_SELECT = "SELECT id, embedding::real[] AS embedding FROM segment WHERE embedding_norm IS NULL"
+
+NORMALIZE_UPDATE = """
+UPDATE segment s
+SET embedding = n.embedding, embedding_norm = n.embedding_norm
+FROM normalized n
+WHERE s.id = n.id
+"""
+
+
+def add_norm_column():
+    """Add the embedding_norm column to the segment table."""
+    conn = psycopg2.connect(CONNECTION)
+    with conn.cursor() as cursor:
+        cursor.execute(ADD_NORM_COLUMN)
+    conn.commit()
+    conn.close()
+
+
+def normalize_segment_df(segment_df):
+    """
+    Replace segment_df's embeddings with unit vectors and add an
+    'embedding_norm' column holding their original lengths.
+
+    Call this before insert_data() and include 'embedding_norm' in the
+    column list passed to fast_pg_insert.
+    """
+    unit, norms = normalize_embeddings(segment_df["embedding"].tolist())
+    segment_df = segment_df.copy()
+    segment_df["embedding"] = list(unit)
+    segment_df["embedding_norm"] = norms
+    return segment_df
+
+
+def normalize_loaded_embeddings(batch_size: int = 10000):
+    """
+    Normalize embeddings that are already in the database, in place.
+
+    Rows are streamed out, normalized with NumPy, copied back into a
+    temporary table and applied with a single UPDATE, all in one
+    transaction. Rows that already have a norm are skipped.
+
+    Every updated row is re-inserted into any vector index, so run this
+    before building one (or drop it first and rebuild afterwards).
+    """
+    import pandas as pd
+    print("📐 Normalizing loaded embeddings...")
+    conn = psycopg2.connect(CONNECTION)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(ADD_NORM_COLUMN)
+            cursor.execute(
+                "CREATE TEMP TABLE normalized (id TEXT PRIMARY KEY, embedding vector(128), embedding_norm REAL) "
+                "ON COMMIT DROP"
+            )
+            total = 0
+            for block in stream_query(NORMALIZE_SELECT, batch_size=batch_size, numpy=True, conn=conn):
+                unit, norms = normalize_embeddings(block["embedding"])
+                df = pd.DataFrame({
+                    "id": block["id"],
+                    "embedding": [vector_to_pg_format(v) for v in unit],
+                    "embedding_norm": norms,
+                })
+                buffer = io.StringIO()
+                df.to_csv(buffer, sep=";", index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_from(buffer, "normalized", sep=";", columns=list(df.columns))
+                total += len(df)
+                print(f"\r   {total:,} segments", end="", flush=True)
+            print()
+            cursor.execute(NORMALIZE_UPDATE)
+            bump_generation(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Normalized {total:,} embeddings")
+
+
+def check_norms():
+    """Warn if the table is marked normalized but some rows have no norm."""
+    conn = psycopg2.connect(CONNECTION)
+    with conn.cursor() as cursor:
+        cursor.execute(MISSING_NORMS)
+        missing = cursor.fetchone()[0]
+    conn.close()
+    if missing:
+        print(f"⚠️  {missing:,} segments have no embedding_norm - was it in the fast_pg_insert column list?")
+        print("   Run `python db_insert.py --normalize` to fix them.")
+
+
+# =============================================================================
+# OPTIONAL: Sliding windows of segments
+# =============================================================================
+# Windows cover WINDOW_SIZE consecutive segments of an episode (or seconds,
+# with WINDOW_UNIT = "seconds") and start every WINDOW_STRIDE; a stride
+# smaller than the size makes them overlap. Each window is computed in the
+# database: pgvector's avg() over the member embeddings and the member texts
+# joined in order.
+WINDOW_UNIT = "segments"
+WINDOW_SIZE = 8
+WINDOW_STRIDE = 8
+
+# What WINDOW_SIZE and WINDOW_STRIDE count in
+WINDOW_KEYS = {
+    "segments": "split_part(id, ':', 2)::int",
+    "seconds": "start_time",
+}
+
+# Every segment joins the ceil(size / stride) windows that can contain it;
+# generate_series() supplies how many strides back each one starts.
+# Identical windows (possible around gaps) are only stored once.
+INSERT_WINDOWS = """
+INSERT INTO segment_window (id, podcast_id, start_time, end_time, content, embedding, segment_ids)
+SELECT DISTINCT ON (id) *
+FROM (
+    SELECT split_part(min(s.id), ':', 1) || ':' || min(s.position) || '-' || max(s.position) AS id,
+           s.podcast_id,
+           min(s.start_time),
+           max(s.end_time),
+           string_agg(s.content, ' ' ORDER BY s.position),
+           avg(s.embedding),
+           array_agg(s.id ORDER BY s.position)
+    FROM (
+        SELECT id, podcast_id, start_time, end_time, content, {embedding} AS embedding,
+               split_part(id, ':', 2)::int AS position, {key} AS key
+        FROM segment
+    ) s
+    CROSS JOIN generate_series(0, %(back)s) AS o(back)
+    WHERE floor(s.key / %(stride)s) - o.back >= 0
+      AND s.key < (floor(s.key / %(stride)s) - o.back) * %(stride)s + %(size)s
+    GROUP BY s.podcast_id, floor(s.key / %(stride)s) - o.back
+) windows
+"""
+
+
+def build_segment_windows(unit: str = WINDOW_UNIT, size: float = WINDOW_SIZE, stride: float = WINDOW_STRIDE):
+    """
+    Rebuild the segment_window table from the segment table.
+
+    Windows average the original (unnormalized) embeddings. The HNSW index
+    is dropped while the rows go in and rebuilt afterwards, which is much
+    faster than inserting into it; everything happens in one transaction.
+    """
+    from db_build import CREATE_WINDOW_TABLE, CREATE_WINDOW_INDEX
+    from search import ORIGINAL_EMBEDDING, embeddings_normalized
+    if unit not in WINDOW_KEYS:
+        raise ValueError(f"unit must be one of {tuple(WINDOW_KEYS)}, got {unit!r}")
+    print(f"🪟 Building {size}-{unit} windows every {stride} {unit}...")
+    conn = psycopg2.connect(CONNECTION)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_WINDOW_TABLE)
+            cursor.execute("DROP INDEX IF EXISTS segment_window_embedding_hnsw")
+            cursor.execute("TRUNCATE segment_window")
+            sql = INSERT_WINDOWS.format(embedding=ORIGINAL_EMBEDDING[embeddings_normalized(conn)],
+                                        key=WINDOW_KEYS[unit])
+            cursor.execute(sql, {"size": size, "stride": stride, "back": math.ceil(size / stride) - 1})
+            windows = cursor.rowcount
+            cursor.execute(CREATE_WINDOW_INDEX)
+            cursor.execute("ANALYZE segment_window")
+            cursor.execute("SELECT count(*) FROM segment")
+            segments = cursor.fetchone()[0]
+            bump_generation(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ {windows:,} windows over {segments:,} segments "
+          f"({segments / max(windows, 1):.1f}x fewer rows to search)")
+
+
+# =============================================================================
+# OPTIONAL: Stream straight from the zip archives
+# =============================================================================
+# Instead of STEP 1-5 on extracted files: read the JSONL members out of
+# raw_data.zip and embeddings.zip as they are inflated (see zip_stream.py)
+# and COPY segments while the embeddings archive is still being read -
+# from disk (--from-zip, after `download_data.py --no-extract`) or straight
+# from the download (--from-url). Only the documents (the small archive)
+# are held in memory, to join each embedding with its text.
+SEGMENT_COLUMNS = ["id", "start_time", "end_time", "content", "embedding", "podcast_id"]
+
+
+def stream_sources(origin: str) -> tuple:
+    """(raw_data, embeddings) sources for --from-zip ("zip") or --from-url ("url")."""
+    if origin == "url":
+        from download_data import FILES  # pulls in requests
+        urls = {filename: url for filename, url, _ in FILES}
+        return urls["raw_data.zip"], urls["embeddings.zip"]
+    return os.path.join(DATA_DIR, "raw_data.zip"), os.path.join(DATA_DIR, "embeddings.zip")
+
+
+def stream_documents(source: str) -> tuple:
+    """
+    Read every batch_request record from a source.
+
+    Returns:
+    --------
+    (dict, dict)
+        podcast_id -> title, and segment id -> (start_time, end_time,
+        content, podcast_id).
+    """
+    podcasts, documents = {}, {}
+    for _, record in iter_jsonl(source, "batch_request*.jsonl"):
+        body = record["body"]
+        metadata = body["metadata"]
+        podcasts[metadata["podcast_id"]] = metadata["title"]
+        documents[record["custom_id"]] = (metadata["start_time"], metadata["stop_time"],
+                                          body["input"], metadata["podcast_id"])
+    print(f"📄 Loaded {len(documents):,} documents from {len(podcasts):,} podcasts")
+    return podcasts, documents
+
+
+def stream_segment_rows(source: str, documents: dict, normalize: bool, missing: list):
+    """
+    Yield one segment row per embedding record, in SEGMENT_COLUMNS order
+    (plus embedding_norm when normalizing). Ids without a document are
+    appended to `missing` and skipped.
+
+    Numbers are kept as their JSON text, so a vector that isn't normalized
+    goes to COPY without a round trip through float and back.
+    """
+    for _, record in iter_jsonl(source, "*.jsonl", parse_float=str):
+        segment_id = record["custom_id"]
+        document = documents.get(segment_id)
+        if document is None:
+            missing.append(segment_id)
+            continue
+        start_time, end_time, content, podcast_id = document
+        vector = record["response"]["body"]["data"][0]["embedding"]
+        if not normalize:
+            yield segment_id, start_time, end_time, content, "[" + ",".join(map(str, vector)) + "]", podcast_id
+            continue
+        vector = [float(x) for x in vector]
+        norm = math.sqrt(sum(x * x for x in vector))
+        unit = [x / norm for x in vector] if norm else vector
+        yield segment_id, start_time, end_time, content, vector_to_pg_format(unit), podcast_id, norm
+
+
+def stream_insert(raw_source: str, embeddings_source: str):
+    """Load podcasts and segments from (zipped or remote) JSONL with COPY."""
+    print(f"📦 Streaming {raw_source}")
+    podcasts, documents = stream_documents(raw_source)
+    copy_rows(podcasts.items(), CONNECTION, "podcast", ["id", "title"])
+
+    print(f"📦 Streaming {embeddings_source}")
+    columns = SEGMENT_COLUMNS + (["embedding_norm"] if NORMALIZE_EMBEDDINGS else [])
+    if NORMALIZE_EMBEDDINGS:
+        add_norm_column()
+    missing = []
+    copy_rows(stream_segment_rows(embeddings_source, documents, NORMALIZE_EMBEDDINGS, missing),
+              CONNECTION, "segment", columns)
+    if missing:
+        print(f"⚠️  {len(missing):,} embeddings had no document (e.g. {missing[0]}) and were skipped")
+
+
+# =============================================================================
+# OPTIONAL: Load from the columnar cache
+# =============================================================================
+# After `python arrow_cache.py build` the joined dataset is on disk as
+# Arrow (or Parquet) with float32 embeddings, so --from-cache skips the
+# JSON parsing entirely: batches are memory-mapped, normalized with NumPy
+# if needed, and only formatted as text for COPY.
+
+# 9 significant digits are enough to round-trip any float32
+VECTOR_FORMAT = "[" + ",".join(["%.9g"] * 128) + "]"
+
+
+def cache_segment_rows(cache_dir, normalize: bool):
+    """Segment rows, like stream_segment_rows(), from the Arrow/Parquet cache."""
+    from arrow_cache import scan_segments, embedding_matrix  # needs pyarrow
+    for batch in scan_segments(cache_dir):
+        vectors = embedding_matrix(batch)
+        norms = None
+        if normalize:
+            vectors, norms = normalize_embeddings(vectors)
+        texts = [VECTOR_FORMAT % tuple(vector) for vector in vectors.tolist()]
+        columns = [batch.column(name).to_pylist() for name in ("id", "start_time", "end_time", "content")]
+        podcast_ids = batch.column("podcast_id").to_pylist()
+        if norms is None:
+            yield from zip(*columns, texts, podcast_ids)
+        else:
+            yield from zip(*columns, texts, podcast_ids, norms.tolist())
+
+
+def cache_insert(cache_dir=None):
+    """
+    Load podcasts and segments from the arrow_cache.py cache with COPY.
+
+    Raises arrow_cache.StaleCache if the files the cache was built from
+    have changed since (e.g. a download_data.py sync), rather than loading
+    outdated rows. So does a cache with no recorded source fingerprint.
+    """
+    from arrow_cache import CACHE_DIR, StaleCache, check_cache, load_podcasts
+    cache_dir = cache_dir or CACHE_DIR
+    problems = check_cache(cache_dir)
+    if problems:
+        raise StaleCache(f"The cache in {cache_dir} is out of date ({'; '.join(problems[:3])}"
+                         f"{'; ...' if len(problems) > 3 else ''}); rebuild it with `python arrow_cache.py build`")
+    print(f"🗃️  Loading from cache {cache_dir}")
+    copy_rows(load_podcasts(cache_dir).items(), CONNECTION, "podcast", ["id", "title"])
+
+    columns = SEGMENT_COLUMNS + (["embedding_norm"] if NORMALIZE_EMBEDDINGS else [])
+    if NORMALIZE_EMBEDDINGS:
+        add_norm_column()
+    rows = copy_rows(cache_segment_rows(cache_dir, NORMALIZE_EMBEDDINGS), CONNECTION, "segment", columns)
+    print(f"✅ Loaded {rows:,} segments from the cache")
+
+
+# =============================================================================
+# OPTIONAL: Per-stage profiling
+# =============================================================================
+# Every stage of main() runs inside stage(), which always feeds the
+# ingest_stage_seconds metric (metrics.py). With PROFILE_STAGES on it also
+# records, per stage:
+#   wall_s    elapsed time
+#   cpu_s     CPU time of this process (wall_s - cpu_s is mostly waiting on
+#             the database or the disk)
+#   peak_mb   tracemalloc peak of Python allocations (numpy and pandas
+#             buffers included) above what was allocated when the stage began
+# tracemalloc slows allocation-heavy code down, and cProfile slows down
+# every function call, so compare stages with each other, not with an
+# unprofiled run.
+STAGE_PROFILES = {}  # stage name -> {"wall_s", "cpu_s", "peak_mb"}
+_STAGE_PROFILERS = {}  # stage name -> cProfile.Profile (PROFILE_CPROFILE only)
+
+
+@contextmanager
+def stage(name: str):
+    """Time one ingest stage (and profile it with PROFILE_STAGES on)."""
+    with metrics.timer("ingest_stage_seconds", stage=name):
+        if not PROFILE_STAGES:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile() if PROFILE_CPROFILE else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                _STAGE_PROFILERS[name] = profiler
+            STAGE_PROFILES[name] = {
+                "wall_s": round(time.perf_counter() - wall, 3),
+                "cpu_s": round(time.process_time() - cpu, 3),
+                "peak_mb": round((tracemalloc.get_traced_memory()[1] - baseline) / 1e6, 1),
+            }
+
+
+def report_profile(top: int = 15) -> dict:
+    """
+    Print the per-stage table and save it to bench_results/ingest_profile.json.
+
+    With PROFILE_CPROFILE on, the slowest stage's profile is also written to
+    bench_results/ingest_<stage>.prof (open it with snakeviz, or turn it
+    into a flame graph with flameprof) and its `top` functions by
+    cumulative time are printed.
+    """
+    if not STAGE_PROFILES:
+        return {}
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    total = sum(p["wall_s"] for p in STAGE_PROFILES.values()) or 1
+    hottest = max(STAGE_PROFILES, key=lambda name: STAGE_PROFILES[name]["wall_s"])
+
+    print()
+    print(f"⏱️  {'stage':<16} {'wall s':>8} {'cpu s':>8} {'peak MB':>9} {'share':>6}")
+    for name, p in STAGE_PROFILES.items():
+        print(f"   {name:<16} {p['wall_s']:>8.2f} {p['cpu_s']:>8.2f} {p['peak_mb']:>9.1f} "
+              f"{p['wall_s'] / total:>6.0%}")
+
+    report = {"stages": STAGE_PROFILES, "hottest": hottest, "cprofile": None}
+    if hottest in _STAGE_PROFILERS:
+        prof_file = os.path.join(PROFILE_DIR, f"ingest_{hottest}.prof")
+        _STAGE_PROFILERS[hottest].dump_stats(prof_file)
+        report["cprofile"] = prof_file
+        print()
+        print(f"🔥 Slowest stage: {hottest} (profile saved: {prof_file})")
+        pstats.Stats(_STAGE_PROFILERS[hottest]).sort_stats("cumulative").print_stats(top)
+
+    report_file = os.path.join(PROFILE_DIR, "ingest_profile.json")
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Results saved: {report_file}")
+    return report
+
+
 # =============================================================================
 # Main execution
 # =============================================================================
-def main():
+def main(stream_from: str = None):
+    """
+    Load everything; stream_from="zip" or "url" streams the archives
+    instead, and "cache" loads the columnar cache.
+    """
     print("📥 Loading data into database...")
     print()
     
-    # Check if data exists
-    if not os.path.exists(DATA_DIR):
-        print("❌ Data directory not found!")
-        print("   Run './download_data.sh' first to download the dataset.")
-        return
+    if stream_from == "cache":
+        with stage("cache"):
+            cache_insert()
+    elif stream_from is not None:
+        with stage("stream"):
+            stream_insert(*stream_sources(stream_from))
+    else:
+        # Check if data exists
+        if not os.path.exists(DATA_DIR):
+            print("❌ Data directory not found!")
+            print("   Run './download_data.sh' first to download the dataset.")
+            return
+        
+        # Load data
+        with stage("load_embeddings"):
+            embeddings = load_embeddings()
+        with stage("load_documents"):
+            documents = load_documents()
+        
+        # Prepare DataFrames
+        with stage("prepare"):
+            podcast_df, segment_df = prepare_dataframes(documents, embeddings)
+        
+        if NORMALIZE_EMBEDDINGS and segment_df is not None:
+            with stage("normalize"):
+                add_norm_column()
+                segment_df = normalize_segment_df(segment_df)
+        
+        # Insert into database
+        with stage("insert"):
+            insert_data(podcast_df, segment_df)
+    
+    if NORMALIZE_EMBEDDINGS:
+        check_norms()
     
-    # Load data
-    embeddings = load_embeddings()
-    documents = load_documents()
+    if DEDUP_SEGMENTS:
+        from dedup import mark_duplicates
+        with stage("dedup"):
+            stats = mark_duplicates()
+        print(f"🧹 Marked {stats['duplicates']:,} near-duplicate segments "
+              f"in {stats['clusters']:,} clusters")
     
-    # Prepare DataFrames
-    podcast_df, segment_df = prepare_dataframes(documents, embeddings)
+    if BUILD_WINDOWS:
+        with stage("windows"):
+            build_segment_windows()
     
-    # Insert into database
-    insert_data(podcast_df, segment_df)
+    if PROFILE_STAGES:
+        report_profile()
     
     print()
     print("✅ Data loading complete!")
 
 
 if __name__ == "__main__":
-    main()
+    PROFILE_CPROFILE = "--cprofile" in sys.argv[1:]
+    PROFILE_STAGES = PROFILE_CPROFILE or "--profile" in sys.argv[1:]
+    if "--normalize" in sys.argv[1:]:
+        normalize_loaded_embeddings()
+    elif "--windows" in sys.argv[1:]:
+        build_segment_windows()
+    elif "--from-zip" in sys.argv[1:]:
+        main(stream_from="zip")
+    elif "--from-url" in sys.argv[1:]:
+        main(stream_from="url")
+    elif "--from-cache" in sys.argv[1:]:
+        main(stream_from="cache")
+    else:
+        main()
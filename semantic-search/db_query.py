@@ -16,8 +16,10 @@ Run this script AFTER db_build.py and db_insert.py have been completed.
 
 Usage:
     python db_query.py
+    python db_query.py --explain   # also log EXPLAIN ANALYZE plans (see explain.py)
 """
 
+import sys
 import psycopg2
 from utils import get_connection_string
 
@@ -28,14 +30,27 @@ CONNECTION = get_connection_string()
 # =============================================================================
 # Helper function to run queries
 # =============================================================================
-def run_query(query: str, description: str):
-    """Execute a query and print the results."""
+def run_query(query: str, description: str, explain: bool = False):
+    """
+    Execute a query and print the results.
+
+    With explain=True the query is first run under EXPLAIN (ANALYZE,
+    BUFFERS), and the plan summary (timings, index usage, buffer hits and
+    reads) is printed and appended to the explain.py log.
+    """
     print(f"\n{'='*60}")
     print(f"📊 {description}")
     print('='*60)
     
     conn = psycopg2.connect(CONNECTION)
     cursor = conn.cursor()
+
+    if explain:
+        import explain as explain_log
+        plan = explain_log.explain_query(cursor, query)
+        record = explain_log.record_plan(plan, description, query)
+        print(f"\n🔍 {explain_log.format_record(record)}")
+
     cursor.execute(query)
     
     results = cursor.fetchall()
@@ -77,6 +92,11 @@ Q1_SIMILAR = """
 #
 # TODO: Same as Q1, but find the FURTHEST segments instead
 # Hint: Order by distance DESC instead of ASC
+#
+# Note: no vector index can serve ORDER BY distance DESC, so this query (and
+# search.similar_segments(direction="desc")) is always a full scan. The
+# bound-pruned farthest search only exists in-process, in
+# ivf_index.search_farthest() (search_numpy.py with an IVF index loaded).
 
 Q2_DISSIMILAR = """
 
@@ -161,58 +181,60 @@ Q6_BALAJI = """
 # =============================================================================
 # Main execution
 # =============================================================================
-def main():
+def main(explain: bool = False):
     print("🔍 Running semantic search queries...")
     
     # Q1: Similar to alien life segment
     if Q1_SIMILAR.strip():
-        run_query(Q1_SIMILAR, "Q1: 5 most similar segments to '267:476' (alien life)")
+        run_query(Q1_SIMILAR, "Q1: 5 most similar segments to '267:476' (alien life)", explain)
     else:
         print("\n⚠️  Q1: Not implemented yet")
     
     # Q2: Dissimilar to alien life segment
     if Q2_DISSIMILAR.strip():
-        run_query(Q2_DISSIMILAR, "Q2: 5 most dissimilar segments to '267:476'")
+        run_query(Q2_DISSIMILAR, "Q2: 5 most dissimilar segments to '267:476'", explain)
     else:
         print("\n⚠️  Q2: Not implemented yet")
     
     # Q3: Similar to neural network segment
     if Q3_NEURAL.strip():
-        run_query(Q3_NEURAL, "Q3: 5 most similar segments to '48:511' (neural networks)")
+        run_query(Q3_NEURAL, "Q3: 5 most similar segments to '48:511' (neural networks)", explain)
     else:
         print("\n⚠️  Q3: Not implemented yet")
     
     # Q4: Similar to dark energy segment
     if Q4_PHYSICS.strip():
-        run_query(Q4_PHYSICS, "Q4: 5 most similar segments to '51:56' (dark energy)")
+        run_query(Q4_PHYSICS, "Q4: 5 most similar segments to '51:56' (dark energy)", explain)
     else:
         print("\n⚠️  Q4: Not implemented yet")
     
     # Q5: Most similar episodes
     if Q5A_EPISODE.strip():
-        run_query(Q5A_EPISODE, "Q5a: 5 most similar episodes to segment '267:476'")
+        run_query(Q5A_EPISODE, "Q5a: 5 most similar episodes to segment '267:476'", explain)
     else:
         print("\n⚠️  Q5a: Not implemented yet")
         
     if Q5B_EPISODE.strip():
-        run_query(Q5B_EPISODE, "Q5b: 5 most similar episodes to segment '48:511'")
+        run_query(Q5B_EPISODE, "Q5b: 5 most similar episodes to segment '48:511'", explain)
     else:
         print("\n⚠️  Q5b: Not implemented yet")
         
     if Q5C_EPISODE.strip():
-        run_query(Q5C_EPISODE, "Q5c: 5 most similar episodes to segment '51:56'")
+        run_query(Q5C_EPISODE, "Q5c: 5 most similar episodes to segment '51:56'", explain)
     else:
         print("\n⚠️  Q5c: Not implemented yet")
     
     # Q6: Similar episodes to Balaji podcast
     if Q6_BALAJI.strip():
-        run_query(Q6_BALAJI, "Q6: 5 most similar episodes to 'VeH7qKZr0WI' (Balaji)")
+        run_query(Q6_BALAJI, "Q6: 5 most similar episodes to 'VeH7qKZr0WI' (Balaji)", explain)
     else:
         print("\n⚠️  Q6: Not implemented yet")
     
     print("\n" + "="*60)
     print("✅ Query execution complete!")
+    if explain:
+        print("   Plans logged - run `python explain.py summarize` to aggregate them")
 
 
 if __name__ == "__main__":
-    main()
+    main(explain="--explain" in sys.argv[1:])
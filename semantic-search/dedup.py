@@ -0,0 +1,454 @@
+"""
+dedup.py - Find near-duplicate segments and collapse them at ingest.
+
+Many segments are short fragments or filler ("Yeah.", "Right, right.") whose
+embeddings are nearly identical. They bloat the vector index and fill the
+top-k with repeats. This pass clusters them:
+
+1. Random-hyperplane LSH: each unit vector gets N_BANDS signatures of
+   BAND_BITS sign bits. Two vectors at cosine similarity s land in the same
+   bucket of a band with probability (1 - arccos(s) / pi) ** BAND_BITS, so
+   near-duplicates share at least one bucket almost always and unrelated
+   segments almost never. All-zero embeddings have no direction and are
+   left out.
+2. Every pair that shares a bucket is checked exactly; pairs with cosine
+   similarity >= SIMILARITY are merged (vectorized union-find). Buckets
+   over MAX_BUCKET rows are checked against a sample of their members so
+   memory and time stay bounded.
+3. Each cluster keeps one canonical segment (the one with the most text);
+   the others get segment.canonical_id pointing at it.
+
+Duplicates stay in the table, so ids, context windows and episode averages
+don't change. similar_segments(dedup=True) skips them, and the partial
+indexes db_build.INDEX_CONFIGS['hnsw_canonical' / 'hnsw_ip_canonical'] leave
+them out of the HNSW graph.
+
+`report` builds the full and the partial HNSW index in turn and compares
+their size, query latency and how many repeats reach the top-k. Results go
+to bench_results/dedup.json. It rebuilds vector indexes in place and leaves
+the partial one behind.
+
+Usage:
+    python dedup.py                    # find duplicates, store canonical_id
+    python dedup.py --dry-run          # only print what would be collapsed
+    python dedup.py report [n_queries]
+"""
+
+import io
+import sys
+import json
+import time
+import numpy as np
+import psycopg2
+from pathlib import Path
+from datetime import datetime
+
+import search
+import explain
+from utils import get_connection_string, stream_query, bump_generation
+from db_build import apply_index_config
+
+# Get database connection
+CONNECTION = get_connection_string()
+
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+
+SIMILARITY = 0.98   # cosine similarity at which two segments are duplicates
+N_BANDS = 20
+BAND_BITS = 24      # at most 63, so a band's signature fits in an int64
+BLOCK_ROWS = 2048
+MAX_BUCKET = 2048       # larger LSH buckets are compared against a sample this big
+MERGE_PAIRS = 1 << 22   # candidate pairs buffered before merging clusters
+NUM_QUERIES = 200
+K = 5
+
+SEGMENTS_SQL = "SELECT id, length(content) AS length, embedding FROM segment"
+
+ADD_CANONICAL_COLUMN = "ALTER TABLE segment ADD COLUMN IF NOT EXISTS canonical_id TEXT"
+
+CLEAR_CANONICAL = "UPDATE segment SET canonical_id = NULL WHERE canonical_id IS NOT NULL"
+
+SET_CANONICAL = """
+UPDATE segment s
+SET canonical_id = d.canonical_id
+FROM duplicates d
+WHERE s.id = d.id
+"""
+
+DUPLICATES_SQL = "SELECT id, canonical_id FROM segment WHERE canonical_id IS NOT NULL"
+
+SAMPLE_IDS_SQL = "SELECT id FROM segment WHERE canonical_id IS NULL ORDER BY random() LIMIT %s"
+
+INDEX_SIZE_SQL = "SELECT pg_relation_size(to_regclass(%s))"
+
+# (full index, partial index, metric) - see search.METRIC_SQL for which
+# index serves which metric on each storage layout
+REPORT_CONFIGS = {
+    False: ("hnsw", "hnsw_canonical", "l2"),
+    True: ("hnsw_ip", "hnsw_ip_canonical", "cosine"),
+}
+
+
+# =============================================================================
+# Clustering
+# =============================================================================
+def _unit(x: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (all-zero rows stay zero)."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def lsh_signatures(unit: np.ndarray, n_bands: int = N_BANDS, band_bits: int = BAND_BITS,
+                   seed: int = 0) -> np.ndarray:
+    """
+    Random-hyperplane signatures: one int64 per band per row.
+
+    Bit j of a band is set when the row lies on the positive side of that
+    band's j-th random hyperplane.
+
+    Returns:
+    --------
+    np.ndarray
+        int64 array of shape (rows, n_bands)
+    """
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((unit.shape[1], n_bands * band_bits)).astype(np.float32)
+    weights = np.int64(1) << np.arange(band_bits, dtype=np.int64)
+    signatures = np.empty((len(unit), n_bands), dtype=np.int64)
+    for start in range(0, len(unit), BLOCK_ROWS):
+        bits = (unit[start:start + BLOCK_ROWS] @ planes > 0).reshape(-1, n_bands, band_bits)
+        signatures[start:start + BLOCK_ROWS] = bits @ weights
+    return signatures
+
+
+def _roots(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Root of each node, compressing the paths of the nodes asked about."""
+    roots = parent[nodes]
+    while True:
+        up = parent[roots]
+        if np.array_equal(up, roots):
+            break
+        roots = up
+    parent[nodes] = roots
+    return roots
+
+
+def _union_pairs(parent: np.ndarray, left: np.ndarray, right: np.ndarray):
+    """
+    Merge the clusters of every (left[i], right[i]) pair, vectorized.
+
+    Each round hooks the larger root of every still-split pair under the
+    smallest root it is paired with, so a root is always the lowest index
+    of its cluster. Work is proportional to the number of pairs, not rows.
+    """
+    while len(left):
+        a, b = _roots(parent, left), _roots(parent, right)
+        split = a != b
+        left, right, a, b = left[split], right[split], a[split], b[split]
+        np.minimum.at(parent, np.maximum(a, b), np.minimum(a, b))
+
+
+def _bucket_pairs(unit: np.ndarray, members: np.ndarray, similarity: float, rng) -> tuple:
+    """
+    Candidate pairs within one bucket whose cosine similarity is high enough.
+
+    Buckets over MAX_BUCKET rows (thousands of identical fillers, say) are
+    only compared against a random sample of MAX_BUCKET of their members,
+    so the work stays linear in the bucket size. Every member close to a
+    sampled one still joins its cluster.
+    """
+    if len(members) > MAX_BUCKET:
+        pivots = np.sort(rng.choice(members, MAX_BUCKET, replace=False))
+    else:
+        pivots = members
+    lefts, rights = [], []
+    for block in range(0, len(members), BLOCK_ROWS):
+        rows = members[block:block + BLOCK_ROWS]
+        i, j = np.nonzero(unit[rows] @ unit[pivots].T >= similarity)
+        keep = pivots[j] > rows[i] if pivots is members else pivots[j] != rows[i]
+        lefts.append(rows[i[keep]])
+        rights.append(pivots[j[keep]])
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def find_duplicates(
+    unit: np.ndarray,
+    similarity: float = SIMILARITY,
+    n_bands: int = N_BANDS,
+    band_bits: int = BAND_BITS,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Cluster near-duplicate rows.
+
+    Parameters:
+    -----------
+    unit : np.ndarray
+        Unit-length embeddings, shape (rows, d). All-zero rows have no
+        direction; they are never hashed and stay in clusters of their own.
+    similarity : float
+        Rows whose cosine similarity is at least this are merged. Clusters
+        are transitive, so members of a long chain can be further apart.
+    n_bands, band_bits : int
+        LSH shape. More bits per band means fewer, tighter candidate
+        buckets; more bands means fewer near-duplicates missed.
+
+    Returns:
+    --------
+    np.ndarray
+        Cluster label per row: the index of the cluster's first row. Rows
+        with no duplicate are their own cluster.
+    """
+    parent = np.arange(len(unit))
+    rng = np.random.default_rng(seed)
+    hashed = np.flatnonzero(np.any(unit != 0, axis=1))
+    signatures = lsh_signatures(unit[hashed] if len(hashed) < len(unit) else unit, n_bands, band_bits, seed)
+    for band in range(n_bands):
+        keys = signatures[:, band]
+        local = np.argsort(keys, kind="stable")
+        order = hashed[local]
+        starts = np.flatnonzero(np.r_[True, keys[local][1:] != keys[local][:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+
+        # Buckets of two (the common case) are checked in one vectorized step
+        pairs = starts[sizes == 2]
+        left, right = order[pairs], order[pairs + 1]
+        close = np.einsum("ij,ij->i", unit[left], unit[right]) >= similarity
+        lefts, rights, pending = [left[close]], [right[close]], 0
+
+        for start, size in zip(starts[sizes > 2], sizes[sizes > 2]):
+            members = order[start:start + size]
+            # Filler lands in the same big bucket band after band; once it's merged, skip it
+            roots = _roots(parent, members)
+            if (roots == roots[0]).all():
+                continue
+            left, right = _bucket_pairs(unit, members, similarity, rng)
+            lefts.append(left)
+            rights.append(right)
+            pending += len(left)
+            if pending >= MERGE_PAIRS:
+                _union_pairs(parent, np.concatenate(lefts), np.concatenate(rights))
+                lefts, rights, pending = [], [], 0
+        if lefts:
+            _union_pairs(parent, np.concatenate(lefts), np.concatenate(rights))
+
+    return _roots(parent, np.arange(len(parent)))
+
+
+def choose_canonical(labels: np.ndarray, lengths: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    Pick each cluster's canonical row: the longest content, then lowest id.
+
+    Returns:
+    --------
+    np.ndarray
+        For every row, the index of its cluster's canonical row.
+    """
+    order = np.lexsort((ids, -lengths, labels))
+    first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    canonical_of = dict(zip(labels[order][first].tolist(), order[first].tolist()))
+    return np.array([canonical_of[label] for label in labels.tolist()])
+
+
+# =============================================================================
+# Storing canonical pointers
+# =============================================================================
+def load_segments(conn) -> tuple:
+    """Every segment's id, content length and unit-length embedding."""
+    ids, lengths, vectors = [], [], []
+    for block in stream_query(SEGMENTS_SQL, batch_size=10000, numpy=True, conn=conn):
+        ids.append(block["id"])
+        lengths.append(block["length"])
+        vectors.append(_unit(block["embedding"]))
+    if not ids:
+        return np.array([], dtype=str), np.array([], dtype=np.int64), np.zeros((0, 128), np.float32)
+    return np.concatenate(ids), np.concatenate(lengths).astype(np.int64), np.concatenate(vectors)
+
+
+def mark_duplicates(similarity: float = SIMILARITY, dry_run: bool = False) -> dict:
+    """
+    Cluster near-duplicate segments and store their canonical_id.
+
+    Earlier marks are cleared first, so re-running after new data is loaded
+    recomputes every cluster. Everything happens in one transaction.
+
+    Returns:
+    --------
+    dict
+        segments, duplicates, clusters (with 2+ members), largest cluster
+        size and elapsed seconds.
+    """
+    start = time.perf_counter()
+    conn = psycopg2.connect(CONNECTION)
+    try:
+        ids, lengths, unit = load_segments(conn)
+        labels = find_duplicates(unit, similarity)
+        canonical = choose_canonical(labels, lengths, ids)
+        duplicate = np.flatnonzero(canonical != np.arange(len(ids)))
+        cluster_sizes = np.bincount(labels, minlength=len(ids)) if len(ids) else np.array([0])
+        stats = {
+            "segments": len(ids),
+            "duplicates": len(duplicate),
+            "clusters": int((cluster_sizes > 1).sum()),
+            "largest_cluster": int(cluster_sizes.max()),
+            "similarity": similarity,
+        }
+        if not dry_run:
+            with conn.cursor() as cursor:
+                cursor.execute(ADD_CANONICAL_COLUMN)
+                cursor.execute(CLEAR_CANONICAL)
+                cursor.execute(
+                    "CREATE TEMP TABLE duplicates (id TEXT PRIMARY KEY, canonical_id TEXT) ON COMMIT DROP"
+                )
+                buffer = io.StringIO("".join(
+                    f"{ids[i]};{ids[canonical[i]]}\n" for i in duplicate
+                ))
+                cursor.copy_from(buffer, "duplicates", sep=";", columns=["id", "canonical_id"])
+                cursor.execute(SET_CANONICAL)
+                bump_generation(cursor)
+            conn.commit()
+    finally:
+        conn.close()
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+# =============================================================================
+# Size and latency report
+# =============================================================================
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _measure(conn, config: str, metric: str, dedup: bool, query_ids: list, clusters: dict) -> dict:
+    """Build one index config and time the top-k search it serves."""
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        apply_index_config(cursor, config)
+        cursor.execute(INDEX_SIZE_SQL, (f"segment_embedding_{config}",))
+        index_bytes = cursor.fetchone()[0]
+    conn.commit()
+    build_seconds = time.perf_counter() - start
+
+    sql = search.segment_neighbors_sql("asc", metric, search.embeddings_normalized(conn), dedup=dedup)
+    with conn.cursor() as cursor:
+        plan = explain.summarize_plan(explain.explain_query(cursor, sql, {"segment_id": query_ids[0], "k": K}))
+    conn.commit()
+
+    latencies, duplicates, repeats = [], 0, 0
+    for segment_id in query_ids:
+        t = time.perf_counter()
+        rows = search.similar_segments(segment_id, K, conn=conn, use_cache=False, metric=metric, dedup=dedup)
+        latencies.append(time.perf_counter() - t)
+        found = [row[1] for row in rows]
+        duplicates += sum(1 for i in found if i in clusters)
+        repeats += len(found) - len({clusters.get(i, i) for i in found})
+    return {
+        "index": f"segment_embedding_{config}",
+        "index_mb": round(index_bytes / 1e6, 1),
+        "build_seconds": round(build_seconds, 2),
+        "uses_ann_index": plan["uses_ann_index"],
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "qps": round(len(latencies) / sum(latencies), 1),
+        "duplicates_per_query": round(duplicates / len(query_ids), 3),
+        "repeats_per_query": round(repeats / len(query_ids), 3),
+    }
+
+
+def report(n_queries: int = NUM_QUERIES) -> dict:
+    """
+    Compare the full HNSW index with the partial one that skips duplicates.
+
+    `repeats_per_query` counts top-k results from a cluster that already
+    appeared higher up in the same result list.
+    """
+    conn = psycopg2.connect(CONNECTION)
+    try:
+        normalized = search.embeddings_normalized(conn)
+        full, partial, metric = REPORT_CONFIGS[normalized]
+        with conn.cursor() as cursor:
+            cursor.execute(DUPLICATES_SQL)
+            duplicates = dict(cursor.fetchall())
+            cursor.execute(SAMPLE_IDS_SQL, (n_queries,))
+            query_ids = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        # Cluster of a segment = its canonical segment (itself if canonical)
+        clusters = dict(duplicates)
+        clusters.update({c: c for c in duplicates.values()})
+
+        result = {
+            "timestamp": datetime.now().isoformat(),
+            "metric": metric,
+            "k": K,
+            "queries": len(query_ids),
+            "duplicates": len(duplicates),
+            "full": _measure(conn, full, metric, False, query_ids, clusters),
+            "dedup": _measure(conn, partial, metric, True, query_ids, clusters),
+        }
+    finally:
+        conn.close()
+
+    before, after = result["full"], result["dedup"]
+    result["savings"] = {
+        "index_mb": round(before["index_mb"] - after["index_mb"], 1),
+        "index_pct": round(100 * (1 - after["index_mb"] / before["index_mb"]), 1) if before["index_mb"] else None,
+        "p50_ms": round(before["p50_ms"] - after["p50_ms"], 3),
+        "p95_ms": round(before["p95_ms"] - after["p95_ms"], 3),
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    with open(RESULTS_DIR / "dedup.json", "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def print_report(result: dict):
+    print()
+    print("=" * 60)
+    print(f"📊 Full vs. deduplicated HNSW ({result['metric']}, {result['queries']} queries, "
+          f"{result['duplicates']:,} duplicates)")
+    print("=" * 60)
+    for name in ("full", "dedup"):
+        r = result[name]
+        print(f"   {name:<6} {r['index_mb']:8.1f} MB  p50 {r['p50_ms']:7.2f}  p95 {r['p95_ms']:7.2f} ms  "
+              f"{r['qps']:7.1f} q/s  repeats/query {r['repeats_per_query']:.2f}"
+              + ("" if r["uses_ann_index"] else "  ⚠️  index not used"))
+    s = result["savings"]
+    print(f"\n   Saved {s['index_mb']} MB of index ({s['index_pct']}%), "
+          f"p50 {s['p50_ms']} ms, p95 {s['p95_ms']} ms")
+    print(f"📁 Results saved: {RESULTS_DIR / 'dedup.json'}")
+    print()
+
+
+def main(argv=None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    if argv and argv[0] == "report":
+        print_report(report(int(argv[1]) if len(argv) > 1 else NUM_QUERIES))
+        return 0
+    if argv and argv != ["--dry-run"]:
+        print(__doc__)
+        return 1
+
+    dry_run = argv == ["--dry-run"]
+    print(f"🔍 Looking for near-duplicate segments (cosine >= {SIMILARITY})...")
+    stats = mark_duplicates(dry_run=dry_run)
+    print(f"   {stats['duplicates']:,} of {stats['segments']:,} segments are near-duplicates "
+          f"in {stats['clusters']:,} clusters (largest: {stats['largest_cluster']}), {stats['seconds']}s")
+    if dry_run:
+        print("   (dry run - nothing stored)")
+    else:
+        full, partial, _ = REPORT_CONFIGS[search.embeddings_normalized()]
+        print(f"✅ canonical_id stored. Swap the {full!r} index for the partial one with "
+              f"db_build.apply_index_config(cursor, {partial!r}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
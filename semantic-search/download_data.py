@@ -7,15 +7,49 @@ from GitHub Releases. The dataset is approximately 615MB total.
 
 Expected download time: 1-3 minutes depending on your connection.
 
+Large files are fetched over SEGMENTS parallel HTTP Range requests, each
+written straight into its place in a `<file>.part` file. Progress is saved
+next to it (`<file>.part.json`), so an interrupted download picks up where
+it stopped when the script is run again, and a dropped connection only
+retries its own segment from where it broke off. Servers that don't
+support Range requests get one ordinary streamed GET.
+
+Each file can list byte-identical MIRRORS. They are raced with a short
+ranged fetch and the fastest is used, and a segment that keeps failing on
+one mirror carries on from the same byte on the next. Only the GitHub
+release is listed today, so there is nothing to race or fail over to.
+
+If GitHub can't be reached at all, the whole dataset is fetched from Kaggle
+instead. This needs Kaggle API credentials. Kaggle serves its own repack of
+the dataset, not the same archives, so it is a whole-file fallback only:
+nothing is mixed between the two.
+
+Extracted files are listed with their sizes and hashes in
+data/manifest.json. Running the script again checks them against it and
+the archives on the server, and downloads only what is missing or changed.
+
 Usage:
     python download_data.py
+    python download_data.py --segments 8     # parallel connections per file
+    python download_data.py --no-extract     # keep the zips (db_insert.py --from-zip)
+    python download_data.py --verify         # also re-hash every local file
+    python download_data.py --mirror github  # skip the race, use this mirror
+    python download_data.py --kaggle         # fetch everything from Kaggle (needs credentials)
 """
 
 import os
+import re
 import sys
-import zipfile
+import zlib
+import json
+import time
+import hashlib
+import threading
 import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+from zip_stream import ZipStreamError, iter_members, read_central_directory
 
 # GitHub Release URLs
 RELEASE_BASE = "https://github.com/byu-cs-452/byu-cs-452-class-content/releases/download/v1.0-lex-fridman-dataset"
@@ -24,47 +58,637 @@ FILES = [
     ("embeddings.zip", f"{RELEASE_BASE}/embeddings.zip", 585),  # ~585 MB
 ]
 
+# Mirrors of each file, raced at startup (see race_mirrors). Only list
+# servers holding byte-identical copies of the archives: the first one that
+# answers is the reference, and any mirror that differs is left out.
+MIRRORS = {filename: [("github", url)] for filename, url, _ in FILES}
 
-def download_file(url: str, dest_path: Path, expected_mb: int) -> bool:
-    """Download a file with progress indicator."""
-    try:
-        response = requests.get(url, stream=True, allow_redirects=True)
+# Whole-dataset fallback (see kaggle_download). The API needs credentials
+# and serves Kaggle's own repack, so it can't be raced against GitHub.
+KAGGLE_DATASET = "michaeltreynolds/lex-fridman-text-embedding-3-large-128"
+KAGGLE_URL = f"https://www.kaggle.com/api/v1/datasets/download/{KAGGLE_DATASET}"
+
+# Download tuning
+SEGMENTS = 4                       # parallel Range requests per file
+MIN_SEGMENT_BYTES = 8 * 1024 ** 2  # smaller files use fewer segments
+CHUNK_SIZE = 1024 ** 2             # bytes read and written at a time
+READ_SIZE = 64 * 1024              # per Range read; a dropped connection loses at most this much
+RETRIES = 5                        # per segment, resuming from where it broke off
+TIMEOUT = 30                       # seconds without data before a retry
+PROGRESS_INTERVAL = 0.5            # seconds between progress lines / state saves
+PROBE_BYTES = 256 * 1024           # ranged fetch used to time each mirror
+
+CONTENT_RANGE = re.compile(r"bytes 0-0/(\d+)")
+
+
+class DownloadError(Exception):
+    """The server's answer makes the download impossible to continue."""
+
+
+# =============================================================================
+# Ranged, resumable downloads
+# =============================================================================
+def probe(session: requests.Session, url: str) -> dict:
+    """
+    Ask for the first byte to learn the size and whether Range works.
+
+    Returns:
+    --------
+    dict
+        'size' (None if unknown), 'ranges' (bool) and 'validator' (ETag or
+        Last-Modified, used to tell whether a .part file is still current).
+    """
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True,
+                     allow_redirects=True, timeout=TIMEOUT) as response:
         response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(dest_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total_size:
-                    pct = (downloaded / total_size) * 100
-                    mb = downloaded / (1024 * 1024)
-                    print(f"\r   {mb:.1f} / {expected_mb} MB ({pct:.0f}%)", end="", flush=True)
-        
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        match = CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", ""))
+        if response.status_code == 206 and match:
+            return {"size": int(match.group(1)), "ranges": True, "validator": validator}
+        length = response.headers.get("Content-Length")
+        return {"size": int(length) if length else None, "ranges": False, "validator": validator}
+
+
+class RangedDownload:
+    """
+    One file fetched over several Range requests into `<dest>.part`.
+
+    Parameters:
+    -----------
+    url : str
+        What to download. Redirects (GitHub sends one) are followed on
+        every request, so expiring signed URLs don't break resumes.
+    dest_path : Path
+        Final location; the file appears there only once complete.
+    segments : int
+        Parallel connections for a new download. A resumed download keeps
+        the segments it started with.
+    retries : int
+        Attempts per segment and mirror after a failed or dropped connection.
+    mirrors : list of str, optional
+        Other URLs serving the identical file, tried in order when a
+        segment runs out of retries on the current one.
+    fingerprint : str, optional
+        Identifies the file across mirrors (see race_mirrors). When given,
+        a .part file is resumed whichever mirror it came from.
+    """
+
+    def __init__(self, url: str, dest_path: Path, segments: int = SEGMENTS, retries: int = RETRIES,
+                 mirrors: list = None, fingerprint: str = None):
+        self.url = url
+        self.urls = [url] + list(mirrors or [])
+        self.fingerprint = fingerprint
+        self.mirror = 0           # first mirror not known to have failed
+        self.failovers = 0
+        self.bytes_by_url = {u: 0 for u in self.urls}
+        self.dest_path = Path(dest_path)
+        self.part_path = self.dest_path.with_name(self.dest_path.name + ".part")
+        self.state_path = self.dest_path.with_name(self.dest_path.name + ".part.json")
+        self.segments_wanted = max(1, segments)
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.segments = []   # [start, end, position] per segment; end is exclusive
+        self.size = None
+        self.validator = None
+        self.resumed_bytes = 0
+
+    # -------------------------------------------------------------------------
+    # State
+    # -------------------------------------------------------------------------
+    def downloaded(self) -> int:
+        with self.lock:
+            return sum(position - start for start, _, position in self.segments)
+
+    def load_state(self, info: dict) -> bool:
+        """Resume from a previous run if its .part file is for the same file."""
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return False
+        if self.fingerprint:
+            same_file = state.get("fingerprint") == self.fingerprint
+        else:
+            same_file = state.get("url") == self.url and state.get("validator") == info["validator"]
+        if (not same_file or state.get("size") != info["size"]
+                or not self.part_path.exists() or self.part_path.stat().st_size != info["size"]):
+            return False
+        self.segments = [list(segment) for segment in state["segments"]]
+        self.resumed_bytes = self.downloaded()
+        return True
+
+    def save_state(self):
+        with self.lock:
+            state = {"url": self.url, "size": self.size, "validator": self.validator,
+                     "fingerprint": self.fingerprint,
+                     "segments": [list(segment) for segment in self.segments]}
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.state_path)
+
+    def plan(self):
+        """Split a new download into segments and preallocate the .part file."""
+        count = max(1, min(self.segments_wanted, self.size // MIN_SEGMENT_BYTES))
+        bounds = [self.size * i // count for i in range(count + 1)]
+        self.segments = [[bounds[i], bounds[i + 1], bounds[i]] for i in range(count)]
+        with open(self.part_path, "wb") as f:
+            f.truncate(self.size)
+
+    # -------------------------------------------------------------------------
+    # Fetching
+    # -------------------------------------------------------------------------
+    def fetch_segment(self, index: int):
+        """Download one segment, retrying (then failing over) from its current position."""
+        session = requests.Session()
+        failures, mirror = 0, 0
+        # Unbuffered: a position is only recorded once its bytes are written
+        with open(self.part_path, "r+b", buffering=0) as f:
+            while not self.cancelled.is_set():
+                with self.lock:
+                    _, end, position = self.segments[index]
+                    if self.mirror > mirror:
+                        mirror, failures = self.mirror, 0
+                if position >= end:
+                    return
+                url = self.urls[mirror]
+                headers = {"Range": f"bytes={position}-{end - 1}"}
+                if self.validator and mirror == 0:
+                    headers["If-Range"] = self.validator
+                try:
+                    with session.get(url, headers=headers, stream=True,
+                                     allow_redirects=True, timeout=TIMEOUT) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise DownloadError(f"expected a partial response, got HTTP {response.status_code} "
+                                                "(file changed on the server?)")
+                        f.seek(position)
+                        # Small reads: a read cut off by a dropped connection is
+                        # discarded, and only bytes already written count as progress
+                        for chunk in response.iter_content(READ_SIZE):
+                            chunk = chunk[:end - position]
+                            f.write(chunk)
+                            position += len(chunk)
+                            with self.lock:
+                                self.segments[index][2] = position
+                                self.bytes_by_url[url] += len(chunk)
+                            if position >= end or self.cancelled.is_set():
+                                break
+                    if position < end and not self.cancelled.is_set():
+                        raise requests.ConnectionError(f"connection closed at byte {position:,}")
+                except requests.RequestException:
+                    failures += 1
+                    if failures <= self.retries:
+                        time.sleep(min(0.25 * 2 ** failures, 5.0))
+                    elif mirror + 1 < len(self.urls):
+                        # Carry on from the same byte on the next mirror
+                        with self.lock:
+                            if self.mirror <= mirror:
+                                self.mirror = mirror + 1
+                                self.failovers += 1
+                    else:
+                        raise
+
+    def fetch_whole(self):
+        """Plain streamed GET, for servers without Range support."""
+        with requests.get(self.url, stream=True, allow_redirects=True, timeout=TIMEOUT) as response:
+            response.raise_for_status()
+            self.segments = [[0, self.size or 0, 0]]
+            with open(self.part_path, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    with self.lock:
+                        self.segments[0][2] += len(chunk)
+                    self.print_progress()
+        if self.size is not None and self.downloaded() != self.size:
+            raise DownloadError(f"got {self.downloaded():,} of {self.size:,} bytes")
+
+    def print_progress(self):
+        mb = self.downloaded() / (1024 * 1024)
+        if self.size:
+            print(f"\r   {mb:.1f} / {self.size / (1024 * 1024):.1f} MB "
+                  f"({self.downloaded() / self.size:.0%})", end="", flush=True)
+        else:
+            print(f"\r   {mb:.1f} MB", end="", flush=True)
+
+    def run(self) -> dict:
+        """
+        Download the file and move it into place.
+
+        Returns:
+        --------
+        dict
+            'bytes', 'seconds', 'segments', 'resumed_bytes' (already on
+            disk from an earlier run), 'failovers' and 'bytes_by_url'.
+        """
+        start = time.perf_counter()
+        with requests.Session() as session:
+            info = probe(session, self.url)
+        self.size, self.validator = info["size"], info["validator"]
+
+        if not info["ranges"] or not self.size:
+            self.fetch_whole()
+        else:
+            if self.load_state(info):
+                print(f"   Resuming: {self.resumed_bytes / (1024 * 1024):.1f} MB already downloaded")
+            else:
+                self.plan()
+            self.save_state()
+            with ThreadPoolExecutor(max_workers=len(self.segments), thread_name_prefix="segment") as pool:
+                pending = {pool.submit(self.fetch_segment, i) for i in range(len(self.segments))}
+                try:
+                    while pending:
+                        done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                        self.save_state()
+                        self.print_progress()
+                        for future in done:
+                            future.result()
+                finally:
+                    self.cancelled.set()
+                    wait(pending)
+                    self.save_state()
         print()  # Newline after progress
+
+        os.replace(self.part_path, self.dest_path)
+        self.state_path.unlink(missing_ok=True)
+        return {"bytes": self.dest_path.stat().st_size, "seconds": round(time.perf_counter() - start, 3),
+                "segments": len(self.segments), "resumed_bytes": self.resumed_bytes,
+                "failovers": self.failovers, "bytes_by_url": dict(self.bytes_by_url)}
+
+
+def download_file(url: str, dest_path: Path, expected_mb: int, segments: int = SEGMENTS,
+                  retries: int = RETRIES, mirrors: list = None, fingerprint: str = None) -> bool:
+    """Download a file with progress indicator, resuming an earlier attempt."""
+    try:
+        result = RangedDownload(url, dest_path, segments, retries, mirrors, fingerprint).run()
+        if result["failovers"]:
+            print(f"   ↪️  Switched mirrors {result['failovers']} time(s) without losing progress")
         return True
-        
-    except requests.RequestException as e:
+    except (requests.RequestException, DownloadError, OSError) as e:
         print(f"\n   ❌ Download failed: {e}")
+        if Path(str(dest_path) + ".part.json").exists():
+            print("   Run the script again to resume.")
         return False
 
 
-def extract_zip(zip_path: Path, extract_to: Path) -> bool:
-    """Extract a zip file and clean up."""
+# =============================================================================
+# Mirror racing
+# =============================================================================
+def probe_mirror(name: str, url: str) -> dict:
+    """
+    Time a PROBE_BYTES ranged fetch from the end of the file.
+
+    The end of a zip archive is its central directory, so the fetched bytes
+    also serve as a fingerprint: mirrors with the same size and fingerprint
+    serve the same archive.
+    """
+    result = {"name": name, "url": url, "ok": False}
+    start = time.perf_counter()
+    try:
+        with requests.Session() as session:
+            info = probe(session, url)
+            if not info["ranges"] or not info["size"]:
+                result["error"] = "no Range support"
+                return result
+            first = max(0, info["size"] - PROBE_BYTES)
+            response = session.get(url, headers={"Range": f"bytes={first}-{info['size'] - 1}"},
+                                   allow_redirects=True, timeout=TIMEOUT)
+            response.raise_for_status()
+            if response.status_code != 206:
+                result["error"] = f"HTTP {response.status_code} to a Range request"
+                return result
+            tail = response.content
+    except requests.RequestException as e:
+        result["error"] = str(e)
+        return result
+    elapsed = time.perf_counter() - start
+    result.update(ok=True, size=info["size"], seconds=round(elapsed, 3),
+                  mb_per_s=round(len(tail) / elapsed / 1024 ** 2, 2),
+                  fingerprint=hashlib.sha256(tail).hexdigest())
+    return result
+
+
+def race_mirrors(mirrors: list) -> list:
+    """
+    Probe (name, url) mirrors at once and rank the usable ones.
+
+    Returns:
+    --------
+    list of dict
+        probe_mirror() results, fastest first, keeping only mirrors whose
+        copy matches the first mirror that answered. Empty if none did.
+    """
+    with ThreadPoolExecutor(max_workers=len(mirrors)) as pool:
+        results = list(pool.map(lambda mirror: probe_mirror(*mirror), mirrors))
+    reference = next(((r["size"], r["fingerprint"]) for r in results if r["ok"]), None)
+    usable = []
+    for r in results:
+        if not r["ok"]:
+            print(f"   ✗ {r['name']}: {r['error']}")
+        elif (r["size"], r["fingerprint"]) != reference:
+            print(f"   ✗ {r['name']}: different file ({r['size']:,} bytes), not used")
+        else:
+            print(f"   ✓ {r['name']}: {r['mb_per_s']:.1f} MB/s ({r['seconds'] * 1000:.0f} ms probe)")
+            usable.append(r)
+    return sorted(usable, key=lambda r: r["seconds"])
+
+
+# =============================================================================
+# Kaggle fallback
+# =============================================================================
+def kaggle_credentials() -> tuple:
+    """(username, key) from KAGGLE_USERNAME/KAGGLE_KEY or ~/.kaggle/kaggle.json, or None."""
+    if os.environ.get("KAGGLE_USERNAME") and os.environ.get("KAGGLE_KEY"):
+        return os.environ["KAGGLE_USERNAME"], os.environ["KAGGLE_KEY"]
+    try:
+        config = json.loads((Path.home() / ".kaggle" / "kaggle.json").read_text())
+        return config["username"], config["key"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def kaggle_download(data_dir: Path) -> bool:
+    """
+    Download and extract the whole dataset from Kaggle.
+
+    The repack is extracted as it is. db_insert.py finds the JSONL files by
+    name anywhere under data/, and any of FILES' archives inside it are
+    extracted too. The files aren't recorded in the manifest, which only
+    tracks the GitHub archives.
+    """
+    credentials = kaggle_credentials()
+    if credentials is None:
+        print("   ❌ No Kaggle credentials (set KAGGLE_USERNAME and KAGGLE_KEY, or ~/.kaggle/kaggle.json)")
+        return False
+    zip_path = data_dir / "kaggle_dataset.zip"
+    print(f"📦 Kaggle dataset {KAGGLE_DATASET}")
+    try:
+        with requests.get(KAGGLE_URL, auth=credentials, stream=True, allow_redirects=True,
+                          timeout=TIMEOUT) as response:
+            response.raise_for_status()
+            write_member(response.iter_content(CHUNK_SIZE), zip_path)
+    except (requests.RequestException, OSError) as e:
+        print(f"   ❌ Download failed: {e}")
+        return False
+    if not extract_zip(zip_path, data_dir):
+        return False
+    for filename, _, _ in FILES:
+        for nested in data_dir.rglob(filename):
+            if not extract_zip(nested, data_dir):
+                return False
+    print(f"   ✅ Done")
+    print()
+    return True
+
+
+# =============================================================================
+# Manifest and delta sync
+# =============================================================================
+# data/manifest.json records every extracted file: the archive it came from,
+# its size, and its CRC-32 and SHA-256, both computed while the file is
+# written (never by reading it back). On the next run each archive's
+# central directory is fetched with two small Range requests and compared
+# with the manifest, so only files that are missing, damaged or changed on
+# the server are downloaded - each one with its own Range request, unless
+# so much changed that fetching the whole archive is cheaper.
+MANIFEST_NAME = "manifest.json"
+FULL_ARCHIVE_SHARE = 0.5   # fetch the whole archive when more than this share changed
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {"version": 1, "archives": {}, "files": {}}
+
+
+def save_manifest(path: Path, manifest: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def member_path(data_dir: Path, name: str) -> Path:
+    """Where a member is extracted; refuses names that would escape data_dir."""
+    parts = Path(name).parts
+    if Path(name).is_absolute() or ".." in parts:
+        raise DownloadError(f"unsafe file name in archive: {name}")
+    return data_dir.joinpath(*parts)
+
+
+def _digest(chunks, sink=None) -> dict:
+    """Size, CRC-32 and SHA-256 of a stream of chunks, passing each to `sink`."""
+    sha256, crc, size = hashlib.sha256(), 0, 0
+    for chunk in chunks:
+        if sink is not None:
+            sink(chunk)
+        sha256.update(chunk)
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+    return {"size": size, "crc32": f"{crc:08x}", "sha256": sha256.hexdigest()}
+
+
+def write_member(chunks, path: Path) -> dict:
+    """Write a member's data to `path`, hashing it on the way."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        record = _digest(chunks, f.write)
+    os.replace(tmp, path)
+    return record
+
+
+def file_digest(path: Path) -> dict:
+    """The same for a file already on disk (adopting old files, --verify)."""
+    with open(path, "rb") as f:
+        return _digest(iter(lambda: f.read(CHUNK_SIZE), b""))
+
+
+def remote_members(session: requests.Session, url: str, size: int, validator: str = None) -> list:
+    """The archive's members, from its central directory (see zip_stream.py)."""
+    def read_at(start: int, length: int) -> bytes:
+        headers = {"Range": f"bytes={start}-{start + length - 1}"}
+        if validator:
+            headers["If-Range"] = validator
+        response = session.get(url, headers=headers, allow_redirects=True, timeout=TIMEOUT)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise DownloadError(f"expected a partial response, got HTTP {response.status_code}")
+        return response.content
+
+    return [entry for entry in read_central_directory(read_at, size) if not entry["name"].endswith("/")]
+
+
+def is_current(entry: dict, archive: str, data_dir: Path, files: dict, verify: bool) -> bool:
+    """Is the archive member `entry` already on disk, intact and up to date?"""
+    path = member_path(data_dir, entry["name"])
+    if not path.exists():
+        return False
+    record = files.get(entry["name"])
+    if record is None:
+        # Extracted before there was a manifest: adopt the file if it matches
+        if path.stat().st_size != entry["size"]:
+            return False
+        record = file_digest(path)
+        if record["crc32"] != f"{entry['crc32']:08x}":
+            return False
+        files[entry["name"]] = {"archive": archive, **record}
+        return True
+    if record["crc32"] != f"{entry['crc32']:08x}" or record["size"] != entry["size"]:
+        return False  # changed on the server
+    if path.stat().st_size != record["size"]:
+        return False  # truncated or overwritten locally
+    return not verify or file_digest(path)["sha256"] == record["sha256"]
+
+
+def fetch_member(urls: list, entry: dict, path: Path, validator: str = None, retries: int = RETRIES) -> dict:
+    """
+    Download one member with a Range request and write it out, moving on
+    to the next of `urls` (identical mirrors) when one keeps failing.
+    """
+    attempts = [(url, attempt) for url in urls for attempt in range(retries + 1)]
+    for url, attempt in attempts:
+        headers = {"Range": f"bytes={entry['offset']}-{entry['end'] - 1}"}
+        if validator and url == urls[0]:
+            headers["If-Range"] = validator
+        try:
+            with requests.get(url, headers=headers, stream=True, allow_redirects=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise DownloadError(f"expected a partial response, got HTTP {response.status_code}")
+                response.raw.decode_content = True
+                for _, data in iter_members(response.raw):
+                    return write_member(data, path)
+            raise DownloadError(f"{entry['name']} not found at offset {entry['offset']:,}")
+        except (requests.RequestException, ZipStreamError):
+            if (url, attempt) == attempts[-1]:
+                raise
+            if attempt < retries:
+                time.sleep(min(0.25 * 2 ** (attempt + 1), 5.0))
+
+
+def extract_zip(zip_path: Path, extract_to: Path, archive: str = None, files: dict = None,
+                names: set = None) -> bool:
+    """
+    Extract a zip file (only `names`, if given) and clean up.
+
+    Members are streamed through zip_stream.iter_members, which checks their
+    CRC-32s, and recorded in the manifest `files`.
+    """
     print(f"   Extracting...")
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
+        with open(zip_path, "rb") as f:
+            for name, data in iter_members(f, None if names is None else names.__contains__):
+                record = write_member(data, member_path(extract_to, name))
+                if files is not None:
+                    files[name] = {"archive": archive or zip_path.name, **record}
         zip_path.unlink()  # Remove zip after extraction
         return True
-    except zipfile.BadZipFile:
-        print(f"   ❌ Invalid zip file")
+    except ZipStreamError as e:
+        print(f"   ❌ Invalid zip file: {e}")
         return False
 
 
-def main():
+def sync_archive(filename: str, url: str, data_dir: Path, manifest: dict, manifest_path: Path,
+                 segments: int = SEGMENTS, verify: bool = False, mirrors: list = None,
+                 fingerprint: str = None) -> bool:
+    """
+    Bring the files from one archive up to date with the server.
+
+    `mirrors` and `fingerprint` come from race_mirrors(): downloads fail
+    over to the mirrors, in order, if `url` stops working.
+
+    Returns:
+    --------
+    bool
+        False if the files could not be brought up to date.
+    """
+    files = manifest["files"]
+    session = requests.Session()
+    try:
+        info = probe(session, url)
+        entries = (remote_members(session, url, info["size"], info["validator"])
+                   if info["ranges"] and info["size"] else None)
+    except (requests.RequestException, DownloadError, ZipStreamError) as e:
+        print(f"   ⚠️  Can't read the archive on the server: {e}")
+        local = [name for name, record in files.items() if record["archive"] == filename]
+        intact = local and all(member_path(data_dir, name).exists()
+                               and member_path(data_dir, name).stat().st_size == files[name]["size"]
+                               for name in local)
+        print(f"   {'✅ Using the' if intact else '❌ No intact'} local copy ({len(local)} files)")
+        return bool(intact)
+    manifest["archives"][filename] = {"url": url, "size": info["size"], "validator": info["validator"]}
+
+    if entries is None:
+        # No Range support: the whole archive it is
+        zip_path = data_dir / filename
+        ok = (download_file(url, zip_path, 0, segments, mirrors=mirrors, fingerprint=fingerprint)
+              and extract_zip(zip_path, data_dir, filename, files))
+        save_manifest(manifest_path, manifest)
+        return ok
+
+    # Files the archive no longer has
+    names = {entry["name"] for entry in entries}
+    for name in [name for name, record in files.items() if record["archive"] == filename and name not in names]:
+        member_path(data_dir, name).unlink(missing_ok=True)
+        del files[name]
+
+    stale = [entry for entry in entries if not is_current(entry, filename, data_dir, files, verify)]
+    stale_bytes = sum(entry["end"] - entry["offset"] for entry in stale)
+    if not stale:
+        print(f"   ✅ Up to date ({len(entries)} files{', verified' if verify else ''})")
+        save_manifest(manifest_path, manifest)
+        return True
+
+    print(f"   {len(stale)} of {len(entries)} files to fetch ({stale_bytes / (1024 * 1024):.1f} MB)")
+    if stale_bytes > FULL_ARCHIVE_SHARE * info["size"]:
+        zip_path = data_dir / filename
+        ok = (download_file(url, zip_path, 0, segments, mirrors=mirrors, fingerprint=fingerprint)
+              and extract_zip(zip_path, data_dir, filename, files, {entry["name"] for entry in stale}))
+        save_manifest(manifest_path, manifest)
+        return ok
+
+    lock = threading.Lock()
+
+    def fetch(entry: dict):
+        record = fetch_member([url] + list(mirrors or []), entry, member_path(data_dir, entry["name"]),
+                              info["validator"])
+        with lock:
+            files[entry["name"]] = {"archive": filename, **record}
+            save_manifest(manifest_path, manifest)  # keep finished files if interrupted
+        print(f"   ✓ {entry['name']}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, segments), thread_name_prefix="member") as pool:
+            for future in [pool.submit(fetch, entry) for entry in stale]:
+                future.result()
+    except (requests.RequestException, DownloadError, ZipStreamError, OSError) as e:
+        print(f"   ❌ Download failed: {e}")
+        return False
+    return True
+
+
+def parse_args(argv: list) -> dict:
+    args = {"segments": SEGMENTS, "extract": True, "verify": False, "mirror": None, "kaggle": False}
+    argv = list(argv)
+    while argv:
+        flag = argv.pop(0)
+        if flag == "--no-extract":
+            args["extract"] = False
+        elif flag == "--verify":
+            args["verify"] = True
+        elif flag == "--kaggle":
+            args["kaggle"] = True
+        elif flag == "--mirror" and argv:
+            args["mirror"] = argv.pop(0)
+        elif flag == "--segments" and argv:
+            args["segments"] = int(argv.pop(0))
+        else:
+            raise SystemExit(__doc__)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
     print()
     print("📥 Downloading Lex Fridman Podcast Embeddings")
     print("   ~615 MB total, expect 1-3 minutes")
@@ -75,8 +699,10 @@ def main():
     script_dir = Path(__file__).parent
     data_dir = script_dir / "data"
     
-    # Check if already downloaded
-    if data_dir.exists() and list(data_dir.glob("**/*.jsonl")):
+    # Check if already downloaded (extracted data is checked against the
+    # manifest and the server instead, see sync_archive)
+    zips_present = all((data_dir / filename).exists() for filename, _, _ in FILES)
+    if not args["extract"] and zips_present:
         print("✅ Data already exists!")
         print(f"   Location: {data_dir}")
         print()
@@ -86,30 +712,61 @@ def main():
     
     # Create data directory
     data_dir.mkdir(exist_ok=True)
+    manifest_path = data_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    
+    if args["kaggle"] and not args["extract"]:
+        print("❌ --kaggle can't be combined with --no-extract: Kaggle's repack isn't the same zips")
+        return 1
     
     # Download each file
-    for filename, url, expected_mb in FILES:
+    for filename, url, expected_mb in ([] if args["kaggle"] else FILES):
         print(f"📦 {filename} ({expected_mb} MB)")
-        dest_path = data_dir / filename
         
-        if not download_file(url, dest_path, expected_mb):
+        # Race the mirrors; without a usable one, try the first anyway
+        mirrors = [m for m in MIRRORS.get(filename, [("github", url)]) if args["mirror"] in (None, m[0])]
+        if not mirrors:
+            print(f"❌ Unknown mirror {args['mirror']!r}; choose from {[m[0] for m in MIRRORS[filename]]}")
             return 1
+        ranked = race_mirrors(mirrors)
+        url = ranked[0]["url"] if ranked else mirrors[0][1]
+        alternates = [r["url"] for r in ranked[1:]]
+        fingerprint = ranked[0]["fingerprint"] if ranked else None
         
-        if not extract_zip(dest_path, data_dir):
+        if args["extract"]:
+            if not sync_archive(filename, url, data_dir, manifest, manifest_path,
+                                args["segments"], args["verify"], alternates, fingerprint):
+                # GitHub is out of reach: fall back to Kaggle for everything
+                args["kaggle"] = kaggle_credentials() is not None
+                if not args["kaggle"]:
+                    return 1
+                print("   ↪️  Falling back to the Kaggle dataset")
+                break
+        elif not download_file(url, data_dir / filename, expected_mb, segments=args["segments"],
+                               mirrors=alternates, fingerprint=fingerprint):
             return 1
         
         print(f"   ✅ Done")
         print()
     
+    if args["kaggle"] and not kaggle_download(data_dir):
+        return 1
+    
     # Verify
     jsonl_count = len(list(data_dir.glob("**/*.jsonl")))
     print("=" * 50)
     print(f"✅ Download complete!")
-    print(f"   {jsonl_count} data files ready")
+    if args["extract"]:
+        print(f"   {jsonl_count} data files ready (manifest: {manifest_path})")
+    else:
+        print(f"   {len(FILES)} archives ready (not extracted)")
     print()
     print("Next steps:")
     print("   python db_build.py    # Create tables")
-    print("   python db_insert.py   # Load data")
+    if args["extract"]:
+        print("   python db_insert.py   # Load data")
+    else:
+        print("   python db_insert.py --from-zip   # Load data")
     print("   python db_query.py    # Run queries")
     
     return 0
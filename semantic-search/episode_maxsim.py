@@ -0,0 +1,387 @@
+"""
+episode_maxsim.py - Late-interaction (max-sim) episode similarity.
+
+Q5/Q6 compare episodes by their average embedding, which blurs episodes that
+cover several topics. Max-sim matches segments instead:
+
+    maxsim(A -> B) = mean over segments a in A of (max over b in B of cos(a, b))
+
+and scores a pair as the average of both directions. Done exactly, that is
+every segment against every segment (832k x 832k). This engine replaces each
+episode by a few representative segments - the medoids of a per-episode
+k-means (default) or a random sample - weighted by how many segments each
+stands for, and scores one episode against all others with blocked matrix
+multiplies over the stacked representatives. The best k * rerank episodes
+are then re-scored exactly from all of their segments:
+
+    engine = EpisodeMaxSim.build(NumpySearch())     # or EpisodeMaxSim.load()
+    engine.similar_episodes("VeH7qKZr0WI")           # [(title, distance), ...]
+
+Distances are 1 - maxsim, so smaller is closer, like Q6. Both approximate
+and exact scores are cached per episode pair, so a later query for either
+episode of a pair reuses them.
+
+Files in the engine directory:
+    reps.npy      float32 (R, d)   unit-length representatives, by episode
+    weights.npy   float64 (R,)     share of its episode each one stands for
+    offsets.npy   int64   (E + 1,) start of each episode in reps/weights
+    meta.json     build parameters
+
+Run `python search_numpy.py export` first.
+
+Usage:
+    python episode_maxsim.py build [n_reps] [cluster|sample]
+    python episode_maxsim.py VeH7qKZr0WI              # top 5, with timing
+    python episode_maxsim.py compare [n_episodes]     # recall vs exact max-sim
+"""
+
+import sys
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+
+from search_numpy import NUMPY_DIR, BLOCK_ROWS, QUERY_PODCAST, NumpySearch, _largest
+from ivf_index import minibatch_kmeans, _nearest_centroid, _sq_norms
+from query_cache import QueryCache, MISSING
+
+MAXSIM_DIR = NUMPY_DIR / "maxsim"
+N_REPS = 32
+RERANK = 4          # exactly re-score the best k * RERANK episodes
+METHODS = ("cluster", "sample")
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (all-zero rows stay zero)."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def episode_representatives(
+    vectors: np.ndarray,
+    n_reps: Optional[int],
+    method: str = "cluster",
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pick up to n_reps unit-length representative segments for one episode.
+
+    Parameters:
+    -----------
+    vectors : np.ndarray
+        The episode's segment embeddings.
+    n_reps : int or None
+        Representatives to keep. None (or an episode this small) keeps every
+        segment, which makes the score exact.
+    method : str
+        'cluster': k-means the segments and keep each cluster's medoid (the
+        member closest to its centre), weighted by cluster size.
+        'sample': a uniform random sample, equally weighted.
+
+    Returns:
+    --------
+    (np.ndarray, np.ndarray)
+        Representatives (r, d) and weights (r,) summing to 1.
+    """
+    unit = _unit(vectors)
+    n = len(unit)
+    if n_reps is None or n <= n_reps:
+        return unit, np.full(n, 1.0 / n)
+    rng = np.random.default_rng(seed)
+    if method == "sample":
+        rows = np.sort(rng.choice(n, size=n_reps, replace=False))
+        return unit[rows], np.full(n_reps, 1.0 / n_reps)
+
+    centroids = minibatch_kmeans(unit, n_reps, batch_size=min(n, 1024), n_iter=20, seed=seed)
+    labels = _nearest_centroid(unit, centroids, _sq_norms(centroids))
+    similarity = np.einsum("ij,ij->i", unit, centroids[labels])
+    # Medoid of each cluster: sort by (cluster, similarity) and take the last
+    order = np.lexsort((similarity, labels))
+    counts = np.bincount(labels, minlength=n_reps)
+    used = np.flatnonzero(counts)
+    medoids = order[np.cumsum(counts[used]) - 1]
+    return unit[medoids], counts[used] / n
+
+
+class EpisodeMaxSim:
+    """
+    Max-sim episode similarity over per-episode representatives.
+
+    Parameters:
+    -----------
+    backend : NumpySearch
+        Supplies episode titles and ids.
+    reps, weights, offsets : np.ndarray
+        Representatives stacked by episode (see episode_representatives).
+    meta : dict, optional
+        Build parameters, saved alongside the arrays.
+    block_rows : int
+        Representatives scored per matrix multiply.
+    """
+
+    def __init__(
+        self,
+        backend: NumpySearch,
+        reps: np.ndarray,
+        weights: np.ndarray,
+        offsets: np.ndarray,
+        meta: Optional[dict] = None,
+        block_rows: int = BLOCK_ROWS
+    ):
+        self.backend = backend
+        self.reps = reps
+        self.weights = weights
+        self.offsets = offsets
+        self.meta = meta or {}
+        self.block_rows = block_rows
+        self.n_episodes = len(offsets) - 1
+        # Symmetric pair scores, keyed (smaller episode, larger episode)
+        pairs = self.n_episodes * (self.n_episodes - 1) // 2 or 1
+        self.cache = QueryCache(maxsize=pairs, ttl=None)
+        self.exact_cache = QueryCache(maxsize=pairs, ttl=None)
+
+    @classmethod
+    def build(
+        cls,
+        backend: NumpySearch,
+        n_reps: Optional[int] = N_REPS,
+        method: str = "cluster",
+        seed: int = 0
+    ) -> "EpisodeMaxSim":
+        """Pick representatives for every episode. n_reps=None keeps all segments (exact)."""
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+        start = time.perf_counter()
+        reps, weights, counts = [], [], []
+        for e in range(len(backend.podcast_ids)):
+            lo, hi = backend.episode_offsets[e], backend.episode_offsets[e + 1]
+            if hi == lo:
+                counts.append(0)
+                continue
+            r, w = episode_representatives(backend.embeddings[lo:hi], n_reps, method, seed + e)
+            reps.append(r)
+            weights.append(w)
+            counts.append(len(r))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        meta = {
+            "n_reps": n_reps,
+            "method": method,
+            "seed": seed,
+            "n_rows": int(offsets[-1]),
+            "build_seconds": round(time.perf_counter() - start, 2),
+        }
+        return cls(backend, np.concatenate(reps), np.concatenate(weights), offsets, meta)
+
+    def save(self, path: Path = MAXSIM_DIR):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "reps.npy", self.reps)
+        np.save(path / "weights.npy", self.weights)
+        np.save(path / "offsets.npy", self.offsets)
+        with open(path / "meta.json", "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, backend: NumpySearch, path: Path = MAXSIM_DIR, mmap: bool = True) -> "EpisodeMaxSim":
+        path = Path(path)
+        mode = "r" if mmap else None
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        return cls(
+            backend,
+            np.load(path / "reps.npy", mmap_mode=mode),
+            np.load(path / "weights.npy"),
+            np.load(path / "offsets.npy"),
+            meta,
+        )
+
+    # -------------------------------------------------------------------------
+    # Scoring
+    # -------------------------------------------------------------------------
+    def _blocks(self):
+        """Yield (first episode, end episode) ranges of about block_rows representatives."""
+        first = 0
+        while first < self.n_episodes:
+            limit = self.offsets[first] + self.block_rows
+            end = max(first + 1, int(np.searchsorted(self.offsets, limit, side="right")) - 1)
+            end = min(end, self.n_episodes)
+            yield first, end
+            first = end
+
+    def _score_row(self, episode: int) -> np.ndarray:
+        """Symmetric max-sim of one episode against every episode (NaN if empty)."""
+        a_lo, a_hi = self.offsets[episode], self.offsets[episode + 1]
+        query = np.asarray(self.reps[a_lo:a_hi], dtype=np.float32)
+        query_weights = self.weights[a_lo:a_hi]
+        scores = np.full(self.n_episodes, np.nan)
+        if a_hi == a_lo:
+            return scores
+
+        for first, end in self._blocks():
+            lo, hi = self.offsets[first], self.offsets[end]
+            episodes = np.arange(first, end)
+            episodes = episodes[self.offsets[episodes + 1] > self.offsets[episodes]]
+            if len(episodes) == 0:
+                continue
+            starts = self.offsets[episodes] - lo
+            sims = query @ np.asarray(self.reps[lo:hi], dtype=np.float32).T
+
+            # A -> B: each query representative's best match inside each episode
+            forward = query_weights @ np.maximum.reduceat(sims, starts, axis=1)
+            # B -> A: each representative's best match in the query episode
+            backward = np.add.reduceat(sims.max(axis=0) * self.weights[lo:hi], starts)
+            scores[episodes] = (forward + backward) / 2
+        return scores
+
+    def scores(self, episode: int) -> np.ndarray:
+        """Max-sim of one episode against all, served from the pair cache when possible."""
+        keys = [(min(episode, other), max(episode, other)) for other in range(self.n_episodes)]
+        cached = [self.cache.get(key) if key[0] != key[1] else np.nan for key in keys]
+        if all(value is not MISSING for value in cached):
+            return np.array(cached, dtype=np.float64)
+
+        scores = self._score_row(episode)
+        for other, key in enumerate(keys):
+            if other != episode:
+                self.cache.put(key, float(scores[other]))
+        return scores
+
+    def _segments(self, episode: int) -> np.ndarray:
+        lo, hi = self.backend.episode_offsets[episode], self.backend.episode_offsets[episode + 1]
+        return _unit(self.backend.embeddings[lo:hi])
+
+    def exact_score(self, a: int, b: int, query: Optional[np.ndarray] = None) -> float:
+        """Exact max-sim of two episodes from all their segments, cached."""
+        key = (min(a, b), max(a, b))
+        score = self.exact_cache.get(key)
+        if score is MISSING:
+            query = self._segments(a) if query is None else query
+            other = self._segments(b)
+            score = np.nan
+            if len(query) and len(other):
+                backward = 0.0
+                # Blocked over the other episode's segments; fine for any length
+                best = np.full(len(query), -np.inf, dtype=np.float32)
+                for lo in range(0, len(other), self.block_rows):
+                    sims = query @ other[lo:lo + self.block_rows].T
+                    np.maximum(best, sims.max(axis=1), out=best)
+                    backward += float(sims.max(axis=0).sum(dtype=np.float64))
+                forward = float(best.mean(dtype=np.float64))
+                score = (forward + backward / len(other)) / 2
+            self.exact_cache.put(key, score)
+        return score
+
+    def pair_score(self, podcast_a: str, podcast_b: str, exact: bool = False) -> float:
+        """Max-sim of two episodes (1.0 = identical)."""
+        a = self.backend._podcast_row[podcast_a]
+        b = self.backend._podcast_row[podcast_b]
+        if exact:
+            return self.exact_score(a, b)
+        score = self.cache.get((min(a, b), max(a, b)))
+        if score is MISSING:
+            score = float(self.scores(a)[b])
+        return score
+
+    def similar_episodes(self, podcast_id: str, k: int = 5, direction: str = "asc", rerank: int = RERANK) -> list:
+        """
+        Max-sim version of search.similar_episodes() (Q6).
+
+        Candidates come from the representatives; the best k * rerank are
+        re-scored exactly (rerank=0 skips that and returns approximate
+        distances).
+
+        Returns:
+        --------
+        list of tuples
+            (podcast title, distance) with distance = 1 - maxsim. The query
+            episode itself is excluded.
+        """
+        episode = self.backend._podcast_row[podcast_id]
+        largest = _largest(direction)
+        distance = 1.0 - self.scores(episode)
+        distance[episode] = np.nan
+        valid = np.flatnonzero(~np.isnan(distance))
+        order = valid[np.argsort(-distance[valid] if largest else distance[valid], kind="stable")]
+
+        if rerank:
+            order = order[:k * rerank]
+            query = self._segments(episode)
+            distance = np.array([1.0 - self.exact_score(episode, e, query) for e in order])
+            ranked = np.argsort(-distance if largest else distance, kind="stable")[:k]
+            return [(self.backend.titles[order[i]], float(distance[i])) for i in ranked]
+        return [(self.backend.titles[e], float(distance[e])) for e in order[:k]]
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def load_or_build(backend: NumpySearch) -> EpisodeMaxSim:
+    if not (MAXSIM_DIR / "meta.json").exists():
+        print("🔧 Building max-sim representatives (first run)...")
+        engine = EpisodeMaxSim.build(backend)
+        engine.save(MAXSIM_DIR)
+        return engine
+    return EpisodeMaxSim.load(backend, MAXSIM_DIR)
+
+
+def compare(backend: NumpySearch, n_episodes: int = 20, k: int = 5) -> dict:
+    """Recall@k and speed of the saved engine against exact max-sim."""
+    engine = load_or_build(backend)
+    exact = EpisodeMaxSim.build(backend, n_reps=None)
+    rng = np.random.default_rng(0)
+    candidates = np.flatnonzero(np.diff(backend.episode_offsets) > 0)
+    episodes = rng.choice(candidates, size=min(n_episodes, len(candidates)), replace=False)
+
+    recalls, fast_times, exact_times = [], [], []
+    for e in episodes:
+        podcast_id = backend.podcast_ids[e]
+        start = time.perf_counter()
+        found = {title for title, _ in engine.similar_episodes(podcast_id, k)}
+        fast_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        expected = {title for title, _ in exact.similar_episodes(podcast_id, k, rerank=0)}
+        exact_times.append(time.perf_counter() - start)
+        recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+    return {
+        "recall": float(np.mean(recalls)),
+        "median_ms": float(np.median(fast_times) * 1000),
+        "exact_median_ms": float(np.median(exact_times) * 1000),
+    }
+
+
+def main(argv=None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    backend = NumpySearch()
+
+    if argv and argv[0] == "build":
+        n_reps = int(argv[1]) if len(argv) > 1 else N_REPS
+        method = argv[2] if len(argv) > 2 else "cluster"
+        print(f"🔧 Picking {n_reps} {method} representatives per episode...")
+        engine = EpisodeMaxSim.build(backend, n_reps, method)
+        engine.save(MAXSIM_DIR)
+        print(f"✅ {engine.meta['n_rows']:,} representatives in {engine.meta['build_seconds']}s, "
+              f"saved to {MAXSIM_DIR}")
+        return 0
+
+    if argv and argv[0] == "compare":
+        n_episodes = int(argv[1]) if len(argv) > 1 else 20
+        result = compare(backend, n_episodes)
+        print(f"📊 recall@5 {result['recall']:.3f}  "
+              f"{result['median_ms']:.2f} ms/query vs {result['exact_median_ms']:.1f} ms exact")
+        return 0
+
+    podcast_id = argv[0] if argv else QUERY_PODCAST
+    engine = load_or_build(backend)
+    start = time.perf_counter()
+    results = engine.similar_episodes(podcast_id)
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 Max-sim episodes closest to {podcast_id!r} ({elapsed * 1000:.1f} ms)")
+    for i, (title, distance) in enumerate(results, 1):
+        print(f"   {i}. {distance:.4f}  {title}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+explain.py - Capture EXPLAIN ANALYZE plans for queries and aggregate them.
+
+Wraps a query in EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and pulls out the
+numbers that answer "did this use my index, and what did it cost?":
+- planning and execution time
+- whether the vector (ANN) index drove the ORDER BY, which other indexes
+  were used, and which tables were sequentially scanned
+- shared buffer hits (from cache) and reads (from disk)
+
+Each plan is appended as one JSON line to a log file, so runs can be
+compared and aggregated later. db_query.py uses this for --explain:
+
+    python db_query.py --explain        # run Q1-Q6, logging every plan
+    python explain.py summarize         # per-query aggregate of the log
+
+Usage:
+    python explain.py summarize [log.jsonl]
+    python explain.py clear [log.jsonl]
+"""
+
+import sys
+import json
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+EXPLAIN_LOG = Path(__file__).parent / "bench_results" / "explain.jsonl"
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+# =============================================================================
+# Capturing plans
+# =============================================================================
+def _walk(node: dict):
+    """Yield a plan node and all of its children, depth first."""
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def summarize_plan(plan: dict) -> dict:
+    """
+    Reduce one EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) result to the
+    fields we log.
+
+    Parameters:
+    -----------
+    plan : dict
+        The first element of the JSON array EXPLAIN returns.
+
+    Returns:
+    --------
+    dict
+        Timings in milliseconds, scan types, index names and buffer counts.
+        Buffer counts come from the top plan node, which includes its
+        children.
+    """
+    root = plan["Plan"]
+    nodes = list(_walk(root))
+    index_scans = [n for n in nodes if "Index Name" in n]
+    # An index scan with an "Order By" is an ANN index producing rows in
+    # distance order; plain lookups (e.g. segment_pkey) have none
+    ann_scans = [n for n in index_scans if "Order By" in n]
+    seq_scans = [n for n in nodes if n["Node Type"] == "Seq Scan"]
+    hit = root.get("Shared Hit Blocks", 0)
+    read = root.get("Shared Read Blocks", 0)
+    return {
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "rows": root.get("Actual Rows"),
+        "total_cost": root.get("Total Cost"),
+        "uses_ann_index": bool(ann_scans),
+        "ann_indexes": sorted({n["Index Name"] for n in ann_scans}),
+        "indexes": sorted({n["Index Name"] for n in index_scans}),
+        "seq_scans": sorted({n.get("Relation Name", "?") for n in seq_scans}),
+        "shared_hit_blocks": hit,
+        "shared_read_blocks": read,
+        "hit_ratio": round(hit / (hit + read), 4) if hit + read else None,
+        "temp_blocks": root.get("Temp Read Blocks", 0) + root.get("Temp Written Blocks", 0),
+    }
+
+
+def explain_query(cursor, query: str, params=None) -> dict:
+    """
+    Run EXPLAIN ANALYZE on a query and return the raw JSON plan.
+
+    Note that ANALYZE really executes the query.
+    """
+    cursor.execute(EXPLAIN_PREFIX + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def record_plan(plan: dict, description: str, query: str, log_path: Path = EXPLAIN_LOG) -> dict:
+    """
+    Summarize a plan, append it to the JSONL log and return the record.
+
+    The full plan is kept under "plan" so it can be inspected later.
+    """
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "description": description,
+        "query": " ".join(query.split()),
+        **summarize_plan(plan),
+        "plan": plan,
+    }
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def format_record(record: dict) -> str:
+    """One-line human summary of a logged plan."""
+    scan = f"ANN index {', '.join(record['ann_indexes'])}" if record["uses_ann_index"] else "no ANN index"
+    others = sorted(set(record["indexes"]) - set(record["ann_indexes"]))
+    if others:
+        scan += f", lookups via {', '.join(others)}"
+    if record["seq_scans"]:
+        scan += f", seq scan on {', '.join(record['seq_scans'])}"
+    ratio = record["hit_ratio"]
+    return (f"plan {record['planning_ms']:.2f} ms, exec {record['execution_ms']:.2f} ms | {scan} | "
+            f"buffers hit {record['shared_hit_blocks']} read {record['shared_read_blocks']}"
+            + (f" ({ratio:.0%} cached)" if ratio is not None else ""))
+
+
+# =============================================================================
+# Aggregating the log
+# =============================================================================
+def load_log(log_path: Path = EXPLAIN_LOG) -> list:
+    """Read every record from the JSONL log."""
+    log_path = Path(log_path)
+    if not log_path.exists():
+        return []
+    with open(log_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize_log(records: list) -> dict:
+    """
+    Aggregate logged plans per query description.
+
+    Returns:
+    --------
+    dict
+        description -> runs, median/max execution and planning time,
+        fraction of runs that used an ANN index, indexes seen, and the
+        overall buffer hit ratio.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(record["description"], []).append(record)
+
+    summary = {}
+    for description, runs in groups.items():
+        execution = [r["execution_ms"] for r in runs]
+        hit = sum(r["shared_hit_blocks"] for r in runs)
+        read = sum(r["shared_read_blocks"] for r in runs)
+        summary[description] = {
+            "runs": len(runs),
+            "median_execution_ms": round(statistics.median(execution), 3),
+            "max_execution_ms": round(max(execution), 3),
+            "median_planning_ms": round(statistics.median(r["planning_ms"] for r in runs), 3),
+            "ann_fraction": round(sum(r["uses_ann_index"] for r in runs) / len(runs), 3),
+            "indexes": sorted({name for r in runs for name in r["indexes"]}),
+            "hit_ratio": round(hit / (hit + read), 4) if hit + read else None,
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    print()
+    print("=" * 60)
+    print("📊 EXPLAIN ANALYZE summary")
+    print("=" * 60)
+    if not summary:
+        print("\n   (log is empty - run `python db_query.py --explain` first)")
+    for description, s in summary.items():
+        print(f"\n{description}")
+        print(f"   runs: {s['runs']}  exec median {s['median_execution_ms']} ms, "
+              f"max {s['max_execution_ms']} ms  plan median {s['median_planning_ms']} ms")
+        print(f"   ANN index used in {s['ann_fraction']:.0%} of runs "
+              f"(indexes seen: {', '.join(s['indexes']) or 'none'})")
+        if s["hit_ratio"] is not None:
+            print(f"   buffer hit ratio: {s['hit_ratio']:.1%}")
+    print()
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def main(argv: list) -> int:
+    if not argv or argv[0] not in ("summarize", "clear"):
+        print(__doc__)
+        return 1
+    log_path = Path(argv[1]) if len(argv) > 1 else EXPLAIN_LOG
+    if argv[0] == "clear":
+        log_path.unlink(missing_ok=True)
+        print(f"🗑️  Cleared {log_path}")
+        return 0
+    print_summary(summarize_log(load_log(log_path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,445 @@
+"""
+ivf_index.py - Pure-NumPy inverted-file (IVF) index for in-process search.
+
+Brute force (search_numpy.py) scores every segment for every query. An IVF
+index clusters the embeddings with mini-batch k-means and only scores the
+segments in the `nprobe` clusters whose centroids are closest to the query:
+
+    index = IVFIndex.build(backend.embeddings, n_lists=1024)
+    index.save(IVF_DIR)
+    index = IVFIndex.load(IVF_DIR)          # memory-mapped, instant
+    rows, distances = index.search(query, k=5, nprobe=16)
+
+Each posting list is stored as one contiguous slice of a reordered copy of
+the embeddings, so probing a list is a single sequential read and one
+matrix-vector product rather than a gather of scattered rows.
+
+Files in the index directory:
+    centroids.npy   float32 (L, d)   cluster centres
+    offsets.npy     int64   (L + 1,) start of each list in `order`/`vectors`
+    order.npy       int64   (N,)     original row index of each list entry
+    vectors.npy     float32 (N, d)   embeddings in list order
+    sq_norms.npy    float32 (N,)     squared norms in list order
+    radii.npy       float64 (L,)     max distance from each centroid to its rows
+    max_norms.npy   float64 (L,)     max row norm in each list
+    meta.json       build parameters
+
+The radii and norms make exact farthest-neighbour search (Q2) cheap: see
+search_farthest().
+
+Usage:
+    python ivf_index.py build [n_lists]    # build from the NumPy export
+"""
+
+import sys
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+
+from search_numpy import NUMPY_DIR, BLOCK_ROWS, RERANK_MARGIN, NumpySearch
+
+IVF_DIR = NUMPY_DIR / "ivf"
+
+# Defaults sized for ~832k segments: ~800 rows per list
+N_LISTS = 1024
+NPROBE = 16
+# search_farthest() does a plain full scan once its bounds leave more than
+# this share of the rows in play (see bench_farthest.py)
+FARTHEST_MAX_SCAN = 0.5
+
+
+def _sq_norms(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return np.einsum("ij,ij->i", x, x)
+
+
+def _nearest_centroid(x: np.ndarray, centroids: np.ndarray, centroid_sq: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid for each row of x."""
+    # ||x||^2 is the same for every centroid, so it can be dropped
+    return np.argmin(centroid_sq - 2.0 * (x @ centroids.T), axis=1)
+
+
+def minibatch_kmeans(
+    embeddings: np.ndarray,
+    n_clusters: int,
+    batch_size: int = 8192,
+    n_iter: int = 100,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Mini-batch k-means (Sculley, 2010) over a possibly memory-mapped matrix.
+
+    Each iteration samples `batch_size` rows, assigns them to their nearest
+    centre and moves every centre towards the mean of its assigned rows with
+    a per-centre learning rate of 1 / (rows seen so far). Only the sampled
+    rows are ever read, so the full matrix never has to fit in memory.
+
+    Returns:
+    --------
+    np.ndarray
+        (n_clusters, d) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n = embeddings.shape[0]
+    init = np.sort(rng.choice(n, size=n_clusters, replace=False))
+    centroids = np.array(embeddings[init], dtype=np.float32)
+    counts = np.zeros(n_clusters, dtype=np.int64)
+
+    for _ in range(n_iter):
+        sample = np.sort(rng.choice(n, size=min(batch_size, n), replace=False))
+        batch = np.asarray(embeddings[sample], dtype=np.float32)
+        labels = _nearest_centroid(batch, centroids, _sq_norms(centroids))
+
+        # Per-centre sums of the batch: sort by label and reduce each run
+        batch_counts = np.bincount(labels, minlength=n_clusters)
+        hit = np.flatnonzero(batch_counts)
+        starts = np.concatenate([[0], np.cumsum(batch_counts[hit])[:-1]])
+        sums = np.add.reduceat(batch[np.argsort(labels, kind="stable")], starts, axis=0, dtype=np.float64)
+
+        counts[hit] += batch_counts[hit]
+        rate = (batch_counts[hit] / counts[hit])[:, None]
+        means = sums / batch_counts[hit][:, None]
+        centroids[hit] = (1.0 - rate) * centroids[hit] + rate * means
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index with contiguous posting lists.
+
+    Build with IVFIndex.build() or reload with IVFIndex.load().
+    """
+
+    def __init__(
+        self,
+        centroids,
+        offsets,
+        order,
+        vectors,
+        sq_norms,
+        meta: Optional[dict] = None,
+        radii=None,
+        max_norms=None
+    ):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroid_sq = _sq_norms(self.centroids)
+        self.offsets = offsets
+        self.order = order
+        self.vectors = vectors
+        self.sq_norms = sq_norms
+        self.meta = meta or {}
+        if radii is None or max_norms is None:
+            radii, max_norms = self._list_bounds()
+        self.radii = radii
+        self.max_norms = max_norms
+
+    def _list_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-list covering radius and largest row norm."""
+        radii = np.zeros(self.n_lists)
+        max_norms = np.zeros(self.n_lists)
+        for l in range(self.n_lists):
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if end == start:
+                continue
+            diff = np.asarray(self.vectors[start:end], dtype=np.float64) - self.centroids[l]
+            radii[l] = np.sqrt(np.einsum("ij,ij->i", diff, diff).max())
+            max_norms[l] = np.sqrt(np.asarray(self.sq_norms[start:end], dtype=np.float64).max())
+        return radii, max_norms
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    # -------------------------------------------------------------------------
+    # Build and persist
+    # -------------------------------------------------------------------------
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: int = N_LISTS,
+        batch_size: int = 8192,
+        n_iter: int = 100,
+        seed: int = 0,
+        block_rows: int = BLOCK_ROWS
+    ) -> "IVFIndex":
+        """
+        Train centroids and bucket every row into its posting list.
+        """
+        start = time.perf_counter()
+        n = embeddings.shape[0]
+        centroids = minibatch_kmeans(embeddings, n_lists, batch_size, n_iter, seed)
+        centroid_sq = _sq_norms(centroids)
+
+        labels = np.empty(n, dtype=np.int32)
+        for i in range(0, n, block_rows):
+            block = np.asarray(embeddings[i:i + block_rows], dtype=np.float32)
+            labels[i:i + block_rows] = _nearest_centroid(block, centroids, centroid_sq)
+
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))]).astype(np.int64)
+
+        vectors = np.empty(embeddings.shape, dtype=np.float32)
+        for i in range(0, n, block_rows):
+            vectors[i:i + block_rows] = embeddings[order[i:i + block_rows]]
+
+        meta = {
+            "n_lists": n_lists,
+            "n_rows": int(n),
+            "dims": int(embeddings.shape[1]),
+            "batch_size": batch_size,
+            "n_iter": n_iter,
+            "seed": seed,
+            "build_seconds": round(time.perf_counter() - start, 2),
+        }
+        return cls(centroids, offsets, order, vectors, _sq_norms(vectors), meta)
+
+    def save(self, path: Path = IVF_DIR):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "centroids.npy", self.centroids)
+        np.save(path / "offsets.npy", self.offsets)
+        np.save(path / "order.npy", self.order)
+        np.save(path / "vectors.npy", self.vectors)
+        np.save(path / "sq_norms.npy", self.sq_norms)
+        np.save(path / "radii.npy", self.radii)
+        np.save(path / "max_norms.npy", self.max_norms)
+        with open(path / "meta.json", "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: Path = IVF_DIR, mmap: bool = True) -> "IVFIndex":
+        """Reload a saved index. With mmap=True nothing large is read up front."""
+        path = Path(path)
+        mode = "r" if mmap else None
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        return cls(
+            np.load(path / "centroids.npy"),
+            np.load(path / "offsets.npy"),
+            np.load(path / "order.npy", mmap_mode=mode),
+            np.load(path / "vectors.npy", mmap_mode=mode),
+            np.load(path / "sq_norms.npy", mmap_mode=mode),
+            meta,
+            np.load(path / "radii.npy"),
+            np.load(path / "max_norms.npy"),
+        )
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """The `nprobe` lists whose centroids are closest to the query."""
+        nprobe = min(nprobe, self.n_lists)
+        scores = self.centroid_sq - 2.0 * (self.centroids @ query)
+        if nprobe == self.n_lists:
+            return np.argsort(scores)
+        return np.argpartition(scores, nprobe - 1)[:nprobe]
+
+    def search(self, query, k: int = 5, nprobe: int = NPROBE, exclude: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest rows to a query vector.
+
+        Parameters:
+        -----------
+        query : array-like
+            (d,) query vector.
+        k : int
+            Number of neighbours.
+        nprobe : int
+            Lists to scan. Higher is slower but closer to exact.
+        exclude : int
+            Original row index to leave out (e.g. the query segment).
+
+        Returns:
+        --------
+        (rows, distances)
+            Original row indices and L2 distances, nearest first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        lists = np.sort(self.probe(query, nprobe))
+
+        positions = []
+        scores = []
+        for l in lists:
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if end == start:
+                continue
+            block = np.asarray(self.vectors[start:end])
+            scores.append(self.sq_norms[start:end] - 2.0 * (block @ query))
+            positions.append(np.arange(start, end))
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        positions = np.concatenate(positions)
+        scores = np.concatenate(scores)
+        rows = np.asarray(self.order[positions])
+        if exclude >= 0:
+            keep = rows != exclude
+            positions, scores, rows = positions[keep], scores[keep], rows[keep]
+
+        take = min(k, len(scores))
+        if take < len(scores):
+            best = np.argpartition(scores, take - 1)[:take]
+        else:
+            best = np.arange(len(scores))
+        diff = np.asarray(self.vectors[positions[best]], dtype=np.float64) - query
+        dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        order = np.argsort(dist, kind="stable")
+        return rows[best][order], dist[order]
+
+    def search_farthest(
+        self,
+        query,
+        k: int = 5,
+        exclude: int = -1,
+        stats: Optional[dict] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k furthest rows from a query vector (Q2).
+
+        No ANN structure helps with ORDER BY distance DESC directly, but the
+        lists give cheap upper bounds on how far any of their rows can be:
+
+            ||q - x|| <= ||q - centroid|| + radius     (triangle inequality)
+            ||q - x|| <= ||q|| + ||x|| <= ||q|| + max_norm
+
+        Lists are scanned in decreasing order of their bound, and the scan
+        stops as soon as the next list's bound can't beat the current k-th
+        furthest distance. The answer is exact: only lists that provably
+        can't contain a top-k row are skipped.
+
+        On data whose clusters are wide compared with the gaps between them,
+        the bounds rarely rule a list out. When the lists that are still in
+        play hold more than FARTHEST_MAX_SCAN of the rows, one contiguous
+        blocked pass over every row is cheaper than gathering them list by
+        list, so the search falls back to that brute-force scan.
+
+        Parameters:
+        -----------
+        query : array-like
+            (d,) query vector.
+        k : int
+            Number of results.
+        exclude : int
+            Original row index to leave out (e.g. the query segment).
+        stats : dict, optional
+            Filled with 'lists_scanned', 'rows_scanned' and 'brute_force'
+            (whether it fell back to a full scan) if given.
+
+        Returns:
+        --------
+        (rows, distances)
+            Original row indices and L2 distances, furthest first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        q_sq = float(np.dot(query.astype(np.float64), query))
+        centroid_dist = np.sqrt(np.maximum(
+            self.centroid_sq.astype(np.float64) - 2.0 * (self.centroids @ query) + q_sq, 0.0
+        ))
+        bounds = np.minimum(centroid_dist + self.radii, np.sqrt(q_sq) + self.max_norms)
+        # Pad the bounds so float32 rounding in the scan can't wrongly prune
+        bounds = bounds * (1 + 1e-5) + 1e-5
+        keep = k + RERANK_MARGIN
+
+        # Lists in scan order; empty lists can never contribute
+        lists = np.argsort(-bounds, kind="stable")
+        lists = lists[self.offsets[lists + 1] > self.offsets[lists]]
+        sizes = self.offsets[lists + 1] - self.offsets[lists]
+        brute_force = False
+
+        best_pos = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        kth = -np.inf
+        scanned = 0
+        rows_scanned = 0
+        batch = 1
+        while scanned < len(lists) and bounds[lists[scanned]] >= kth:
+            # Pruning isn't paying off: scan everything in one contiguous pass
+            in_play = sizes[scanned:][bounds[lists[scanned:]] >= kth].sum()
+            if scanned and rows_scanned + in_play > FARTHEST_MAX_SCAN * len(self):
+                best_pos, best_scores = self._farthest_scan(query, q_sq, keep, exclude)
+                rows_scanned += len(self)
+                scanned, brute_force = len(lists), True
+                break
+            # Scan a growing batch of lists per matrix multiply: the first
+            # list seeds a k-th distance cheaply, later batches amortize the
+            # per-call overhead. Every list in the batch must still pass.
+            stop = scanned + 1
+            while stop < len(lists) and stop - scanned < batch and bounds[lists[stop]] >= kth:
+                stop += 1
+            positions = np.concatenate([
+                np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists[scanned:stop]
+            ])
+            block = np.asarray(self.vectors[positions])
+            scores = self.sq_norms[positions] - 2.0 * (block @ query) + q_sq
+            if exclude >= 0:
+                mask = np.asarray(self.order[positions]) != exclude
+                positions, scores = positions[mask], scores[mask]
+            rows_scanned += len(block)
+            scanned = stop
+            batch *= 2
+
+            best_pos = np.concatenate([best_pos, positions])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > keep:
+                top = np.argpartition(-best_scores, keep - 1)[:keep]
+                best_pos, best_scores = best_pos[top], best_scores[top]
+            if len(best_scores) >= k:
+                kth_score = -np.partition(-best_scores, k - 1)[k - 1]
+                kth = np.sqrt(max(kth_score, 0.0))
+
+        if stats is not None:
+            stats["lists_scanned"] = int(scanned)
+            stats["rows_scanned"] = int(rows_scanned)
+            stats["brute_force"] = brute_force
+
+        best_pos = np.sort(best_pos)
+        diff = np.asarray(self.vectors[best_pos], dtype=np.float64) - query
+        dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        order = np.argsort(-dist, kind="stable")[:k]
+        return np.asarray(self.order[best_pos[order]]), dist[order]
+
+    def _farthest_scan(self, query: np.ndarray, q_sq: float, keep: int, exclude: int = -1) -> tuple:
+        """Positions and approximate scores of the `keep` furthest rows, from a full blocked scan."""
+        best_pos, best_scores = [], []
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS])
+            scores = self.sq_norms[start:start + len(block)] - 2.0 * (block @ query) + q_sq
+            if exclude >= 0:
+                scores[np.asarray(self.order[start:start + len(block)]) == exclude] = -np.inf
+            top = np.argpartition(-scores, keep - 1)[:keep] if len(scores) > keep else np.arange(len(scores))
+            top = top[np.isfinite(scores[top])]
+            best_pos.append(top + start)
+            best_scores.append(scores[top])
+        return np.concatenate(best_pos), np.concatenate(best_scores)
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def main(argv=None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    if not argv or argv[0] != "build":
+        print("Usage: python ivf_index.py build [n_lists]")
+        return 1
+
+    n_lists = int(argv[1]) if len(argv) > 1 else N_LISTS
+    backend = NumpySearch()
+    print(f"🔧 Building IVF index: {len(backend):,} rows into {n_lists} lists...")
+    index = IVFIndex.build(backend.embeddings, n_lists=n_lists)
+    index.save(IVF_DIR)
+    sizes = np.diff(index.offsets)
+    print(f"   lists: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+    print(f"✅ Built in {index.meta['build_seconds']}s, saved to {IVF_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+metrics.py - Counters and latency histograms for ingest and search.
+
+A small in-process metrics registry with Prometheus text output, so a load
+test or a long ingest can be watched (or scraped) instead of guessed at:
+
+    copy_rows_total{table}            rows loaded with COPY (fast_pg_insert)
+    copy_bytes_total{table}           bytes of CSV sent to COPY
+    ingest_stage_seconds{stage}       duration of each db_insert stage
+    queries_total{kind}               SQL queries run by search.py
+    query_seconds{kind}               their latency (histogram)
+    cache_requests_total{cache,result}  result cache hits and misses
+    cache_evictions_total{cache}, cache_invalidations_total{cache}
+
+Metrics are off by default and every recording call returns immediately,
+so instrumented code costs one attribute check. Turn them on with
+enable(), or by setting SEARCH_METRICS=1 in the environment. With
+SEARCH_METRICS_FILE=<path> they are also written there (Prometheus text
+format, e.g. for node_exporter's textfile collector) when the process exits.
+
+Reading them:
+    render()                 the Prometheus text exposition, as a string
+    write_textfile(path)     the same, written atomically to a file
+    serve(port)              GET /metrics on a background HTTP thread
+    search_service.py        also answers GET /metrics
+
+Example:
+--------
+>>> enable()
+>>> inc("copy_rows_total", 3, table="segment")
+>>> with timer("query_seconds", kind="segment"):
+...     pass
+>>> "copy_rows_total{table=\\"segment\\"} 3" in render()
+True
+"""
+
+import os
+import time
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+
+ENABLED = False
+
+# Latency buckets in seconds: 0.5 ms to 10 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "copy_rows_total": ("counter", "Rows loaded with COPY"),
+    "copy_bytes_total": ("counter", "Bytes of CSV sent to COPY"),
+    "ingest_stage_seconds": ("histogram", "Duration of db_insert stages"),
+    "queries_total": ("counter", "SQL queries run by search.py"),
+    "query_seconds": ("histogram", "Latency of SQL queries run by search.py"),
+    "cache_requests_total": ("counter", "Result cache lookups by result (hit or miss)"),
+    "cache_evictions_total": ("counter", "Result cache entries evicted for space"),
+    "cache_invalidations_total": ("counter", "Result cache flushes after new data was loaded"),
+}
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+
+
+def enable(on: bool = True):
+    """Turn recording on (or off). Already-recorded values are kept."""
+    global ENABLED
+    ENABLED = on
+
+
+def reset():
+    """Forget every recorded value."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+# =============================================================================
+# Recording
+# =============================================================================
+def inc(name: str, value: float = 1, **labels):
+    """Add `value` to a counter."""
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """Record one observation (e.g. a duration in seconds) in a histogram."""
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    index = bisect.bisect_left(BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[index] += 1
+        histogram[-1] += value
+
+
+@contextmanager
+def _timed(name: str, labels: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timer(name: str, **labels):
+    """
+    Context manager that records how long its block took in a histogram.
+
+    When metrics are off this is a shared no-op context manager.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _timed(name, labels)
+
+
+# =============================================================================
+# Exporting
+# =============================================================================
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{str(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _header(lines: list, name: str, default_type: str):
+    kind, text = HELP.get(name, (default_type, name))
+    lines.append(f"# HELP {name} {text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(value) for key, value in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        _header(lines, name, "counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for name in sorted({name for name, _ in histograms}):
+        _header(lines, name, "histogram")
+        for (n, labels), counts in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {counts[-1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str):
+    """Write render() to a file, atomically (write + rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def serve(port: int = 9452, host: str = "127.0.0.1"):
+    """Enable metrics and serve GET /metrics on a background thread."""
+    # Imported here: query_cache and utils import this module, and they
+    # shouldn't pay for http.server (see bench_imports.py)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+if os.environ.get("SEARCH_METRICS", "") not in ("", "0") or os.environ.get("SEARCH_METRICS_FILE"):
+    enable()
+    if os.environ.get("SEARCH_METRICS_FILE"):
+        atexit.register(write_textfile, os.environ["SEARCH_METRICS_FILE"])
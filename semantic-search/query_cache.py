@@ -0,0 +1,196 @@
+"""
+query_cache.py - In-process LRU cache for similarity query results.
+
+The same few segments and episodes get searched over and over, and every
+search is a full L2 scan. QueryCache keeps recent results in memory:
+
+- size-bounded: least recently used entries are evicted past `maxsize`
+- time-bounded: entries older than `ttl` seconds are treated as misses
+- generation-checked: every committed load bumps a counter in the database
+  (see utils.bump_generation). When the cache sees a new generation it drops
+  everything, so results never outlive the data they were computed from.
+  The counter is polled at most every `generation_poll` seconds, which bounds
+  how long a stale result can be served after a load. get() and put() take
+  the caller's connection, so the poll reuses it instead of opening one.
+
+Example:
+--------
+>>> cache = QueryCache(maxsize=2, ttl=60)
+>>> key = make_key("segment", "267:476", k=5)
+>>> cache.get(key) is MISSING
+True
+>>> cache.put(key, [("title", 0.1)])
+>>> cache.get(key)
+[('title', 0.1)]
+>>> cache.stats()["hits"]
+1
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import metrics
+
+# Sentinel returned by get() on a miss (None can be a valid cached value)
+MISSING = object()
+
+
+def query_key(query) -> Hashable:
+    """
+    Turn a query into a hashable cache key component.
+
+    Segment/podcast ids are used as-is. Vectors are hashed from their
+    float32 bytes so equal vectors map to the same key regardless of
+    whether they arrive as lists or numpy arrays.
+    """
+    if isinstance(query, str):
+        return query
+    import numpy as np
+    data = np.asarray(query, dtype=np.float32).tobytes()
+    return "vec:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def make_key(kind: str, query, k: int, metric: str = "l2", direction: str = "asc") -> tuple:
+    """Build the cache key for one search call."""
+    return (kind, query_key(query), k, metric, direction)
+
+
+class QueryCache:
+    """
+    Thread-safe LRU + TTL cache with generation-based invalidation.
+
+    Parameters:
+    -----------
+    maxsize : int
+        Maximum number of cached results.
+    ttl : float
+        Seconds a result stays valid. 0 or None disables expiry.
+    generation : callable, optional
+        Returns the current data generation. Called as generation(conn=conn)
+        when get() or put() was given a connection. Omit to disable
+        invalidation.
+    generation_poll : float
+        Minimum seconds between calls to `generation`.
+    name : str, optional
+        Label for this cache in metrics.py (cache_requests_total etc.).
+        Unnamed caches aren't reported there.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 300.0,
+        generation: Optional[Callable[..., int]] = None,
+        generation_poll: float = 1.0,
+        name: Optional[str] = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation_source = generation
+        self.generation_poll = generation_poll
+        self.name = name
+        self.generation = None
+        self._last_poll = float("-inf")
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self, conn=None):
+        """
+        Drop all entries if the data generation has moved on.
+
+        The generation is read outside the lock, so a slow poll doesn't
+        block other threads' lookups; the lock is only taken to claim the
+        poll and to compare and clear.
+        """
+        if self.generation_source is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_poll < self.generation_poll:
+                return
+            self._last_poll = now
+        current = self.generation_source() if conn is None else self.generation_source(conn=conn)
+        with self._lock:
+            if current != self.generation:
+                if self.generation is not None and self._entries:
+                    self._entries.clear()
+                    self.invalidations += 1
+                    if self.name:
+                        metrics.inc("cache_invalidations_total", cache=self.name)
+                self.generation = current
+
+    def lookup(self, key: Hashable, conn=None) -> tuple:
+        """
+        Return (value or MISSING, generation seen).
+
+        Pass the generation to put() along with the value computed on a
+        miss, so a result computed from data that has since been replaced
+        isn't cached under the new generation.
+        """
+        self._check_generation(conn)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                if self.name:
+                    metrics.inc("cache_requests_total", cache=self.name, result="miss")
+                return MISSING, self.generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self.name:
+                metrics.inc("cache_requests_total", cache=self.name, result="hit")
+            return entry[1], self.generation
+
+    def get(self, key: Hashable, conn=None):
+        """Return the cached value for key, or MISSING. `conn` is used to poll the generation."""
+        return self.lookup(key, conn)[0]
+
+    def put(self, key: Hashable, value, conn=None, generation=None):
+        """
+        Store a value, evicting the least recently used entry if full.
+
+        `generation` is the one lookup() returned when the value was found
+        missing; if the data has moved on since, the value is dropped.
+        """
+        self._check_generation(conn)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                if self.name:
+                    metrics.inc("cache_evictions_total", cache=self.name)
+
+    def clear(self):
+        """Remove all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "generation": self.generation,
+            }
@@ -0,0 +1,1100 @@
+"""
+search.py - Reusable semantic search functions for the podcast database.
+
+db_query.py is where the assignment queries are written by hand and printed.
+This module wraps the same query shapes in functions that return rows, so
+other scripts (benchmarks, services, notebooks) can call them directly:
+
+    similar_segments("267:476")            -> Q1/Q2/Q3/Q4 shape
+    similar_episodes_to_segment("48:511")  -> Q5 shape
+    similar_episodes("VeH7qKZr0WI")        -> Q6 shape
+    batch_similar_segments([...])          -> many Q1-style lookups at once
+    filtered_similar_segments("267:476", podcast_ids=[...], time_range=(0, 600))
+    similar_windows("267:476")             -> closest multi-segment windows
+    segments_within("267:476", 0.5)        -> radius search, streamed
+    episode_segments("VeH7qKZr0WI")        -> every segment of an episode, streamed
+
+similar_segments() has four modes:
+    "index"   (default) let the planner choose; uses an ANN index if present
+    "exact"   force a full scan, so results are exact even with an ANN index
+    "rerank"  pull k * oversample candidates through the ANN index, then
+              re-rank them by exact distance. rerank_recall() measures how
+              much that loses against "exact".
+    "window"  find the k * oversample closest segment windows (several
+              segments each, so far fewer rows), then rank their segments
+              by exact distance
+
+Distances are L2 (<->) by default, matching the assignment. The segment
+and episode searches also take metric='cosine' or 'ip'; if embeddings were
+normalized at ingest, cosine becomes a plain inner product (<#>).
+
+Results are cached in-process (see query_cache.py). The cache is dropped
+automatically whenever db_insert loads new data; pass use_cache=False to
+force a fresh query, or call cache_stats() for hit/miss counters.
+
+Usage:
+    python search.py 267:476 48:511 51:56
+    python search.py --recall 4 267:476 48:511 51:56   # re-rank recall@5
+"""
+
+import re
+import sys
+import json
+import math
+import psycopg2
+from typing import List, Optional, Sequence, Tuple, Union
+
+import metrics
+from utils import get_connection_string, get_generation, stream_query, vector_to_pg_format
+from query_cache import QueryCache, MISSING, make_key
+
+# Get database connection
+CONNECTION = get_connection_string()
+
+DIRECTIONS = {"asc": "ASC", "desc": "DESC"}
+MODES = ("index", "exact", "rerank", "window")
+DEFAULT_OVERSAMPLE = 4
+
+# Filtered search strategy thresholds (see filtered_similar_segments)
+FILTER_STRATEGIES = ("auto", "exact", "partition", "iterative")
+EXACT_SCAN_MAX_ROWS = 50000     # few enough matching rows to just rank them all
+PARTITION_MAX_PODCASTS = 50     # per-podcast top-k merge for up to this many
+ITERATIVE_MAX_SCAN_TUPLES = 200000
+ITERATIVE_SCAN_VERSION = (0, 8)  # first pgvector release with hnsw.iterative_scan
+
+# Shared result cache for all search functions in this process
+RESULT_CACHE = QueryCache(maxsize=1024, ttl=300, generation=get_generation, name="search")
+
+
+# =============================================================================
+# SQL templates
+# =============================================================================
+# The query vector is fetched with a scalar subquery rather than a join so the
+# planner treats it as a constant and can use an ANN index on embedding when
+# one exists.
+
+#
+# {distance} and {order_by} come from METRIC_SQL; use segment_neighbors_sql()
+# and episode_neighbors_sql() rather than formatting these directly. {dedup}
+# is DEDUP_FILTER or empty.
+
+SEGMENT_NEIGHBORS_SQL = """
+SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+       {distance} AS distance
+FROM segment s
+JOIN podcast p ON p.id = s.podcast_id
+WHERE s.id <> %(segment_id)s{dedup}
+ORDER BY {order_by} {direction}
+LIMIT %(k)s
+"""
+
+# Same query, but the OFFSET 0 subquery is planned on its own with no
+# ORDER BY, so an ANN index can't be used for the ordering: always exact.
+EXACT_SEGMENT_NEIGHBORS_SQL = """
+SELECT title, id, content, start_time, end_time, distance
+FROM (
+    SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+           {distance} AS distance
+    FROM segment s
+    JOIN podcast p ON p.id = s.podcast_id
+    WHERE s.id <> %(segment_id)s{dedup}
+    OFFSET 0
+) scored
+ORDER BY distance {direction}
+LIMIT %(k)s
+"""
+
+# Episode vectors are averages of the original segment vectors; {embedding}
+# undoes ingest-time normalization when it was applied.
+EPISODE_NEIGHBORS_FOR_SEGMENT_SQL = """
+WITH episode AS (
+    SELECT podcast_id, AVG({embedding}) AS embedding
+    FROM segment
+    GROUP BY podcast_id
+)
+SELECT p.title,
+       e.embedding {operator} (SELECT {embedding} FROM segment WHERE id = %(segment_id)s) AS distance
+FROM episode e
+JOIN podcast p ON p.id = e.podcast_id
+ORDER BY distance {direction}
+LIMIT %(k)s
+"""
+
+EPISODE_NEIGHBORS_SQL = """
+WITH episode AS (
+    SELECT podcast_id, AVG({embedding}) AS embedding
+    FROM segment
+    GROUP BY podcast_id
+)
+SELECT p.title,
+       e.embedding {operator} (SELECT embedding FROM episode WHERE podcast_id = %(podcast_id)s) AS distance
+FROM episode e
+JOIN podcast p ON p.id = e.podcast_id
+WHERE e.podcast_id <> %(podcast_id)s
+ORDER BY distance {direction}
+LIMIT %(k)s
+"""
+
+# Two-stage retrieval: the MATERIALIZED CTE is a bare ORDER BY ... LIMIT so
+# the planner can answer it from an ANN index. The outer query then re-ranks
+# the candidates by exact distance and drops the query segment itself.
+# {distance} is the exact L2 distance from METRIC_SQL; use rerank_neighbors_sql().
+RERANK_SEGMENT_NEIGHBORS_SQL = """
+WITH candidates AS MATERIALIZED (
+    SELECT s.id
+    FROM segment s
+    ORDER BY {ann_distance}
+    LIMIT %(n_candidates)s
+)
+SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+       {distance} AS distance
+FROM candidates c
+JOIN segment s ON s.id = c.id
+JOIN podcast p ON p.id = s.podcast_id
+WHERE s.id <> %(segment_id)s
+ORDER BY distance
+LIMIT %(k)s
+"""
+
+# Candidate ordering per index type. "halfvec" matches an index built on
+# embedding::halfvec(128), whose distances are only approximate.
+ANN_DISTANCES = {
+    "vector": "s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s)",
+    "halfvec": "s.embedding::halfvec(128) <-> "
+               "(SELECT embedding FROM segment WHERE id = %(segment_id)s)::halfvec(128)",
+}
+
+# Coarse-to-fine over segment_window (see db_build.py): the closest windows
+# come from the window table's own, much smaller, HNSW index, then their
+# member segments are ranked exactly. {query} is the query segment's original
+# vector (windows average original vectors) and {distance} the exact L2
+# distance from METRIC_SQL.
+WINDOW_SEGMENT_NEIGHBORS_SQL = """
+WITH windows AS MATERIALIZED (
+    SELECT w.segment_ids
+    FROM segment_window w
+    ORDER BY w.embedding <-> {query}
+    LIMIT %(n_windows)s
+)
+SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+       {distance} AS distance
+FROM (SELECT DISTINCT unnest(segment_ids) AS id FROM windows) c
+JOIN segment s ON s.id = c.id
+JOIN podcast p ON p.id = s.podcast_id
+WHERE s.id <> %(segment_id)s
+ORDER BY distance
+LIMIT %(k)s
+"""
+
+WINDOWS_SQL = """
+SELECT p.title, w.id, w.content, w.start_time, w.end_time,
+       w.embedding <-> {query} AS distance, w.segment_ids
+FROM segment_window w
+JOIN podcast p ON p.id = w.podcast_id
+ORDER BY w.embedding <-> {query}
+LIMIT %(k)s
+"""
+
+# Batched kNN: one LATERAL top-k per query, all in a single statement.
+# WITH ORDINALITY keeps track of which input each result row belongs to.
+# {distance} and {order_by} come from METRIC_SQL, as for a single query; use
+# batch_neighbors_sql() rather than formatting these directly. Vector
+# queries carry their own length, which is only used on normalized tables
+# (the vectors are sent normalized there, like the stored ones).
+BATCH_SEGMENT_NEIGHBORS_SQL = """
+SELECT q.ord, p.title, n.id, n.content, n.start_time, n.end_time, n.distance
+FROM unnest(%(segment_ids)s::text[]) WITH ORDINALITY AS q(segment_id, ord)
+CROSS JOIN LATERAL (
+    SELECT s.id, s.content, s.start_time, s.end_time, s.podcast_id,
+           {distance} AS distance
+    FROM segment s
+    WHERE s.id <> q.segment_id
+    ORDER BY {order_by}
+    LIMIT %(k)s
+) n
+JOIN podcast p ON p.id = n.podcast_id
+ORDER BY q.ord, n.distance
+"""
+
+BATCH_VECTOR_NEIGHBORS_SQL = """
+SELECT q.ord, p.title, n.id, n.content, n.start_time, n.end_time, n.distance
+FROM unnest(%(vectors)s::text[], %(norms)s::float8[]) WITH ORDINALITY AS q(vec, norm, ord)
+CROSS JOIN LATERAL (
+    SELECT s.id, s.content, s.start_time, s.end_time, s.podcast_id,
+           {distance} AS distance
+    FROM segment s
+    ORDER BY {order_by}
+    LIMIT %(k)s
+) n
+JOIN podcast p ON p.id = n.podcast_id
+ORDER BY q.ord, n.distance
+"""
+
+# The query vector (and its length) for each kind of batch query
+BATCH_QUERIES = {
+    "segment": ("(SELECT embedding FROM segment WHERE id = q.segment_id)",
+                "(SELECT embedding_norm FROM segment WHERE id = q.segment_id)"),
+    "vector": ("q.vec::vector", "q.norm"),
+}
+
+
+# Filtered search. {filters} is a generated AND-list over segment s (see
+# _filter_sql); each strategy below answers the same question differently.
+
+# Pre-filter + exact scan: the OFFSET 0 fence keeps the ANN index out, so the
+# filter can use ordinary b-tree indexes and every matching row is ranked.
+FILTERED_EXACT_SQL = """
+SELECT title, id, content, start_time, end_time, distance
+FROM (
+    SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+           s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s) AS distance
+    FROM segment s
+    JOIN podcast p ON p.id = s.podcast_id
+    WHERE s.id <> %(segment_id)s AND {filters}
+    OFFSET 0
+) scored
+ORDER BY distance
+LIMIT %(k)s
+"""
+
+# HNSW with iterative scans (pgvector >= 0.8): the index keeps producing
+# candidates until k of them pass the filter, instead of stopping at
+# ef_search and silently returning fewer than k rows.
+FILTERED_ITERATIVE_SQL = """
+SELECT p.title, s.id, s.content, s.start_time, s.end_time,
+       s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s) AS distance
+FROM segment s
+JOIN podcast p ON p.id = s.podcast_id
+WHERE s.id <> %(segment_id)s AND {filters}
+ORDER BY s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s)
+LIMIT %(k)s
+"""
+
+# Partition pruning by podcast: an exact top-k inside each requested podcast
+# (read through the podcast_id index), merged into a global top-k.
+FILTERED_PARTITION_SQL = """
+SELECT p.title, n.id, n.content, n.start_time, n.end_time, n.distance
+FROM unnest(%(podcast_ids)s::text[]) AS part(podcast_id)
+CROSS JOIN LATERAL (
+    SELECT *
+    FROM (
+        SELECT s.id, s.content, s.start_time, s.end_time, s.podcast_id,
+               s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s) AS distance
+        FROM segment s
+        WHERE s.podcast_id = part.podcast_id AND s.id <> %(segment_id)s AND {filters}
+        OFFSET 0
+    ) scored
+    ORDER BY distance
+    LIMIT %(k)s
+) n
+JOIN podcast p ON p.id = n.podcast_id
+ORDER BY n.distance
+LIMIT %(k)s
+"""
+
+# Context windows: any of the segment queries above runs as {hits}, and each
+# hit is joined to the segments around it in the same episode - one
+# statement however many hits there are. Segment ids are "<episode>:<n>", so
+# a segment's position is the id's second part; segment_position_idx (see
+# db_build.py) turns each window into a single index range scan. The CTE is
+# MATERIALIZED so the hit query is planned exactly as it is on its own.
+CONTEXT_SQL = """
+WITH hits AS MATERIALIZED (
+{hits}
+)
+SELECT h.title, h.id, h.content, h.start_time, h.end_time, h.distance,
+       c.id, c.content, c.start_time, c.end_time,
+       c.position - split_part(h.id, ':', 2)::int AS relative_position
+FROM hits h
+JOIN segment hs ON hs.id = h.id
+CROSS JOIN LATERAL (
+    SELECT s.id, s.content, s.start_time, s.end_time, split_part(s.id, ':', 2)::int AS position
+    FROM segment s
+    WHERE s.podcast_id = hs.podcast_id
+      AND split_part(s.id, ':', 2)::int BETWEEN split_part(hs.id, ':', 2)::int - %(context)s
+                                            AND split_part(hs.id, ':', 2)::int + %(context)s
+) c
+ORDER BY h.distance {direction}, h.id, c.position
+"""
+
+# Unbounded result sets, read through stream_query() rather than _execute()
+RADIUS_SQL = """
+SELECT id, start_time, end_time, content, distance
+FROM (
+    SELECT s.id, s.start_time, s.end_time, s.content,
+           s.embedding <-> (SELECT embedding FROM segment WHERE id = %(segment_id)s) AS distance
+    FROM segment s
+    WHERE s.id <> %(segment_id)s
+    OFFSET 0
+) scored
+WHERE distance <= %(radius)s
+"""
+
+EPISODE_SEGMENTS_SQL = """
+SELECT id, start_time, end_time, content, embedding
+FROM segment
+WHERE podcast_id = %(podcast_id)s
+ORDER BY split_part(id, ':', 2)::int
+"""
+
+# =============================================================================
+# Distance metrics
+# =============================================================================
+# pgvector operators: <-> L2, <=> cosine distance, <#> negative inner product
+# (so smaller is always closer). For 'ip' the reported distance is the
+# negative inner product.
+#
+# Embeddings may be L2-normalized at ingest (see db_insert.py), in which case
+# segment.embedding holds unit vectors and segment.embedding_norm the original
+# lengths. Cosine distance is then just 1 + (a <#> b) - no per-row norms - and
+# can be answered by an inner-product index (db_build.INDEX_CONFIGS['hnsw_ip']).
+# L2 and inner product are rebuilt exactly from the norms, which needs a full
+# scan. The filtered and radius searches always use <-> on the stored
+# vectors; on normalized embeddings that ranks neighbours by cosine.
+METRICS = ("l2", "cosine", "ip")
+METRIC_OPERATORS = {"l2": "<->", "cosine": "<=>", "ip": "<#>"}
+
+QUERY_VECTOR = "(SELECT embedding FROM segment WHERE id = %(segment_id)s)"
+QUERY_NORM = "(SELECT embedding_norm FROM segment WHERE id = %(segment_id)s)"
+QUERY_ORIGINAL = "(SELECT {embedding} FROM segment WHERE id = %(segment_id)s)"
+
+# normalized -> metric -> (distance, index-friendly ORDER BY or None)
+METRIC_SQL = {
+    False: {
+        "l2": ("s.embedding <-> {q}", "s.embedding <-> {q}"),
+        "cosine": ("s.embedding <=> {q}", "s.embedding <=> {q}"),
+        "ip": ("s.embedding <#> {q}", "s.embedding <#> {q}"),
+    },
+    True: {
+        "l2": ("sqrt(greatest(s.embedding_norm ^ 2 + {qn} ^ 2 + 2 * s.embedding_norm * {qn} * (s.embedding <#> {q}), 0))", None),
+        "cosine": ("1 + (s.embedding <#> {q})", "s.embedding <#> {q}"),
+        "ip": ("s.embedding_norm * {qn} * (s.embedding <#> {q})", None),
+    },
+}
+
+# Skip near-duplicates (see dedup.py). Written exactly like the predicate of
+# the partial indexes in db_build.INDEX_CONFIGS ('hnsw_canonical',
+# 'hnsw_ip_canonical') so the planner can use them.
+DEDUP_FILTER = " AND s.canonical_id IS NULL"
+
+# The original (unnormalized) vector of a segment row
+ORIGINAL_EMBEDDING = {
+    False: "embedding",
+    True: "embedding * array_fill(embedding_norm, ARRAY[128])::vector",
+}
+
+VECTOR_VERSION_SQL = "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+
+NORM_COLUMN_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'segment' AND column_name = 'embedding_norm'
+)
+"""
+
+# =============================================================================
+# Helpers
+# =============================================================================
+_SETTING_NAME = re.compile(r"^[a-z_]+(\.[a-z_]+)?$")
+
+
+def _execute(sql: str, params: dict, conn=None, settings: Optional[dict] = None, kind: str = "other") -> list:
+    """
+    Run a query and return all rows.
+
+    If no connection is given, a new one is opened and closed around the
+    query (the same behaviour as run_query in db_query.py). Pass a connection
+    to reuse it across many calls.
+
+    `settings` are planner/index parameters (e.g. {"hnsw.ef_search": 100})
+    applied with SET for this query only and RESET afterwards.
+
+    `kind` labels the query in the queries_total / query_seconds metrics.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(CONNECTION)
+    settings = settings or {}
+    try:
+        with conn.cursor() as cursor:
+            for name, value in settings.items():
+                if not _SETTING_NAME.match(name):
+                    raise ValueError(f"Invalid setting name {name!r}")
+                cursor.execute(f"SET {name} = %s", (value,))
+            metrics.inc("queries_total", kind=kind)
+            with metrics.timer("query_seconds", kind=kind):
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            # On error the caller's rollback undoes the SETs instead
+            for name in settings:
+                cursor.execute(f"RESET {name}")
+            return rows
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _order(direction: str) -> str:
+    """Validate a sort direction and return its SQL keyword."""
+    try:
+        return DIRECTIONS[direction.lower()]
+    except KeyError:
+        raise ValueError(f"direction must be 'asc' or 'desc', got {direction!r}")
+
+
+def _metric(metric: str) -> str:
+    """Validate a metric name."""
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+    return metric
+
+
+def embeddings_normalized(conn=None) -> bool:
+    """
+    Whether segment embeddings were L2-normalized at ingest.
+
+    The embedding_norm column only exists on normalized tables. The answer
+    is cached alongside query results, so it is re-checked after new data
+    is loaded.
+    """
+    key = make_key("schema:normalized", "segment", 0)
+    return _cached(key, True, lambda: [_execute(NORM_COLUMN_SQL, {}, conn, kind="schema")[0][0]], conn)[0]
+
+
+def segment_neighbors_sql(direction: str = "asc", metric: str = "l2", normalized: bool = False,
+                          exact: bool = False, dedup: bool = False) -> str:
+    """
+    Build the similar-segments query for a metric and storage layout.
+
+    Uses the index-friendly template unless exact=True or the metric can
+    only be computed with a full scan (L2 / IP on normalized embeddings).
+    dedup=True leaves out segments marked as near-duplicates.
+    """
+    distance, order_by = METRIC_SQL[normalized][_metric(metric)]
+    distance = distance.format(q=QUERY_VECTOR, qn=QUERY_NORM)
+    dedup = DEDUP_FILTER if dedup else ""
+    if exact or order_by is None:
+        return EXACT_SEGMENT_NEIGHBORS_SQL.format(distance=distance, direction=_order(direction), dedup=dedup)
+    order_by = order_by.format(q=QUERY_VECTOR, qn=QUERY_NORM)
+    return SEGMENT_NEIGHBORS_SQL.format(distance=distance, order_by=order_by, direction=_order(direction), dedup=dedup)
+
+
+def batch_neighbors_sql(by_id: bool, normalized: bool = False) -> str:
+    """
+    Build the batched nearest-segments query (L2) for a storage layout.
+
+    Like segment_neighbors_sql(), the distance is the exact L2 distance on
+    either layout; on normalized embeddings each LATERAL is a full scan.
+    """
+    template, (query, norm) = ((BATCH_SEGMENT_NEIGHBORS_SQL, BATCH_QUERIES["segment"]) if by_id
+                               else (BATCH_VECTOR_NEIGHBORS_SQL, BATCH_QUERIES["vector"]))
+    distance, order_by = METRIC_SQL[normalized]["l2"]
+    return template.format(distance=distance.format(q=query, qn=norm),
+                           order_by=order_by.format(q=query, qn=norm) if order_by else "distance")
+
+
+def batch_neighbors_query(queries: list, k: int, normalized: bool = False) -> Tuple[str, dict, bool]:
+    """
+    SQL and parameters for a batch of segment-id or vector queries.
+
+    Returns (sql, params, by_id). Raises ValueError for a mix of ids and
+    vectors.
+    """
+    by_id = all(isinstance(q, str) for q in queries)
+    if not by_id and any(isinstance(q, str) for q in queries):
+        raise ValueError("queries must be all segment ids or all vectors, not a mix")
+    if by_id:
+        return batch_neighbors_sql(True, normalized), {"segment_ids": list(queries), "k": k}, True
+    vectors = [[float(x) for x in q] for q in queries]
+    norms = [math.sqrt(sum(x * x for x in vector)) for vector in vectors]
+    if normalized:
+        # Compared with unit vectors, so normalize the query the same way
+        vectors = [[x / norm for x in vector] if norm else vector for vector, norm in zip(vectors, norms)]
+    params = {"vectors": [vector_to_pg_format(vector) for vector in vectors], "norms": norms, "k": k}
+    return batch_neighbors_sql(False, normalized), params, False
+
+
+def episode_neighbors_sql(template: str, direction: str = "asc", metric: str = "l2", normalized: bool = False) -> str:
+    """Fill in one of the episode templates for a metric and storage layout."""
+    return template.format(
+        embedding=ORIGINAL_EMBEDDING[normalized],
+        operator=METRIC_OPERATORS[_metric(metric)],
+        direction=_order(direction),
+    )
+
+
+def _context(context: int) -> int:
+    """Validate a context window size."""
+    if context < 0:
+        raise ValueError(f"context must be >= 0, got {context!r}")
+    return context
+
+
+def _search(sql: str, params: dict, conn=None, settings: Optional[dict] = None,
+            context: int = 0, direction: str = "asc", kind: str = "other") -> list:
+    """
+    Run a segment query, optionally with a context window around each hit.
+
+    With context=0 this is just _execute(). Otherwise the query is wrapped
+    in CONTEXT_SQL and the rows are grouped per hit: a list of
+    (hit, window) pairs where hit is the usual 6-tuple and window lists
+    (segment id, content, start_time, end_time, relative position) for the
+    hit's episode positions -context..+context, the hit itself included at 0.
+    """
+    if not context:
+        return _execute(sql, params, conn, settings, kind)
+    rows = _execute(CONTEXT_SQL.format(hits=sql, direction=_order(direction)),
+                    {**params, "context": context}, conn, settings, kind)
+    grouped = []
+    for row in rows:
+        hit, window_row = row[:6], row[6:]
+        if not grouped or grouped[-1][0][1] != hit[1]:
+            grouped.append((hit, []))
+        grouped[-1][1].append(window_row)
+    return grouped
+
+
+def rerank_neighbors_sql(ann: str, normalized: bool = False) -> str:
+    """
+    Build the rerank query for a storage layout.
+
+    On normalized tables the candidates come from the unit vectors (an index
+    can only order by those), but they are re-ranked and reported by the
+    exact L2 distance rebuilt from embedding_norm, as mode='exact' does.
+    """
+    return RERANK_SEGMENT_NEIGHBORS_SQL.format(
+        ann_distance=ANN_DISTANCES[ann],
+        distance=METRIC_SQL[normalized]["l2"][0].format(q=QUERY_VECTOR, qn=QUERY_NORM),
+    )
+
+
+def window_neighbors_sql(template: str, normalized: bool = False) -> str:
+    """Fill in one of the segment_window templates for a storage layout."""
+    return template.format(
+        query=QUERY_ORIGINAL.format(embedding=ORIGINAL_EMBEDDING[normalized]),
+        distance=METRIC_SQL[normalized]["l2"][0].format(q=QUERY_VECTOR, qn=QUERY_NORM),
+    )
+
+
+def _cached(key: tuple, use_cache: bool, compute, conn=None) -> list:
+    """Return a cached result for key, or compute and cache it (polling the generation over conn)."""
+    if not use_cache:
+        return compute()
+    rows, generation = RESULT_CACHE.lookup(key, conn)
+    if rows is MISSING:
+        rows = compute()
+        RESULT_CACHE.put(key, rows, conn, generation)
+    return list(rows)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for the shared result cache."""
+    return RESULT_CACHE.stats()
+
+
+# =============================================================================
+# Segment and episode search
+# =============================================================================
+def similar_segments(
+    segment_id: str,
+    k: int = 5,
+    direction: str = "asc",
+    conn=None,
+    use_cache: bool = True,
+    mode: str = "index",
+    oversample: int = DEFAULT_OVERSAMPLE,
+    ann: str = "vector",
+    metric: str = "l2",
+    context: int = 0,
+    dedup: bool = False
+) -> list:
+    """
+    Find the k segments closest to (or furthest from) a segment.
+
+    Parameters:
+    -----------
+    segment_id : str
+        The query segment, e.g. '267:476'. It is excluded from the results.
+    k : int
+        Number of segments to return.
+    direction : str
+        'asc' for most similar (Q1), 'desc' for most dissimilar (Q2).
+        'desc' can't use an ANN index and always scans the whole table;
+        the pruned farthest search is in-process only (ivf_index.py).
+    conn : psycopg2 connection, optional
+        Connection to reuse. A new one is opened if omitted.
+    use_cache : bool
+        Serve repeated calls from the in-process result cache.
+    mode : str
+        'index' lets the planner use an ANN index if one exists. 'exact'
+        forces a full scan. 'rerank' fetches k * oversample candidates
+        through the ANN index and re-ranks them exactly (nearest only).
+        'window' finds the k * oversample closest segment windows and
+        re-ranks their segments exactly (nearest only; needs
+        `python db_insert.py --windows`).
+    oversample : int
+        Candidate multiplier for mode='rerank' and 'window'. Higher =
+        better recall.
+    ann : str
+        Which index expression generates candidates: 'vector' or 'halfvec'.
+    metric : str
+        'l2' (the assignment's metric), 'cosine' or 'ip' (negative inner
+        product). On normalized embeddings, cosine can use an inner-product
+        index while l2 and ip need a full scan.
+    context : int
+        Also return the `context` segments before and after each hit in
+        its episode, fetched in the same query.
+    dedup : bool
+        Leave out near-duplicate segments, so each group of repeats shows
+        up once (through its canonical segment). Needs `python dedup.py`
+        to have been run; mode='index' and 'exact' only.
+
+    Returns:
+    --------
+    list of tuples
+        (podcast title, segment id, content, start_time, end_time, distance)
+
+        With context > 0, a list of (hit, window) pairs instead: hit is the
+        tuple above and window a list of (segment id, content, start_time,
+        end_time, relative position) in episode order, the hit included
+        at position 0.
+
+    Example:
+    --------
+    >>> for hit, window in similar_segments('89:115', context=2):
+    ...     print(hit[1], [row[0] for row in window])
+    """
+    order = _order(direction)
+    _metric(metric)
+    suffix = f":context{_context(context)}" if context else ""
+    if mode in ("index", "exact"):
+        kind = "segment" if mode == "index" else "segment:exact"
+        key = make_key(kind + (":dedup" if dedup else "") + suffix, segment_id, k, metric, direction.lower())
+
+        def compute():
+            sql = segment_neighbors_sql(direction, metric, embeddings_normalized(conn),
+                                        exact=mode == "exact", dedup=dedup)
+            return _search(sql, {"segment_id": segment_id, "k": k}, conn,
+                           context=context, direction=direction, kind=kind)
+        return _cached(key, use_cache, compute, conn)
+
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    if order != "ASC":
+        raise ValueError(f"mode={mode!r} only supports nearest neighbours (direction='asc')")
+    if metric != "l2":
+        raise ValueError(f"mode={mode!r} only supports metric='l2'")
+    if dedup:
+        raise ValueError(f"mode={mode!r} does not support dedup")
+
+    if mode == "window":
+        n_windows = k * oversample
+        params = {"segment_id": segment_id, "k": k, "n_windows": n_windows}
+        settings = {"hnsw.ef_search": max(40, n_windows)}
+        key = make_key(f"segment:window:{oversample}{suffix}", segment_id, k)
+
+        def compute():
+            sql = window_neighbors_sql(WINDOW_SEGMENT_NEIGHBORS_SQL, embeddings_normalized(conn))
+            return _search(sql, params, conn, settings, context, kind="segment:window")
+        return _cached(key, use_cache, compute, conn)
+    if ann not in ANN_DISTANCES:
+        raise ValueError(f"ann must be one of {tuple(ANN_DISTANCES)}, got {ann!r}")
+
+    # +1 because the query segment is usually its own nearest candidate
+    n_candidates = k * oversample + 1
+    sql = rerank_neighbors_sql(ann, embeddings_normalized(conn))
+    params = {"segment_id": segment_id, "k": k, "n_candidates": n_candidates}
+    # HNSW returns at most ef_search rows, so it must cover the candidates
+    settings = {"hnsw.ef_search": max(40, n_candidates)}
+    key = make_key(f"segment:rerank:{ann}:{oversample}{suffix}", segment_id, k)
+    return _cached(key, use_cache, lambda: _search(sql, params, conn, settings, context, kind="segment:rerank"), conn)
+
+
+def similar_windows(segment_id: str, k: int = 5, conn=None, use_cache: bool = True) -> list:
+    """
+    Find the k segment windows closest to a segment (L2 distance).
+
+    Windows are runs of consecutive segments built by
+    `python db_insert.py --windows`; the query segment's own window is
+    usually the first hit.
+
+    Returns:
+    --------
+    list of tuples
+        (podcast title, window id, content, start_time, end_time, distance,
+        segment ids), e.g. window '89:112-119' with ['89:112', ..., '89:119']
+    """
+    key = make_key("window", segment_id, k)
+
+    def compute():
+        sql = window_neighbors_sql(WINDOWS_SQL, embeddings_normalized(conn))
+        return _execute(sql, {"segment_id": segment_id, "k": k}, conn, {"hnsw.ef_search": max(40, k)}, "window")
+    return _cached(key, use_cache, compute, conn)
+
+
+def rerank_recall(
+    segment_ids: Sequence[str],
+    k: int = 5,
+    oversample: int = DEFAULT_OVERSAMPLE,
+    ann: str = "vector",
+    conn=None
+) -> dict:
+    """
+    Measure recall@k of mode='rerank' against the exact answer.
+
+    The exact answer comes from mode='exact', whose OFFSET 0 subquery keeps
+    the planner from ordering by an ANN index, so it is a full scan even
+    when one exists. No planner settings are changed.
+
+    Returns:
+    --------
+    dict
+        {'recall': mean recall, 'per_query': {segment_id: recall}}
+    """
+    per_query = {}
+    for segment_id in segment_ids:
+        exact = similar_segments(segment_id, k, conn=conn, use_cache=False, mode="exact")
+        approx = similar_segments(segment_id, k, conn=conn, use_cache=False,
+                                  mode="rerank", oversample=oversample, ann=ann)
+        expected = {row[1] for row in exact}
+        found = {row[1] for row in approx}
+        per_query[segment_id] = len(expected & found) / len(expected) if expected else 1.0
+    recall = sum(per_query.values()) / len(per_query) if per_query else 1.0
+    return {"recall": recall, "per_query": per_query}
+
+
+def similar_episodes_to_segment(
+    segment_id: str,
+    k: int = 5,
+    direction: str = "asc",
+    conn=None,
+    use_cache: bool = True,
+    metric: str = "l2"
+) -> list:
+    """
+    Find the k episodes whose average embedding is closest to a segment (Q5).
+
+    metric is as for similar_segments(); episode averages are always taken
+    over the original (unnormalized) vectors.
+
+    Returns:
+    --------
+    list of tuples
+        (podcast title, distance)
+    """
+    key = make_key("episode_for_segment", segment_id, k, _metric(metric), _order(direction).lower())
+
+    def compute():
+        sql = episode_neighbors_sql(EPISODE_NEIGHBORS_FOR_SEGMENT_SQL, direction, metric, embeddings_normalized(conn))
+        return _execute(sql, {"segment_id": segment_id, "k": k}, conn, kind="episode_for_segment")
+    return _cached(key, use_cache, compute, conn)
+
+
+def similar_episodes(
+    podcast_id: str,
+    k: int = 5,
+    direction: str = "asc",
+    conn=None,
+    use_cache: bool = True,
+    metric: str = "l2"
+) -> list:
+    """
+    Find the k episodes closest to another episode (Q6).
+
+    Both sides use the average of the episode's segment embeddings. The
+    query episode itself is excluded. metric is as for similar_segments().
+
+    Returns:
+    --------
+    list of tuples
+        (podcast title, distance)
+    """
+    key = make_key("episode", podcast_id, k, _metric(metric), _order(direction).lower())
+
+    def compute():
+        sql = episode_neighbors_sql(EPISODE_NEIGHBORS_SQL, direction, metric, embeddings_normalized(conn))
+        return _execute(sql, {"podcast_id": podcast_id, "k": k}, conn, kind="episode")
+    return _cached(key, use_cache, compute, conn)
+
+
+def batch_similar_segments(
+    queries: Sequence[Union[str, Sequence[float]]],
+    k: int = 5,
+    conn=None,
+    use_cache: bool = True
+) -> List[list]:
+    """
+    Run many nearest-segment lookups in a single SQL round-trip.
+
+    Parameters:
+    -----------
+    queries : list
+        Either all segment ids (e.g. ['267:476', '48:511']) or all raw
+        128-dimensional vectors. Segment-id queries exclude the query
+        segment from its own results, like similar_segments().
+        Distances are exact L2 on either storage layout, as for
+        similar_segments(metric='l2').
+    k : int
+        Number of neighbours per query.
+    conn : psycopg2 connection, optional
+        Connection to reuse. A new one is opened if omitted.
+    use_cache : bool
+        Answer cached queries from memory; only the misses go to SQL.
+
+    Returns:
+    --------
+    list of lists
+        One result list per query, in input order. Each row is
+        (podcast title, segment id, content, start_time, end_time, distance).
+
+    Example:
+    --------
+    >>> q1, q3, q4 = batch_similar_segments(['267:476', '48:511', '51:56'])
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+
+    by_id = all(isinstance(q, str) for q in queries)
+    if not by_id and any(isinstance(q, str) for q in queries):
+        raise ValueError("queries must be all segment ids or all vectors, not a mix")
+
+    results = [None] * len(queries)
+    generations = [None] * len(queries)
+    # Not shared with similar_segments() keys: the two are separate queries
+    keys = [make_key("segment:batch", q, k, "l2", "asc") for q in queries]
+    if use_cache:
+        for i, key in enumerate(keys):
+            rows, generations[i] = RESULT_CACHE.lookup(key, conn)
+            if rows is not MISSING:
+                results[i] = list(rows)
+    pending = [i for i, rows in enumerate(results) if rows is None]
+    if not pending:
+        return results
+
+    sql, params, _ = batch_neighbors_query([queries[i] for i in pending], k, embeddings_normalized(conn))
+
+    fetched = [[] for _ in pending]
+    for row in _execute(sql, params, conn, kind="batch:segment" if by_id else "batch:vector"):
+        fetched[row[0] - 1].append(row[1:])
+    for i, rows in zip(pending, fetched):
+        results[i] = rows
+        if use_cache:
+            RESULT_CACHE.put(keys[i], rows, conn, generations[i])
+    return list(results)
+
+
+# =============================================================================
+# Filtered search
+# =============================================================================
+def _filter_sql(podcast_ids: Optional[Sequence[str]], time_range: Optional[tuple]) -> Tuple[str, dict]:
+    """Build the AND-list and parameters for a podcast/time filter."""
+    clauses, params = [], {}
+    if podcast_ids is not None:
+        clauses.append("s.podcast_id = ANY(%(filter_podcast_ids)s)")
+        params["filter_podcast_ids"] = list(podcast_ids)
+    if time_range is not None:
+        start, end = time_range
+        if start is not None:
+            clauses.append("s.start_time >= %(filter_start)s")
+            params["filter_start"] = start
+        if end is not None:
+            clauses.append("s.end_time <= %(filter_end)s")
+            params["filter_end"] = end
+    return (" AND ".join(clauses) or "TRUE"), params
+
+
+def estimate_filter_rows(podcast_ids=None, time_range=None, conn=None) -> float:
+    """
+    The planner's estimate of how many segments match a filter.
+
+    Uses EXPLAIN, so it costs a planning round-trip but no scan.
+    """
+    filters, params = _filter_sql(podcast_ids, time_range)
+    rows = _execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM segment s WHERE {filters}", params, conn, kind="estimate")
+    plan = rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Plan"]["Plan Rows"])
+
+
+def iterative_scan_supported(conn=None) -> bool:
+    """
+    Whether the installed pgvector has iterative index scans (0.8.0+).
+
+    Checked once and cached like embeddings_normalized(), rather than by
+    trying the query and rolling back the caller's transaction on error.
+    """
+    def check():
+        rows = _execute(VECTOR_VERSION_SQL, {}, conn, kind="schema")
+        version = tuple(int(part) for part in re.findall(r"\d+", rows[0][0])[:2]) if rows else ()
+        return [version >= ITERATIVE_SCAN_VERSION]
+    return _cached(make_key("schema:iterative_scan", "vector", 0), True, check, conn)[0]
+
+
+def choose_filter_strategy(podcast_ids=None, time_range=None, conn=None) -> str:
+    """
+    Pick how to run a filtered search from the filter's selectivity.
+
+    - 'exact' when few rows match: ranking them all is cheaper than any
+      index walk and is exact by construction.
+    - 'partition' when the filter is a modest list of podcasts: one small
+      exact top-k per podcast, merged.
+    - 'iterative' otherwise: the filter is broad, so walking the HNSW index
+      and skipping non-matching rows finds k results quickly.
+    """
+    if estimate_filter_rows(podcast_ids, time_range, conn) <= EXACT_SCAN_MAX_ROWS:
+        return "exact"
+    if podcast_ids is not None and len(podcast_ids) <= PARTITION_MAX_PODCASTS:
+        return "partition"
+    return "iterative"
+
+
+def filtered_similar_segments(
+    segment_id: str,
+    k: int = 5,
+    podcast_ids: Optional[Sequence[str]] = None,
+    time_range: Optional[tuple] = None,
+    strategy: str = "auto",
+    conn=None,
+    context: int = 0
+) -> list:
+    """
+    Find the k segments closest to a segment, restricted by a filter.
+
+    Unlike adding a WHERE clause to an HNSW query, this always returns k
+    rows (or every matching row, if fewer than k match).
+
+    Parameters:
+    -----------
+    segment_id : str
+        The query segment. It is excluded from the results.
+    k : int
+        Number of segments to return.
+    podcast_ids : list of str, optional
+        Only search these episodes.
+    time_range : (start, end), optional
+        Only segments with start_time >= start and end_time <= end,
+        in seconds. Either bound may be None, e.g. (None, 600) for the
+        first 10 minutes.
+    strategy : str
+        'auto' (pick from the estimated selectivity), 'exact',
+        'partition' (needs podcast_ids) or 'iterative'.
+    conn : psycopg2 connection, optional
+        Connection to reuse. A new one is opened if omitted.
+    context : int
+        Neighbouring segments to return around each hit, as for
+        similar_segments(). The window is not filtered.
+
+    Returns:
+    --------
+    list of tuples
+        (podcast title, segment id, content, start_time, end_time, distance),
+        or (hit, window) pairs with context > 0.
+
+    Example:
+    --------
+    >>> filtered_similar_segments('267:476', podcast_ids=['VeH7qKZr0WI'])
+    >>> filtered_similar_segments('48:511', time_range=(None, 600))
+    """
+    if strategy not in FILTER_STRATEGIES:
+        raise ValueError(f"strategy must be one of {FILTER_STRATEGIES}, got {strategy!r}")
+    _context(context)
+    if podcast_ids is None and time_range is None:
+        return similar_segments(segment_id, k, conn=conn, mode="exact", context=context)
+
+    if strategy == "auto":
+        strategy = choose_filter_strategy(podcast_ids, time_range, conn)
+    if strategy == "partition" and podcast_ids is None:
+        raise ValueError("strategy='partition' needs podcast_ids")
+
+    filters, params = _filter_sql(podcast_ids, time_range)
+    params.update({"segment_id": segment_id, "k": k})
+
+    if strategy == "partition":
+        # The podcast list drives the LATERAL; only the time filter stays inline
+        filters, _ = _filter_sql(None, time_range)
+        params["podcast_ids"] = list(podcast_ids)
+        return _search(FILTERED_PARTITION_SQL.format(filters=filters), params, conn,
+                       context=context, kind="filtered:partition")
+
+    if strategy == "iterative":
+        settings = {
+            "hnsw.iterative_scan": "strict_order",
+            "hnsw.max_scan_tuples": ITERATIVE_MAX_SCAN_TUPLES,
+        }
+        # pgvector older than 0.8 has no iterative scans: go straight to the
+        # exact scan. Any other error is the caller's to see.
+        if iterative_scan_supported(conn):
+            rows = _search(FILTERED_ITERATIVE_SQL.format(filters=filters), params, conn, settings, context,
+                           kind="filtered:iterative")
+            if len(rows) == k:
+                return rows
+        # The scan hit max_scan_tuples first; the exact scan can't come up short
+
+    return _search(FILTERED_EXACT_SQL.format(filters=filters), params, conn,
+                   context=context, kind="filtered:exact")
+
+
+# =============================================================================
+# Streaming
+# =============================================================================
+def segments_within(segment_id: str, radius: float, conn=None, batch_size: int = 2000):
+    """
+    Yield every segment within L2 distance `radius` of a segment.
+
+    The number of matches isn't known in advance, so rows are streamed
+    through a server-side cursor (in no particular order) instead of
+    fetched all at once.
+
+    Yields:
+    -------
+    tuples of (segment id, start_time, end_time, content, distance)
+    """
+    params = {"segment_id": segment_id, "radius": radius}
+    yield from stream_query(RADIUS_SQL, params, batch_size=batch_size, conn=conn)
+
+
+def episode_segments(podcast_id: str, conn=None, batch_size: int = 2000):
+    """
+    Yield an episode's segments, in order, as NumPy blocks.
+
+    Yields:
+    -------
+    dicts with 'id', 'start_time', 'end_time', 'content' arrays and an
+    'embedding' array of shape (rows, 128)
+    """
+    yield from stream_query(EPISODE_SEGMENTS_SQL, {"podcast_id": podcast_id},
+                            batch_size=batch_size, numpy=True, conn=conn)
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def main(argv: Optional[List[str]] = None) -> int:
+    segment_ids = list(argv if argv is not None else sys.argv[1:])
+    if segment_ids[:1] == ["--recall"] and len(segment_ids) > 2:
+        oversample = int(segment_ids[1])
+        result = rerank_recall(segment_ids[2:], oversample=oversample)
+        print(f"📏 Re-rank recall@5 with oversample={oversample}")
+        for segment_id, recall in result["per_query"].items():
+            print(f"   {segment_id:>10}  {recall:.2f}")
+        print(f"   {'mean':>10}  {result['recall']:.3f}")
+        return 0
+    if not segment_ids or segment_ids[0].startswith("--"):
+        print("Usage: python search.py <segment_id> [<segment_id> ...]")
+        print("       python search.py --recall <oversample> <segment_id> [...]")
+        return 1
+
+    print(f"🔍 Searching {len(segment_ids)} segment(s) in one query...")
+    for segment_id, rows in zip(segment_ids, batch_similar_segments(segment_ids)):
+        print(f"\n{'='*60}")
+        print(f"📊 5 most similar segments to '{segment_id}'")
+        print('='*60)
+        for i, row in enumerate(rows, 1):
+            print(f"\n{i}. {row}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+search_async.py - Asyncio version of the search functions in search.py.
+
+Uses asyncpg with a connection pool so many similarity queries can be in
+flight at once from a single process. The SQL is shared with search.py;
+only the parameter style is converted ($1, $2, ... for asyncpg).
+
+    async with AsyncSearch() as engine:
+        q1, q3, q4 = await asyncio.gather(
+            engine.similar_segments("267:476"),
+            engine.similar_segments("48:511"),
+            engine.similar_segments("51:56"),
+        )
+
+Running this file executes the Q1-Q6 queries from db_query.py concurrently
+instead of one after another.
+
+Usage:
+    python search_async.py
+"""
+
+import re
+import sys
+import time
+import asyncio
+import asyncpg
+from typing import List, Optional, Sequence, Tuple, Union
+
+import search
+from search import CONNECTION
+
+_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+def to_asyncpg(sql: str) -> Tuple[str, List[str]]:
+    """
+    Convert a psycopg2-style query with %(name)s placeholders to asyncpg's
+    positional $n style.
+
+    Returns the converted SQL and the parameter names in positional order.
+    A name used more than once maps to the same $n.
+    """
+    names: List[str] = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _PARAM.sub(replace, sql), names
+
+
+class AsyncSearch:
+    """
+    Pooled async query engine with the same functions as search.py.
+
+    Parameters:
+    -----------
+    dsn : str
+        Connection string. Defaults to the one in utils.py.
+    min_size, max_size : int
+        Connection pool bounds. max_size caps how many queries run at once.
+    """
+
+    def __init__(self, dsn: str = CONNECTION, min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool: Optional[asyncpg.Pool] = None
+        self._statements = {}
+        self.normalized = False
+
+    async def open(self) -> "AsyncSearch":
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        # Checked once per pool rather than per query as search.py does
+        self.normalized = await self.pool.fetchval(search.NORM_COLUMN_SQL)
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self) -> "AsyncSearch":
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _fetch(self, sql: str, params: dict) -> list:
+        """Run a psycopg2-style query through the pool and return tuples."""
+        if sql not in self._statements:
+            self._statements[sql] = to_asyncpg(sql)
+        converted, names = self._statements[sql]
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(converted, *(params[name] for name in names))
+        return [tuple(row) for row in rows]
+
+    async def run_query(self, query: str) -> list:
+        """Execute raw SQL (no parameters) and return all rows."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query)
+        return [tuple(row) for row in rows]
+
+    async def similar_segments(self, segment_id: str, k: int = 5, direction: str = "asc", metric: str = "l2") -> list:
+        """Async version of search.similar_segments() (mode='index')."""
+        sql = search.segment_neighbors_sql(direction, metric, self.normalized)
+        return await self._fetch(sql, {"segment_id": segment_id, "k": k})
+
+    async def similar_episodes_to_segment(self, segment_id: str, k: int = 5, direction: str = "asc", metric: str = "l2") -> list:
+        """Async version of search.similar_episodes_to_segment()."""
+        sql = search.episode_neighbors_sql(search.EPISODE_NEIGHBORS_FOR_SEGMENT_SQL, direction, metric, self.normalized)
+        return await self._fetch(sql, {"segment_id": segment_id, "k": k})
+
+    async def similar_episodes(self, podcast_id: str, k: int = 5, direction: str = "asc", metric: str = "l2") -> list:
+        """Async version of search.similar_episodes()."""
+        sql = search.episode_neighbors_sql(search.EPISODE_NEIGHBORS_SQL, direction, metric, self.normalized)
+        return await self._fetch(sql, {"podcast_id": podcast_id, "k": k})
+
+    async def batch_similar_segments(
+        self,
+        queries: Sequence[Union[str, Sequence[float]]],
+        k: int = 5
+    ) -> List[list]:
+        """Async version of search.batch_similar_segments()."""
+        queries = list(queries)
+        if not queries:
+            return []
+
+        sql, params, _ = search.batch_neighbors_query(queries, k, self.normalized)
+        results = [[] for _ in queries]
+        for row in await self._fetch(sql, params):
+            results[row[0] - 1].append(row[1:])
+        return results
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+async def run_all(queries: List[Tuple[str, str]], max_size: int = 10) -> List[list]:
+    """Run (sql, description) pairs concurrently and print them in order."""
+    async with AsyncSearch(max_size=max_size) as engine:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(engine.run_query(sql) for sql, _ in queries))
+        elapsed = time.perf_counter() - start
+
+    for (_, description), rows in zip(queries, results):
+        print(f"\n{'='*60}")
+        print(f"📊 {description}")
+        print('='*60)
+        for i, row in enumerate(rows, 1):
+            print(f"\n{i}. {row}")
+
+    print(f"\n⏱️  {len(queries)} queries finished in {elapsed:.2f}s (run concurrently)")
+    return results
+
+
+def main() -> int:
+    import db_query
+
+    queries = [
+        (db_query.Q1_SIMILAR, "Q1: 5 most similar segments to '267:476' (alien life)"),
+        (db_query.Q2_DISSIMILAR, "Q2: 5 most dissimilar segments to '267:476'"),
+        (db_query.Q3_NEURAL, "Q3: 5 most similar segments to '48:511' (neural networks)"),
+        (db_query.Q4_PHYSICS, "Q4: 5 most similar segments to '51:56' (dark energy)"),
+        (db_query.Q5A_EPISODE, "Q5a: 5 most similar episodes to segment '267:476'"),
+        (db_query.Q5B_EPISODE, "Q5b: 5 most similar episodes to segment '48:511'"),
+        (db_query.Q5C_EPISODE, "Q5c: 5 most similar episodes to segment '51:56'"),
+        (db_query.Q6_BALAJI, "Q6: 5 most similar episodes to 'VeH7qKZr0WI' (Balaji)"),
+    ]
+    queries = [(sql, description) for sql, description in queries if sql.strip()]
+    if not queries:
+        print("⚠️  No queries implemented in db_query.py yet")
+        return 1
+
+    print(f"🔍 Running {len(queries)} semantic search queries concurrently...")
+    asyncio.run(run_all(queries))
+    print("\n" + "="*60)
+    print("✅ Query execution complete!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
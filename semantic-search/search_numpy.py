@@ -0,0 +1,445 @@
+"""
+search_numpy.py - In-process exact search over the embeddings with NumPy.
+
+832k x 128 float32 embeddings are only ~426 MB, so exact top-k can be done
+with a blocked matrix multiply and argpartition without a database
+round-trip. NumpySearch has the same functions as search.py and returns
+rows in the same shape:
+
+    backend = NumpySearch()
+    backend.similar_segments("267:476")            # Q1 (direction="desc" for Q2)
+    backend.similar_episodes_to_segment("48:511")  # Q5
+    backend.similar_episodes("VeH7qKZr0WI")        # Q6
+
+The data is exported from the database once (python search_numpy.py export)
+into flat .npy files that are memory-mapped on load. Distances are computed
+block by block, so only one block of embeddings needs to be in RAM at a time
+and the matrix can be larger than memory.
+
+Layout of the export directory (segments ordered by podcast, then by
+segment number, so each episode is one contiguous slice):
+    embeddings.npy        float32 (N, 128)
+    sq_norms.npy          float32 (N,)     squared L2 norm of each row
+    segment_ids.npy       str     (N,)
+    start_time.npy        float64 (N,)
+    end_time.npy          float64 (N,)
+    content.bin           utf-8 text of all segments back to back
+    content_offsets.npy   int64   (N + 1,) byte offsets into content.bin
+    episode_offsets.npy   int64   (E + 1,) row offsets of each episode
+    podcasts.json         [[podcast_id, title], ...] in episode order
+
+Usage:
+    python search_numpy.py export     # dump embeddings from the database
+    python search_numpy.py verify     # check results match search.py (SQL)
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+NUMPY_DIR = Path(os.path.dirname(__file__)) / "data" / "numpy"
+DIMENSIONS = 128
+
+# Rows per block in the distance scan (65536 x 128 float32 = 32 MB)
+BLOCK_ROWS = 65536
+
+# Extra candidates kept per block before the exact float64 re-rank, so
+# float32 rounding in the matmul can't push a true neighbour out of the top-k
+RERANK_MARGIN = 8
+
+EXPORT_SEGMENTS_SQL = """
+SELECT s.id, s.podcast_id, s.start_time, s.end_time, s.content, ({embedding})::real[] AS embedding
+FROM segment s
+ORDER BY s.podcast_id, split_part(s.id, ':', 2)::int
+"""
+
+EXPORT_PODCASTS_SQL = "SELECT id, title FROM podcast ORDER BY id"
+
+# The Q1-Q6 inputs from db_query.py, used by verify
+QUERY_SEGMENTS = ["267:476", "48:511", "51:56"]
+QUERY_PODCAST = "VeH7qKZr0WI"
+
+
+# =============================================================================
+# Export from PostgreSQL
+# =============================================================================
+def export_embeddings(out_dir: Path = NUMPY_DIR, connection_string: str = None, batch_size: int = 10000):
+    """
+    Dump all segments from the database into the memory-mappable layout
+    described at the top of this file.
+
+    Rows are streamed with a server-side cursor and written straight into
+    a memory-mapped .npy file, so the export itself never holds the whole
+    embedding matrix in memory.
+    """
+    import psycopg2
+    from utils import get_connection_string, stream_query
+    from search import NORM_COLUMN_SQL, ORIGINAL_EMBEDDING
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = psycopg2.connect(connection_string or get_connection_string())
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT count(*) FROM segment")
+            n = c.fetchone()[0]
+            c.execute(EXPORT_PODCASTS_SQL)
+            podcasts = c.fetchall()
+            c.execute(NORM_COLUMN_SQL)
+            normalized = c.fetchone()[0]
+        podcast_index = {podcast_id: i for i, (podcast_id, _) in enumerate(podcasts)}
+
+        embeddings = np.lib.format.open_memmap(
+            out_dir / "embeddings.npy", mode="w+", dtype=np.float32, shape=(n, DIMENSIONS)
+        )
+        segment_ids = np.empty(n, dtype="U16")
+        start_time = np.empty(n, dtype=np.float64)
+        end_time = np.empty(n, dtype=np.float64)
+        episode_of_row = np.empty(n, dtype=np.int32)
+        content_offsets = np.zeros(n + 1, dtype=np.int64)
+
+        row = 0
+        offset = 0
+        with open(out_dir / "content.bin", "wb") as content_file:
+            # Always export the original vectors, even if normalized at ingest
+            sql = EXPORT_SEGMENTS_SQL.format(embedding=ORIGINAL_EMBEDDING[normalized])
+            for block in stream_query(sql, batch_size=batch_size, numpy=True, conn=conn):
+                end = row + len(block["id"])
+                segment_ids[row:end] = block["id"]
+                episode_of_row[row:end] = [podcast_index[p] for p in block["podcast_id"]]
+                start_time[row:end] = block["start_time"]
+                end_time[row:end] = block["end_time"]
+                embeddings[row:end] = block["embedding"]
+                for i, text in enumerate(block["content"], row + 1):
+                    data = (text or "").encode("utf-8")
+                    content_file.write(data)
+                    offset += len(data)
+                    content_offsets[i] = offset
+                row = end
+                print(f"\r   {row:,} / {n:,} segments", end="", flush=True)
+        print()
+    finally:
+        conn.close()
+
+    embeddings.flush()
+    sq_norms = np.empty(n, dtype=np.float32)
+    for start in range(0, n, BLOCK_ROWS):
+        block = np.asarray(embeddings[start:start + BLOCK_ROWS], dtype=np.float64)
+        sq_norms[start:start + BLOCK_ROWS] = np.einsum("ij,ij->i", block, block)
+
+    # Rows are sorted by podcast, so each episode is a contiguous slice
+    counts = np.bincount(episode_of_row, minlength=len(podcasts))
+    episode_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    np.save(out_dir / "sq_norms.npy", sq_norms)
+    np.save(out_dir / "segment_ids.npy", segment_ids)
+    np.save(out_dir / "start_time.npy", start_time)
+    np.save(out_dir / "end_time.npy", end_time)
+    np.save(out_dir / "content_offsets.npy", content_offsets)
+    np.save(out_dir / "episode_offsets.npy", episode_offsets)
+    with open(out_dir / "podcasts.json", "w") as f:
+        json.dump([list(p) for p in podcasts], f)
+
+    print(f"✅ Exported {n:,} segments from {len(podcasts)} podcasts to {out_dir}")
+
+
+# =============================================================================
+# Search backend
+# =============================================================================
+class NumpySearch:
+    """
+    Exact in-process search with the same functions as search.py.
+
+    Parameters:
+    -----------
+    data_dir : Path
+        Directory written by export_embeddings().
+    mmap : bool
+        Memory-map the embedding matrix instead of reading it into RAM.
+    block_rows : int
+        Rows scored per matrix multiply. Bounds peak memory of a scan.
+    index : IVFIndex, optional
+        Index from ivf_index.py. Nearest-segment queries use it for
+        approximate search; furthest-segment queries use its cluster bounds
+        to prune the exact scan.
+    nprobe : int
+        Lists the index scans per query.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path = NUMPY_DIR,
+        mmap: bool = True,
+        block_rows: int = BLOCK_ROWS,
+        index=None,
+        nprobe: int = 16
+    ):
+        data_dir = Path(data_dir)
+        if not (data_dir / "embeddings.npy").exists():
+            raise FileNotFoundError(
+                f"No exported embeddings in {data_dir}. Run 'python search_numpy.py export' first."
+            )
+        mode = "r" if mmap else None
+        self.block_rows = block_rows
+        self.index = index
+        self.nprobe = nprobe
+        self.embeddings = np.load(data_dir / "embeddings.npy", mmap_mode=mode)
+        self.sq_norms = np.load(data_dir / "sq_norms.npy")
+        self.segment_ids = np.load(data_dir / "segment_ids.npy")
+        self.start_time = np.load(data_dir / "start_time.npy", mmap_mode=mode)
+        self.end_time = np.load(data_dir / "end_time.npy", mmap_mode=mode)
+        self.content = np.memmap(data_dir / "content.bin", dtype=np.uint8, mode="r") \
+            if os.path.getsize(data_dir / "content.bin") else np.empty(0, dtype=np.uint8)
+        self.content_offsets = np.load(data_dir / "content_offsets.npy", mmap_mode=mode)
+        self.episode_offsets = np.load(data_dir / "episode_offsets.npy")
+        with open(data_dir / "podcasts.json") as f:
+            podcasts = json.load(f)
+        self.podcast_ids = [p[0] for p in podcasts]
+        self.titles = [p[1] for p in podcasts]
+        self.episode_of_row = np.repeat(
+            np.arange(len(podcasts), dtype=np.int32), np.diff(self.episode_offsets)
+        )
+
+        # Sorted view of the ids for O(log n) id -> row lookups
+        self._id_order = np.argsort(self.segment_ids)
+        self._sorted_ids = self.segment_ids[self._id_order]
+        self._podcast_row = {podcast_id: i for i, podcast_id in enumerate(self.podcast_ids)}
+        self._episode_means = None
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+    def row_of(self, segment_id: str) -> int:
+        """Return the row index of a segment id."""
+        pos = np.searchsorted(self._sorted_ids, segment_id)
+        if pos >= len(self._sorted_ids) or self._sorted_ids[pos] != segment_id:
+            raise KeyError(f"Unknown segment id {segment_id!r}")
+        return int(self._id_order[pos])
+
+    def vector_of(self, segment_id: str) -> np.ndarray:
+        return np.asarray(self.embeddings[self.row_of(segment_id)], dtype=np.float32)
+
+    def content_of(self, row: int) -> str:
+        start, end = self.content_offsets[row], self.content_offsets[row + 1]
+        return self.content[start:end].tobytes().decode("utf-8")
+
+    def segment_row(self, row: int, distance: float) -> tuple:
+        """Format a hit like search.similar_segments() does."""
+        return (
+            self.titles[self.episode_of_row[row]],
+            str(self.segment_ids[row]),
+            self.content_of(row),
+            float(self.start_time[row]),
+            float(self.end_time[row]),
+            float(distance),
+        )
+
+    @property
+    def episode_means(self) -> np.ndarray:
+        """Average embedding of each episode, computed once on first use."""
+        if self._episode_means is None:
+            means = np.full((len(self.podcast_ids), self.embeddings.shape[1]), np.nan, dtype=np.float32)
+            for e, (start, end) in enumerate(zip(self.episode_offsets[:-1], self.episode_offsets[1:])):
+                if end > start:
+                    # Accumulate in float64 and round to float32, like pgvector's AVG
+                    means[e] = self.embeddings[start:end].mean(axis=0, dtype=np.float64)
+            self._episode_means = means
+        return self._episode_means
+
+    # -------------------------------------------------------------------------
+    # Core top-k
+    # -------------------------------------------------------------------------
+    def topk(
+        self,
+        queries: np.ndarray,
+        k: int,
+        largest: bool = False,
+        exclude: Optional[Sequence[int]] = None
+    ) -> List[tuple]:
+        """
+        Exact top-k rows by L2 distance for each row of `queries`.
+
+        The scan is blocked: each block of embeddings is scored against all
+        queries with one matrix multiply using ||x||^2 - 2 x.q + ||q||^2, and
+        only the best k + RERANK_MARGIN rows per block are kept. Survivors are
+        then re-scored exactly in float64.
+
+        Parameters:
+        -----------
+        queries : np.ndarray
+            (m, d) query vectors.
+        k : int
+            Results per query.
+        largest : bool
+            Return the furthest rows instead of the nearest.
+        exclude : list of int, optional
+            One row index per query to leave out (or -1 for none).
+
+        Returns:
+        --------
+        list of (rows, distances) tuples, one per query, best first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        m = queries.shape[0]
+        n = len(self)
+        exclude = np.full(m, -1) if exclude is None else np.asarray(exclude)
+        q_sq = np.einsum("ij,ij->i", queries, queries)
+        keep = min(n, k + RERANK_MARGIN)
+
+        candidates = []
+        for start in range(0, n, self.block_rows):
+            block = np.asarray(self.embeddings[start:start + self.block_rows])
+            scores = self.sq_norms[start:start + len(block), None] - 2.0 * (block @ queries.T) + q_sq
+            if largest:
+                scores = -scores
+            for j in np.nonzero((exclude >= start) & (exclude < start + len(block)))[0]:
+                scores[exclude[j] - start, j] = np.inf
+            take = min(keep, len(block))
+            if take < len(block):
+                part = np.argpartition(scores, take - 1, axis=0)[:take]
+            else:
+                part = np.broadcast_to(np.arange(len(block))[:, None], scores.shape)
+            candidates.append(part + start)
+
+        candidates = np.concatenate(candidates, axis=0)
+        results = []
+        for j in range(m):
+            rows = np.sort(candidates[:, j])
+            if exclude[j] >= 0:
+                rows = rows[rows != exclude[j]]
+            diff = np.asarray(self.embeddings[rows], dtype=np.float64) - queries[j]
+            dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            order = np.argsort(-dist if largest else dist, kind="stable")[:k]
+            results.append((rows[order], dist[order]))
+        return results
+
+    def _episode_topk(self, query: np.ndarray, k: int, largest: bool, exclude: int = -1) -> list:
+        means = self.episode_means
+        valid = ~np.isnan(means[:, 0])
+        if exclude >= 0:
+            valid[exclude] = False
+        episodes = np.nonzero(valid)[0]
+        diff = means[episodes].astype(np.float64) - query.astype(np.float64)
+        dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        order = np.argsort(-dist if largest else dist, kind="stable")[:k]
+        return [(self.titles[episodes[i]], float(dist[i])) for i in order]
+
+    # -------------------------------------------------------------------------
+    # Same API as search.py
+    # -------------------------------------------------------------------------
+    def similar_segments(self, segment_id: str, k: int = 5, direction: str = "asc") -> list:
+        """In-process version of search.similar_segments()."""
+        row = self.row_of(segment_id)
+        largest = _largest(direction)
+        if self.index is not None and largest:
+            rows, dist = self.index.search_farthest(self.embeddings[row], k, exclude=row)
+        elif self.index is not None:
+            rows, dist = self.index.search(self.embeddings[row], k, nprobe=self.nprobe, exclude=row)
+        else:
+            (rows, dist), = self.topk(self.embeddings[row], k, largest=largest, exclude=[row])
+        return [self.segment_row(r, d) for r, d in zip(rows, dist)]
+
+    def similar_episodes_to_segment(self, segment_id: str, k: int = 5, direction: str = "asc") -> list:
+        """In-process version of search.similar_episodes_to_segment()."""
+        return self._episode_topk(self.vector_of(segment_id), k, _largest(direction))
+
+    def similar_episodes(self, podcast_id: str, k: int = 5, direction: str = "asc") -> list:
+        """In-process version of search.similar_episodes()."""
+        episode = self._podcast_row[podcast_id]
+        return self._episode_topk(self.episode_means[episode], k, _largest(direction), exclude=episode)
+
+    def batch_similar_segments(self, queries: Sequence[Union[str, Sequence[float]]], k: int = 5) -> List[list]:
+        """In-process version of search.batch_similar_segments()."""
+        queries = list(queries)
+        if not queries:
+            return []
+        if all(isinstance(q, str) for q in queries):
+            exclude = [self.row_of(q) for q in queries]
+            vectors = self.embeddings[np.array(exclude)]
+        elif not any(isinstance(q, str) for q in queries):
+            exclude = None
+            vectors = np.asarray(queries, dtype=np.float32)
+        else:
+            raise ValueError("queries must be all segment ids or all vectors, not a mix")
+        return [
+            [self.segment_row(r, d) for r, d in zip(rows, dist)]
+            for rows, dist in self.topk(vectors, k, exclude=exclude)
+        ]
+
+
+def _largest(direction: str) -> bool:
+    direction = direction.lower()
+    if direction not in ("asc", "desc"):
+        raise ValueError(f"direction must be 'asc' or 'desc', got {direction!r}")
+    return direction == "desc"
+
+
+# =============================================================================
+# Verification against SQL
+# =============================================================================
+def verify(backend: NumpySearch, tolerance: float = 1e-4) -> bool:
+    """
+    Run Q1-Q6 through both search.py (SQL) and the NumPy backend and check
+    they return the same rows with distances within `tolerance`.
+    """
+    import search
+
+    checks = []
+    for segment_id in QUERY_SEGMENTS:
+        checks.append((f"similar_segments({segment_id!r})", "similar_segments", (segment_id,), {}))
+        checks.append((f"similar_episodes_to_segment({segment_id!r})", "similar_episodes_to_segment", (segment_id,), {}))
+    q2 = QUERY_SEGMENTS[0]
+    checks.insert(1, (f"similar_segments({q2!r}, desc)", "similar_segments", (q2,), {"direction": "desc"}))
+    checks.append((f"similar_episodes({QUERY_PODCAST!r})", "similar_episodes", (QUERY_PODCAST,), {}))
+
+    ok = True
+    for label, name, args, kwargs in checks:
+        start = time.perf_counter()
+        expected = getattr(search, name)(*args, use_cache=False, **kwargs)
+        sql_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        actual = getattr(backend, name)(*args, **kwargs)
+        np_ms = (time.perf_counter() - start) * 1000
+
+        same = len(expected) == len(actual) and all(
+            e[:-1] == a[:-1] and abs(e[-1] - a[-1]) <= tolerance
+            for e, a in zip(expected, actual)
+        )
+        ok &= same
+        mark = "✓" if same else "✗"
+        print(f"   {mark} {label:45s} SQL {sql_ms:8.1f} ms   NumPy {np_ms:8.1f} ms")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    command = argv[0] if argv else "verify"
+
+    if command == "export":
+        print("📤 Exporting embeddings from the database...")
+        export_embeddings()
+        return 0
+
+    if command == "verify":
+        print("🔍 Comparing NumPy backend against SQL for Q1-Q6...")
+        backend = NumpySearch()
+        if verify(backend):
+            print("✅ All results match")
+            return 0
+        print("❌ Results differ")
+        return 1
+
+    print("Usage: python search_numpy.py [export|verify]")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+search_service.py - Local HTTP search service with pooled, micro-batched kNN.
+
+A long-running process that answers similarity queries as JSON, so other
+programs don't have to import search.py or open their own connections:
+
+    GET /segments/<segment_id>?k=5            similar segments (Q1 shape)
+    GET /segments/<segment_id>/episodes?k=5   similar episodes (Q5 shape)
+    GET /episodes/<podcast_id>?k=5            similar episodes (Q6 shape)
+    GET /health                               liveness
+    GET /stats                                batching and cache counters
+    GET /metrics                              Prometheus metrics (metrics.py)
+
+The server keeps POOL_SIZE connections open (a psycopg2
+ThreadedConnectionPool) and handles each request on its own thread.
+Segment lookups don't go to the database one by one: the MicroBatcher
+waits up to BATCH_WINDOW_MS for other requests to arrive and answers them
+all with one search.batch_similar_segments() call. Add ?batch=0 to a
+segment request to bypass it and run search.similar_segments() on its own
+(bench_service.py compares the two). Unknown segment and podcast ids get
+a 404.
+
+Usage:
+    python search_service.py
+    python search_service.py --port 8452 --pool 8 --window-ms 2 --no-cache
+    python search_service.py --metrics        # record metrics for /metrics
+    curl localhost:8452/segments/267:476?k=5
+"""
+
+import sys
+import json
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from psycopg2.pool import ThreadedConnectionPool
+
+import search
+import metrics
+from search import CONNECTION
+
+# Configuration
+HOST = "127.0.0.1"
+PORT = 8452
+POOL_SIZE = 8
+BATCH_WINDOW_MS = 2.0   # how long a batch waits for more requests
+MAX_BATCH = 64          # ...or until this many have arrived
+MAX_K = 100
+
+# Only run when a neighbour query comes back empty or with NULL distances
+EXISTS_SQL = {
+    "segment": "SELECT 1 FROM segment WHERE id = %(id)s",
+    "podcast": "SELECT 1 FROM podcast WHERE id = %(id)s",
+}
+
+
+# =============================================================================
+# Request micro-batching
+# =============================================================================
+class MicroBatcher:
+    """
+    Coalesce concurrent similar-segment lookups into batched SQL calls.
+
+    A collector thread takes the first queued request, keeps collecting
+    until `window_ms` has passed or `max_batch` requests are waiting, and
+    hands the batch to a worker. Workers (one per pooled connection) run
+    one batch_similar_segments() call per distinct k in the batch.
+
+    The window only applies while another batch is in flight: a request
+    that arrives when the database is idle goes out straight away (with
+    whatever else is already queued), so light load pays no extra latency.
+
+    Parameters:
+    -----------
+    service : SearchService
+        Supplies pooled connections.
+    window_ms : float
+        Longest a request waits for company. 0 batches only requests that
+        are already queued.
+    max_batch : int
+        Largest batch sent to the database.
+    """
+
+    def __init__(self, service: "SearchService", window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.service = service
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.workers = ThreadPoolExecutor(max_workers=service.pool_size, thread_name_prefix="batch")
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "batches": 0, "largest_batch": 0}
+        self.in_flight = 0
+        self.collector = threading.Thread(target=self._collect, name="batch-collector", daemon=True)
+        self.collector.start()
+
+    def submit(self, segment_id: str, k: int) -> Future:
+        """Queue one lookup; the future resolves to its result rows."""
+        future = Future()
+        self.requests.put((segment_id, k, future))
+        return future
+
+    def close(self):
+        self.requests.put(None)
+        self.collector.join()
+        self.workers.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+        counts["mean_batch"] = round(counts["requests"] / counts["batches"], 2) if counts["batches"] else None
+        return counts
+
+    def _collect(self):
+        while True:
+            first = self.requests.get()
+            if first is None:
+                return
+            batch = [first]
+            with self.lock:
+                busy = self.in_flight > 0
+            deadline = time.monotonic() + (self.window if busy else 0.0)
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Finish this batch, then stop
+                    self.requests.put(None)
+                    break
+                batch.append(item)
+            with self.lock:
+                self.counts["requests"] += len(batch)
+                self.counts["batches"] += 1
+                self.counts["largest_batch"] = max(self.counts["largest_batch"], len(batch))
+                self.in_flight += 1
+            self.workers.submit(self._run, batch)
+
+    def _run(self, batch: list):
+        try:
+            self._run_batch(batch)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _run_batch(self, batch: list):
+        by_k = {}
+        for segment_id, k, future in batch:
+            by_k.setdefault(k, []).append((segment_id, future))
+        for k, items in by_k.items():
+            try:
+                with self.service.connection() as conn:
+                    results = search.batch_similar_segments(
+                        [segment_id for segment_id, _ in items], k, conn=conn, use_cache=self.service.use_cache)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), rows in zip(items, results):
+                future.set_result(rows)
+
+
+# =============================================================================
+# Service
+# =============================================================================
+def segment_json(row: tuple) -> dict:
+    title, segment_id, content, start_time, end_time, distance = row
+    return {"title": title, "id": segment_id, "content": content,
+            "start_time": start_time, "end_time": end_time, "distance": distance}
+
+
+def episode_json(row: tuple) -> dict:
+    title, distance = row
+    return {"title": title, "distance": distance}
+
+
+class SearchService:
+    """
+    Connection pool, micro-batcher and request routing, without the HTTP.
+
+    Parameters:
+    -----------
+    dsn : str
+        Connection string. Defaults to the one in utils.py.
+    pool_size : int
+        Connections opened up front and kept open.
+    window_ms : float
+        MicroBatcher window.
+    use_cache : bool
+        Serve repeated queries from search.py's result cache.
+    """
+
+    def __init__(self, dsn: str = CONNECTION, pool_size: int = POOL_SIZE,
+                 window_ms: float = BATCH_WINDOW_MS, use_cache: bool = True):
+        self.pool_size = pool_size
+        self.use_cache = use_cache
+        self.pool = ThreadedConnectionPool(pool_size, pool_size, dsn)
+        # getconn() raises instead of waiting when the pool is empty
+        self.slots = threading.BoundedSemaphore(pool_size)
+        with self.connection() as conn:
+            search.embeddings_normalized(conn)  # warm the schema check
+        self.batcher = MicroBatcher(self, window_ms)
+        self.started = time.time()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled connection, waiting for one to be free.
+
+        Connections are in autocommit mode, so none sits idle in a
+        transaction between requests.
+        """
+        with self.slots:
+            conn = self.pool.getconn()
+            try:
+                conn.autocommit = True
+                yield conn
+            finally:
+                self.pool.putconn(conn)
+
+    def close(self):
+        self.batcher.close()
+        self.pool.closeall()
+
+    def similar_segments(self, segment_id: str, k: int, batch: bool = True) -> list:
+        """
+        Nearest segments, through the batcher or as a query of its own.
+
+        Unbatched lookups go through search.similar_segments(), one query
+        per request, so it can use an ANN index where the batched SQL
+        always scans exactly.
+        """
+        if batch:
+            return self.batcher.submit(segment_id, k).result()
+        with self.connection() as conn:
+            return search.similar_segments(segment_id, k, conn=conn, use_cache=self.use_cache)
+
+    def exists(self, table: str, row_id: str) -> bool:
+        """Whether `table` ("segment" or "podcast") has a row with this id."""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(EXISTS_SQL[table], {"id": row_id})
+                return cursor.fetchone() is not None
+
+    def unknown(self, table: str, row_id: str, rows: list) -> bool:
+        """
+        Whether rows came back for a segment or podcast id that isn't in `table`.
+
+        The neighbour queries look the query embedding up in a subquery, so
+        an unknown id gives rows with NULL distances (0 on normalized
+        tables, where greatest() skips the NULL) or none, rather than an
+        error. Only then is the table checked.
+        """
+        return (not rows or not rows[0][-1]) and not self.exists(table, row_id)
+
+    def similar_episodes_to_segment(self, segment_id: str, k: int) -> list:
+        with self.connection() as conn:
+            return search.similar_episodes_to_segment(segment_id, k, conn=conn, use_cache=self.use_cache)
+
+    def similar_episodes(self, podcast_id: str, k: int) -> list:
+        with self.connection() as conn:
+            return search.similar_episodes(podcast_id, k, conn=conn, use_cache=self.use_cache)
+
+    def handle(self, url: str) -> tuple:
+        """
+        Answer one GET request.
+
+        Returns:
+        --------
+        (int, dict)
+            HTTP status and JSON body.
+        """
+        parts = urlsplit(url)
+        path = [unquote(p) for p in parts.path.strip("/").split("/") if p]
+        query = parse_qs(parts.query)
+        try:
+            k = int(query.get("k", ["5"])[0])
+        except ValueError:
+            return 400, {"error": "k must be an integer"}
+        if not 1 <= k <= MAX_K:
+            return 400, {"error": f"k must be between 1 and {MAX_K}"}
+        batch = query.get("batch", ["1"])[0] != "0"
+
+        if path == ["health"]:
+            return 200, {"status": "ok", "uptime_s": round(time.time() - self.started, 1)}
+        if path == ["stats"]:
+            return 200, {"batching": self.batcher.stats(), "cache": search.cache_stats()}
+        if len(path) == 2 and path[0] == "segments":
+            rows = self.similar_segments(path[1], k, batch)
+            if self.unknown("segment", path[1], rows):
+                return 404, {"error": f"no such segment: {path[1]}"}
+            return 200, {"segment_id": path[1], "k": k, "results": [segment_json(r) for r in rows]}
+        if len(path) == 3 and path[0] == "segments" and path[2] == "episodes":
+            rows = self.similar_episodes_to_segment(path[1], k)
+            if self.unknown("segment", path[1], rows):
+                return 404, {"error": f"no such segment: {path[1]}"}
+            return 200, {"segment_id": path[1], "k": k, "results": [episode_json(r) for r in rows]}
+        if len(path) == 2 and path[0] == "episodes":
+            rows = self.similar_episodes(path[1], k)
+            if self.unknown("podcast", path[1], rows):
+                return 404, {"error": f"no such podcast: {path[1]}"}
+            return 200, {"podcast_id": path[1], "k": k, "results": [episode_json(r) for r in rows]}
+        return 404, {"error": f"no such endpoint: {parts.path}"}
+
+
+# =============================================================================
+# HTTP
+# =============================================================================
+class SearchHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse one TCP connection per thread
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK (~40 ms) on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/metrics":
+            status, content_type, payload = 200, "text/plain; version=0.0.4", metrics.render().encode()
+        else:
+            try:
+                status, body = self.server.service.handle(self.path)
+            except Exception as e:
+                status, body = 500, {"error": str(e).strip()}
+            content_type, payload = "application/json", json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would dominate the output under load
+
+
+class SearchServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connection attempts when many
+    # clients connect at once, and each retry costs a 1 s SYN timeout
+    request_queue_size = 128
+
+    def __init__(self, address: tuple, service: SearchService):
+        super().__init__(address, SearchHandler)
+        self.service = service
+
+
+def serve(host: str = HOST, port: int = PORT, service: Optional[SearchService] = None) -> SearchServer:
+    """
+    Start a server on a background thread and return it.
+
+    Port 0 picks a free port (see server.server_address). Call
+    server.shutdown() and server.service.close() to stop it.
+    """
+    server = SearchServer((host, port), service or SearchService())
+    threading.Thread(target=server.serve_forever, name="search-server", daemon=True).start()
+    return server
+
+
+# =============================================================================
+# Main execution
+# =============================================================================
+def parse_args(argv: list) -> dict:
+    args = {"host": HOST, "port": PORT, "pool_size": POOL_SIZE, "window_ms": BATCH_WINDOW_MS, "use_cache": True,
+            "metrics": False}
+    argv = list(argv)
+    while argv:
+        flag = argv.pop(0)
+        if flag == "--no-cache":
+            args["use_cache"] = False
+        elif flag == "--metrics":
+            args["metrics"] = True
+        elif flag == "--host" and argv:
+            args["host"] = argv.pop(0)
+        elif flag == "--port" and argv:
+            args["port"] = int(argv.pop(0))
+        elif flag == "--pool" and argv:
+            args["pool_size"] = int(argv.pop(0))
+        elif flag == "--window-ms" and argv:
+            args["window_ms"] = float(argv.pop(0))
+        else:
+            raise SystemExit(__doc__)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    if args["metrics"]:
+        metrics.enable()
+    service = SearchService(pool_size=args["pool_size"], window_ms=args["window_ms"], use_cache=args["use_cache"])
+    server = SearchServer((args["host"], args["port"]), service)
+    host, port = server.server_address[:2]
+    print(f"🔍 Search service on http://{host}:{port} "
+          f"({args['pool_size']} connections, {args['window_ms']} ms batch window"
+          f"{', no cache' if not args['use_cache'] else ''}"
+          f"{', metrics on' if metrics.ENABLED else ''})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⚠️  Shutting down")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
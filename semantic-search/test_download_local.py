@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+test_download_local.py - Test download_data.py against a local HTTP server.
+
+Starts LocalFileServer, a stand-in for the GitHub release that serves
+random bytes with HTTP Range support, optional per-connection bandwidth
+limits and injected connection drops, then checks that download_data.py:
+
+1. Downloads a file intact over several segments
+2. Is faster with parallel segments when each connection is throttled
+3. Retries dropped connections from where they broke off
+4. Resumes an interrupted download without fetching finished bytes again
+5. Falls back to one plain GET when the server ignores Range
+6. Syncs extracted files against the manifest, fetching only the archive
+   members that are missing, damaged or changed
+7. Races mirrors of different speeds, picks the fastest, ignores one
+   serving a different file, and fails over mid-download when the fast
+   one dies, without downloading finished bytes again
+
+No network access needed. Everything, including the local_results.json
+report, is written to a fresh temporary directory, not the source tree.
+
+Usage:
+    python test_download_local.py
+"""
+
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import io
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import download_data
+
+# Configuration
+FILE_MB = 24
+THROTTLE_MB_S = 8           # per connection, for the speed test
+SEGMENTS = 4
+
+
+# =============================================================================
+# Local stand-in server
+# =============================================================================
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        data = server.files.get(self.path.split("?")[0])
+        if data is None:
+            self.send_error(404)
+            return
+        start, end = 0, len(data)
+        requested = self.headers.get("Range", "")
+        partial = server.ranges and requested.startswith("bytes=")
+        if partial:
+            first, _, last = requested[len("bytes="):].partition("-")
+            start, end = int(first), min(int(last) + 1 if last else len(data), len(data))
+        self.send_response(206 if partial else 200)
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        with server.lock:
+            server.requests += 1
+            drop = server.drops > 0 and end - start > 1
+            if drop:
+                server.drops -= 1
+        # A dropped response stops after drop_after bytes
+        limit = min(end, start + server.drop_after) if drop else end
+        began = time.perf_counter()
+        position = start
+        while position < limit:
+            with server.lock:
+                budget = server.budget
+                if budget is not None:
+                    if budget <= 0:
+                        break
+                    server.budget -= min(64 * 1024, limit - position)
+            piece = data[position:min(position + 64 * 1024, limit)]
+            try:
+                self.wfile.write(piece)
+            except OSError:
+                return
+            position += len(piece)
+            with server.lock:
+                server.bytes_sent += len(piece)
+            if server.rate:
+                # Stay at or below `rate` bytes/s on this connection
+                ahead = (position - start) / server.rate - (time.perf_counter() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+        if position < end:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalFileServer(ThreadingHTTPServer):
+    """
+    Serve byte strings at fixed paths, like a release download server.
+
+    Parameters:
+    -----------
+    files : dict
+        path -> bytes, e.g. {"/embeddings.zip": b"..."}.
+    rate : float
+        Bytes/s per connection (0 = unlimited).
+    ranges : bool
+        Honour Range headers (answer 206) or always send the whole file.
+    """
+    daemon_threads = True
+
+    def __init__(self, files: dict, rate: float = 0, ranges: bool = True):
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.files = files
+        self.rate = rate
+        self.ranges = ranges
+        self.etag = '"%s"' % hashlib.md5(b"".join(files.values())).hexdigest()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.drops = 0            # how many responses to cut short...
+        self.drop_after = 0       # ...after this many bytes
+        self.budget = None        # total bytes to send before hanging up on everyone
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up mid-response are part of the tests
+
+    def publish(self, path: str, data: bytes):
+        """Replace (or add) a file, with a new ETag."""
+        self.files[path] = data
+        self.etag = '"%s"' % hashlib.md5(data).hexdigest()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# =============================================================================
+# Tests
+# =============================================================================
+class LocalDownloadTester:
+    def __init__(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_download_local_"))
+        self.work_dir = self.test_dir / "local"
+        self.data = random.Random(452).randbytes(FILE_MB * 1024 ** 2)
+        self.report = {
+            "timestamp": datetime.now().isoformat(),
+            "file_mb": FILE_MB,
+            "segments": SEGMENTS,
+            "tests": {},
+        }
+
+    def fresh_dir(self) -> Path:
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.work_dir.mkdir(parents=True)
+        return self.work_dir
+
+    def intact(self, path: Path) -> bool:
+        return path.exists() and hashlib.sha256(path.read_bytes()).digest() == hashlib.sha256(self.data).digest()
+
+    def record(self, name: str, passed: bool, **details):
+        self.report["tests"][name] = {"passed": passed, **details}
+        print(f"   {'✓' if passed else '✗'} {name}: " + ", ".join(f"{k}={v}" for k, v in details.items()))
+
+    def test_integrity(self):
+        server = LocalFileServer({"/embeddings.zip": self.data})
+        dest = self.fresh_dir() / "embeddings.zip"
+        try:
+            result = download_data.RangedDownload(server.url("/embeddings.zip"), dest, SEGMENTS).run()
+        finally:
+            server.stop()
+        expected = min(SEGMENTS, len(self.data) // download_data.MIN_SEGMENT_BYTES)
+        self.record("integrity", self.intact(dest) and result["segments"] == expected,
+                    segments=result["segments"], requests=server.requests)
+
+    def test_speed(self):
+        times = {}
+        for segments in (1, SEGMENTS):
+            server = LocalFileServer({"/embeddings.zip": self.data}, rate=THROTTLE_MB_S * 1024 ** 2)
+            dest = self.fresh_dir() / "embeddings.zip"
+            try:
+                times[segments] = download_data.RangedDownload(server.url("/embeddings.zip"), dest, segments).run()["seconds"]
+            finally:
+                server.stop()
+        speedup = round(times[1] / times[SEGMENTS], 2)
+        self.record("speed", speedup > 2, single_s=times[1], parallel_s=times[SEGMENTS], speedup=speedup)
+
+    def test_retry(self):
+        server = LocalFileServer({"/embeddings.zip": self.data})
+        # Not aligned to the client's reads, so each drop cuts one short
+        server.drops, server.drop_after = 3, 2 * 1024 ** 2 + 512 * 1024 + 12345
+        dest = self.fresh_dir() / "embeddings.zip"
+        try:
+            download_data.RangedDownload(server.url("/embeddings.zip"), dest, SEGMENTS, retries=3).run()
+        finally:
+            server.stop()
+        # Retries continue from the last complete read before each drop, so
+        # at most one READ_SIZE per drop is sent twice (+1 for the size probe)
+        resent = server.bytes_sent - len(self.data) - 1
+        self.record("retry", self.intact(dest) and 0 <= resent <= 3 * download_data.READ_SIZE,
+                    requests=server.requests, bytes_sent=server.bytes_sent, resent_bytes=resent)
+
+    def test_resume(self):
+        server = LocalFileServer({"/embeddings.zip": self.data})
+        server.budget = len(self.data) // 2  # then every connection is cut
+        dest = self.fresh_dir() / "embeddings.zip"
+        url = server.url("/embeddings.zip")
+        interrupted = not download_data.download_file(url, dest, FILE_MB, SEGMENTS, retries=0)
+        first_bytes = server.bytes_sent
+        server.budget = None
+        server.bytes_sent = 0
+        try:
+            result = download_data.RangedDownload(url, dest, SEGMENTS).run()
+        finally:
+            server.stop()
+        leftovers = list(self.work_dir.glob("*.part*"))
+        self.record("resume", interrupted and self.intact(dest) and not leftovers
+                    and result["resumed_bytes"] > 0 and server.bytes_sent == len(self.data) - result["resumed_bytes"] + 1,
+                    first_run_bytes=first_bytes, resumed_bytes=result["resumed_bytes"],
+                    second_run_bytes=server.bytes_sent)
+
+    def test_no_ranges(self):
+        server = LocalFileServer({"/embeddings.zip": self.data}, ranges=False)
+        dest = self.fresh_dir() / "embeddings.zip"
+        try:
+            result = download_data.RangedDownload(server.url("/embeddings.zip"), dest, SEGMENTS).run()
+        finally:
+            server.stop()
+        self.record("no_ranges", self.intact(dest) and result["segments"] == 1,
+                    segments=result["segments"], requests=server.requests)
+
+    def test_sync(self):
+        members = {f"embedding/embedding_{i}.jsonl": random.Random(i).randbytes(1024 ** 2) for i in range(6)}
+
+        def archive(contents: dict) -> bytes:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+                z.writestr("embedding/", b"")
+                for name, data in contents.items():
+                    z.writestr(name, data)
+            return buffer.getvalue()
+
+        server = LocalFileServer({})
+        server.publish("/embeddings.zip", archive(members))
+        data_dir = self.fresh_dir()
+        manifest_path = data_dir / download_data.MANIFEST_NAME
+        url = server.url("/embeddings.zip")
+
+        def sync(verify: bool = False) -> int:
+            """Run one sync; bytes the server sent for it."""
+            server.bytes_sent = 0
+            manifest = download_data.load_manifest(manifest_path)
+            if not download_data.sync_archive("embeddings.zip", url, data_dir, manifest, manifest_path,
+                                              SEGMENTS, verify):
+                raise RuntimeError("sync failed")
+            return server.bytes_sent
+
+        def correct() -> bool:
+            files = download_data.load_manifest(manifest_path)["files"]
+            return set(files) == set(members) and all(
+                (data_dir / name).read_bytes() == data and files[name]["sha256"] == hashlib.sha256(data).hexdigest()
+                for name, data in members.items())
+
+        try:
+            sent = {"first": sync(), "unchanged": sync()}
+            members["embedding/embedding_2.jsonl"] = random.Random(99).randbytes(1024 ** 2)
+            server.publish("/embeddings.zip", archive(members))
+            sent["one_changed"] = sync()
+            (data_dir / "embedding/embedding_0.jsonl").unlink()
+            with open(data_dir / "embedding/embedding_1.jsonl", "r+b") as f:
+                f.truncate(1000)
+            sent["two_damaged"] = sync()
+            with open(data_dir / "embedding/embedding_3.jsonl", "r+b") as f:
+                f.write(b"same size, different bytes")
+            sent["overwritten"] = sync()
+            sent["overwritten_verify"] = sync(verify=True)
+        finally:
+            server.stop()
+        mb = 1024 ** 2
+        archive_size = len(server.files["/embeddings.zip"])
+        self.record("sync", correct() and sent["first"] >= archive_size and sent["unchanged"] < 0.1 * mb
+                    and 1 * mb < sent["one_changed"] < 1.2 * mb and 2 * mb < sent["two_damaged"] < 2.2 * mb
+                    and sent["overwritten"] < 0.1 * mb and 1 * mb < sent["overwritten_verify"] < 1.2 * mb,
+                    archive_bytes=archive_size, **{f"{k}_bytes": v for k, v in sent.items()})
+
+    def test_mirrors(self):
+        fast = LocalFileServer({"/embeddings.zip": self.data}, rate=32 * 1024 ** 2)
+        slow = LocalFileServer({"/embeddings.zip": self.data}, rate=THROTTLE_MB_S * 1024 ** 2)
+        other = LocalFileServer({"/embeddings.zip": self.data[::-1]})
+        try:
+            # Listed slowest first: the race has to find the fast one, and
+            # the first (the reference copy) decides that "other" differs
+            ranked = download_data.race_mirrors([("slow", slow.url("/embeddings.zip")),
+                                                 ("other", other.url("/embeddings.zip")),
+                                                 ("fast", fast.url("/embeddings.zip"))])
+            order = [r["name"] for r in ranked]
+
+            # The fast mirror dies halfway through
+            for server in (fast, slow):
+                server.bytes_sent = 0
+            fast.budget = len(self.data) // 2
+            dest = self.fresh_dir() / "embeddings.zip"
+            result = download_data.RangedDownload(ranked[0]["url"], dest, SEGMENTS, retries=1,
+                                                  mirrors=[r["url"] for r in ranked[1:]],
+                                                  fingerprint=ranked[0]["fingerprint"]).run()
+        finally:
+            for server in (fast, slow, other):
+                server.stop()
+        total_sent = fast.bytes_sent + slow.bytes_sent
+        # Only bytes of the chunks that were cut off can be fetched twice
+        wasted = total_sent - len(self.data)
+        self.record("mirrors", order == ["fast", "slow"] and self.intact(dest) and result["failovers"] >= 1
+                    and slow.bytes_sent > 0 and wasted <= SEGMENTS * download_data.CHUNK_SIZE + 2,
+                    ranking=order, failovers=result["failovers"], fast_bytes=fast.bytes_sent,
+                    slow_bytes=slow.bytes_sent, refetched_bytes=wasted)
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print(f"🧪 Local download tests ({FILE_MB} MB file, {SEGMENTS} segments)")
+        print("=" * 60)
+        for test in (self.test_integrity, self.test_speed, self.test_retry, self.test_resume, self.test_no_ranges,
+                     self.test_sync, self.test_mirrors):
+            test()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        print()
+
+    def save_report(self):
+        """Save full report as JSON."""
+        report_file = self.test_dir / "local_results.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report, f, indent=2)
+        print(f"📁 Full results saved to: {report_file}")
+        print()
+
+    def run(self) -> bool:
+        self.run_tests()
+        self.save_report()
+        return all(test["passed"] for test in self.report["tests"].values())
+
+
+if __name__ == "__main__":
+    tester = LocalDownloadTester()
+    try:
+        sys.exit(0 if tester.run() else 1)
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Tests interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
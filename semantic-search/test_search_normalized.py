@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+test_search_normalized.py - Check the search APIs agree on normalized embeddings.
+
+Builds a small segment table in a scratch schema of the configured database,
+stored the way `db_insert.py` stores normalized embeddings (unit vectors
+plus embedding_norm), and checks that:
+
+1. similar_segments() returns exact L2 distances
+2. batch_similar_segments() by segment id returns the same rows
+3. batch_similar_segments() by raw vector returns the same rows
+4. the batch and single-query results don't share result cache entries
+5. mode='rerank' re-ranks by, and reports, the same exact L2 distances
+
+The scratch schema is dropped afterwards.
+
+Usage:
+    python test_search_normalized.py
+"""
+
+import sys
+import math
+import random
+
+import psycopg2
+
+import search
+from query_cache import make_key
+from utils import vector_to_pg_format
+
+SCHEMA = "search_normalized_test"
+PODCASTS = 3
+SEGMENTS_PER_PODCAST = 40
+K = 5
+# Enough rerank candidates to cover the whole table, so rerank must be exact
+OVERSAMPLE = PODCASTS * SEGMENTS_PER_PODCAST // K
+TOLERANCE = 1e-4
+# Distances rebuilt from norms lose float32 precision near zero
+SELF_TOLERANCE = 1e-2
+
+CREATE_TABLES = """
+CREATE TABLE podcast (id TEXT PRIMARY KEY, title TEXT);
+CREATE TABLE segment (
+    id TEXT PRIMARY KEY, start_time REAL, end_time REAL, content TEXT,
+    embedding vector(128), podcast_id TEXT REFERENCES podcast(id),
+    embedding_norm REAL
+);
+"""
+
+
+def l2(a: list, b: list) -> float:
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+class NormalizedSearchTester:
+    def __init__(self):
+        self.conn = psycopg2.connect(search.CONNECTION)
+        self.vectors = {}
+        self.results = {}
+
+    def setup(self):
+        """Create the scratch schema and fill it with normalized embeddings."""
+        rng = random.Random(0)
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+            cursor.execute(f"SET search_path TO {SCHEMA}, public")
+            cursor.execute(CREATE_TABLES)
+            for p in range(PODCASTS):
+                cursor.execute("INSERT INTO podcast VALUES (%s, %s)", (f"pod{p}", f"Podcast {p}"))
+                for s in range(SEGMENTS_PER_PODCAST):
+                    segment_id = f"{p}:{s}"
+                    scale = rng.uniform(0.5, 3.0)
+                    vector = [rng.gauss(0, 1) * scale for _ in range(128)]
+                    norm = math.sqrt(sum(x * x for x in vector))
+                    self.vectors[segment_id] = vector
+                    cursor.execute(
+                        "INSERT INTO segment VALUES (%s, %s, %s, %s, %s::vector, %s, %s)",
+                        (segment_id, s, s + 1, f"text {segment_id}",
+                         vector_to_pg_format([x / norm for x in vector]), f"pod{p}", norm),
+                    )
+        self.conn.commit()
+        search.RESULT_CACHE.clear()
+
+    def teardown(self):
+        self.conn.rollback()
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        self.conn.commit()
+        self.conn.close()
+
+    def expected(self, segment_id: str) -> list:
+        """(id, exact L2 distance) of the K nearest segments, from the original vectors."""
+        query = self.vectors[segment_id]
+        distances = sorted((l2(query, vector), other) for other, vector in self.vectors.items()
+                           if other != segment_id)
+        return [(other, distance) for distance, other in distances[:K]]
+
+    def matches(self, rows: list, expected: list) -> bool:
+        return (len(rows) == len(expected)
+                and all(row[1] == other and abs(row[5] - distance) < TOLERANCE
+                        for row, (other, distance) in zip(rows, expected)))
+
+    def record(self, name: str, passed: bool):
+        self.results[name] = passed
+        print(f"   {'✅' if passed else '❌'} {name}")
+
+    def run_tests(self):
+        print()
+        print("=" * 60)
+        print("🧪 Search APIs on normalized embeddings")
+        print("=" * 60)
+        print()
+
+        segment_ids = ["0:1", "1:7", "2:39"]
+        assert search.embeddings_normalized(self.conn), "scratch table should look normalized"
+
+        single = [search.similar_segments(segment_id, K, conn=self.conn, use_cache=False)
+                  for segment_id in segment_ids]
+        self.record("similar_segments: exact L2 distances",
+                    all(self.matches(rows, self.expected(segment_id))
+                        for segment_id, rows in zip(segment_ids, single)))
+
+        batched = search.batch_similar_segments(segment_ids, K, conn=self.conn, use_cache=False)
+        self.record("batch_similar_segments by id: same rows", batched == single)
+
+        # The query segment itself comes first, at distance 0
+        by_vector = search.batch_similar_segments([self.vectors[segment_id] for segment_id in segment_ids],
+                                                  K + 1, conn=self.conn, use_cache=False)
+        self.record("batch_similar_segments by vector: same rows",
+                    all(rows[0][1] == segment_id and abs(rows[0][5]) < SELF_TOLERANCE
+                        and self.matches(rows[1:], self.expected(segment_id))
+                        for segment_id, rows in zip(segment_ids, by_vector)))
+
+        # A result cached by similar_segments() must not be served to the batch API
+        sentinel = [("sentinel", "x", "", 0, 0, 0.0)]
+        search.RESULT_CACHE.put(make_key("segment", segment_ids[0], K, "l2", "asc"), sentinel)
+        cached = search.batch_similar_segments(segment_ids[:1], K, conn=self.conn)
+        self.record("separate cache keys", cached == single[:1])
+
+        reranked = [search.similar_segments(segment_id, K, conn=self.conn, use_cache=False,
+                                            mode="rerank", oversample=OVERSAMPLE)
+                    for segment_id in segment_ids]
+        recall = search.rerank_recall(segment_ids, K, oversample=OVERSAMPLE, conn=self.conn)["recall"]
+        self.record("mode='rerank': exact L2 distances",
+                    reranked == single and recall == 1.0)
+        print()
+
+    def run(self) -> bool:
+        try:
+            self.setup()
+            self.run_tests()
+        finally:
+            self.teardown()
+        passed = sum(self.results.values())
+        print(f"{'✅' if passed == len(self.results) else '❌'} {passed}/{len(self.results)} tests passed")
+        print()
+        return passed == len(self.results)
+
+
+if __name__ == "__main__":
+    tester = NormalizedSearchTester()
+    try:
+        sys.exit(0 if tester.run() else 1)
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Tests interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\n❌ Error: {e}")
+        sys.exit(1)
@@ -8,9 +8,19 @@ To get started:
 """
 
 import io
-import pandas as pd
+import csv
+import itertools
 import psycopg2
-from typing import List
+from typing import TYPE_CHECKING, Iterable, Iterator, List
+
+import metrics
+
+# numpy and pandas take a good part of a second to import, and most callers
+# (db_check.py, db_query.py, search.py) only need a connection. Functions
+# that use them import them on first call instead.
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 # ============================================================================
 # EDIT THIS: Paste your database connection string here
@@ -36,8 +46,67 @@ def get_connection() -> psycopg2.extensions.connection:
     return psycopg2.connect(get_connection_string())
 
 
+# ============================================================================
+# Data generation counter
+# ============================================================================
+# A single-row table whose counter goes up every time data is loaded. Query
+# result caches (see query_cache.py) compare it against the generation they
+# were filled at and drop stale results when it changes. db_build.py creates
+# the table; loads into a database without it just don't bump anything.
+CREATE_GENERATION_TABLE = """
+CREATE TABLE IF NOT EXISTS ingest_generation (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    generation BIGINT NOT NULL
+)
+"""
+
+BUMP_GENERATION = """
+INSERT INTO ingest_generation (id, generation) VALUES (1, 1)
+ON CONFLICT (id) DO UPDATE SET generation = ingest_generation.generation + 1
+RETURNING generation
+"""
+
+
+def bump_generation(cursor) -> int:
+    """
+    Increment the data generation counter and return the new value.
+
+    Run this inside the same transaction as the load so the new generation
+    becomes visible exactly when the new rows do. Returns 0 (and changes
+    nothing) if db_build.py hasn't created the ingest_generation table.
+    """
+    cursor.execute("SELECT to_regclass('ingest_generation') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute(BUMP_GENERATION)
+    return cursor.fetchone()[0]
+
+
+def get_generation(connection_string: str = None, conn=None) -> int:
+    """
+    Return the current data generation (0 if nothing was loaded yet).
+
+    Pass `conn` to poll over an open connection (e.g. a pooled one) instead
+    of opening and closing a new one for every call.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(connection_string or get_connection_string())
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT to_regclass('ingest_generation') IS NOT NULL")
+            if not c.fetchone()[0]:
+                return 0
+            c.execute("SELECT generation FROM ingest_generation WHERE id = 1")
+            row = c.fetchone()
+            return row[0] if row else 0
+    finally:
+        if own_conn:
+            conn.close()
+
+
 def fast_pg_insert(
-    df: pd.DataFrame, 
+    df: "pd.DataFrame", 
     connection_string: str, 
     table_name: str, 
     columns: List[str]
@@ -49,6 +118,9 @@ def fast_pg_insert(
     This is MUCH faster than row-by-row inserts for large datasets.
     For 800k rows, this takes seconds instead of hours.
 
+    Each committed load also bumps the data generation counter, which
+    invalidates any cached query results (see query_cache.py).
+
     Parameters:
     -----------
     df : pd.DataFrame
@@ -73,6 +145,7 @@ def fast_pg_insert(
     conn = psycopg2.connect(connection_string)
     _buffer = io.StringIO()
     df.to_csv(_buffer, sep=";", index=False, header=False)
+    copy_bytes = _buffer.tell()
     _buffer.seek(0)
     
     with conn.cursor() as c:
@@ -83,12 +156,247 @@ def fast_pg_insert(
             columns=columns,
             null=''
         )
+        # Same transaction as the COPY: caches see the new generation
+        # exactly when the new rows become visible
+        bump_generation(c)
     
     conn.commit()
     conn.close()
+    metrics.inc("copy_rows_total", len(df), table=table_name)
+    metrics.inc("copy_bytes_total", copy_bytes, table=table_name)
     print(f"✅ Inserted {len(df)} rows into {table_name}")
 
 
+class _CopyRows:
+    """
+    File-like CSV view of an iterator of rows, for cursor.copy_expert().
+
+    COPY calls read() for the next piece of text; rows are formatted only
+    then, so they can come from a generator that is still reading its input.
+    """
+
+    def __init__(self, rows: Iterable[tuple]):
+        self.rows = iter(rows)
+        self.pending = []
+        self.pending_length = 0
+        self.rows_copied = 0
+        self.chars_copied = 0
+        self.writer = csv.writer(self, delimiter=";", lineterminator="\n")
+
+    def write(self, text: str):
+        self.pending.append(text)
+        self.pending_length += len(text)
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or self.pending_length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.rows_copied += 1
+        data = "".join(self.pending)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self.pending, self.pending_length = [rest], len(rest)
+        else:
+            self.pending, self.pending_length = [], 0
+        self.chars_copied += len(data)
+        return data
+
+
+def copy_rows(
+    rows: Iterable[tuple],
+    connection_string: str,
+    table_name: str,
+    columns: List[str],
+    chunk_size: int = 1024 ** 2
+) -> int:
+    """
+    COPY rows from any iterable (e.g. a generator) into a table.
+
+    Like fast_pg_insert(), but the rows never have to be in memory all at
+    once: they are formatted as CSV and sent while the iterable produces
+    them. None becomes NULL. Bumps the data generation like fast_pg_insert.
+
+    Parameters:
+    -----------
+    rows : Iterable[tuple]
+        One tuple per row, values in `columns` order.
+    connection_string : str
+        The connection string to the PostgreSQL database.
+    table_name : str
+        The name of the target table.
+    columns : List[str]
+        The target columns.
+    chunk_size : int
+        Characters sent to the server per round trip.
+
+    Returns:
+    --------
+    int
+        Rows inserted.
+
+    Example:
+    --------
+    >>> rows = ((i, f"title {i}") for i in range(3))
+    >>> copy_rows(rows, CONNECTION, 'podcast', ['id', 'title'])
+    3
+    """
+    source = _CopyRows(rows)
+    conn = psycopg2.connect(connection_string)
+    try:
+        with conn.cursor() as c:
+            c.copy_expert(
+                f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, DELIMITER ';')",
+                source, size=chunk_size,
+            )
+            bump_generation(c)
+        conn.commit()
+    finally:
+        conn.close()
+    metrics.inc("copy_rows_total", source.rows_copied, table=table_name)
+    metrics.inc("copy_bytes_total", source.chars_copied, table=table_name)
+    print(f"✅ Inserted {source.rows_copied} rows into {table_name}")
+    return source.rows_copied
+
+
+def normalize_embeddings(vectors) -> tuple:
+    """
+    L2-normalize embedding vectors.
+
+    Parameters:
+    -----------
+    vectors : array-like, shape (n, dimensions)
+        The embeddings, e.g. a list of 128-float lists.
+
+    Returns:
+    --------
+    (np.ndarray, np.ndarray)
+        The unit vectors (float32) and the original lengths (float64).
+        All-zero vectors are left as they are, with length 0.
+
+    Example:
+    --------
+    >>> unit, norms = normalize_embeddings([[3.0, 4.0]])
+    >>> unit.tolist(), norms.tolist()
+    ([[0.6000000238418579, 0.800000011920929]], [5.0])
+    """
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1)
+    unit = vectors / np.where(norms > 0, norms, 1.0)[:, None]
+    return unit.astype(np.float32), norms
+
+
+# ============================================================================
+# Streaming large result sets
+# ============================================================================
+_cursor_names = itertools.count()
+
+VECTOR_TYPE_OIDS = "SELECT oid FROM pg_type WHERE typname IN ('vector', 'halfvec')"
+
+
+def _column_block(values: list, is_vector: bool) -> "np.ndarray":
+    """Turn one column of a fetched batch into an array (2-D for vectors)."""
+    import numpy as np
+    first = values[0]
+    if isinstance(first, (list, tuple)):
+        # real[] columns, e.g. embedding::real[]
+        return np.array(values, dtype=np.float32)
+    if is_vector and isinstance(first, str):
+        # pgvector's text form '[0.1,0.2,...]', parsed in one pass
+        flat = np.array(",".join(v[1:-1] for v in values).split(","), dtype=np.float32)
+        return flat.reshape(len(values), -1)
+    if hasattr(first, "to_numpy"):
+        # pgvector.psycopg2.register_vector() Vector objects
+        return np.stack([v.to_numpy() for v in values]).astype(np.float32, copy=False)
+    return np.array(values)
+
+
+def stream_query(
+    query: str,
+    params=None,
+    batch_size: int = 2000,
+    numpy: bool = False,
+    conn=None,
+    connection_string: str = None
+) -> Iterator:
+    """
+    Run a query through a server-side cursor and yield results as they
+    arrive, instead of fetching everything with fetchall().
+
+    Only one batch of rows is held client-side at a time, so memory stays
+    flat no matter how many rows the query returns.
+
+    Parameters:
+    -----------
+    query : str
+        The SQL query. A single SELECT (named cursors can't run other
+        statements).
+    params : dict or tuple, optional
+        Query parameters, as for cursor.execute().
+    batch_size : int
+        Rows fetched per round-trip.
+    numpy : bool
+        If False, yield one row tuple at a time. If True, yield one dict per
+        batch mapping column name -> array; vector columns (pgvector text or
+        real[]) become 2-D float32 arrays of shape (rows, dimensions).
+    conn : psycopg2 connection, optional
+        Connection to use. If omitted, one is opened and closed when the
+        generator finishes. Server-side cursors only exist inside a
+        transaction, so on an autocommit connection (e.g. search_service's
+        pool) autocommit is switched off while the generator runs, and the
+        read-only transaction is rolled back and autocommit restored when
+        it finishes. Don't use the connection for anything else meanwhile.
+    connection_string : str, optional
+        Used to open the connection when conn is omitted.
+
+    Returns:
+    --------
+    Iterator of tuples, or of dicts of np.ndarray when numpy=True
+
+    Example:
+    --------
+    >>> sql = "SELECT id, embedding FROM segment WHERE podcast_id = %(p)s"
+    >>> for block in stream_query(sql, {"p": "VeH7qKZr0WI"}, numpy=True):
+    ...     print(block["id"][:3], block["embedding"].shape)
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(connection_string or get_connection_string())
+    # psycopg2 refuses named cursors in autocommit mode
+    autocommit = conn.autocommit
+    if autocommit:
+        conn.autocommit = False
+    try:
+        vector_oids = set()
+        if numpy:
+            with conn.cursor() as c:
+                c.execute(VECTOR_TYPE_OIDS)
+                vector_oids = {row[0] for row in c.fetchall()}
+        with conn.cursor(name=f"stream_query_{next(_cursor_names)}") as c:
+            c.itersize = batch_size
+            c.execute(query, params)
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                if not numpy:
+                    yield from rows
+                    continue
+                yield {
+                    column.name: _column_block(list(values), column.type_code in vector_oids)
+                    for column, values in zip(c.description, zip(*rows))
+                }
+    finally:
+        if own_conn:
+            conn.close()
+        elif autocommit:
+            # End the transaction opened for the cursor (nothing was written)
+            conn.rollback()
+            conn.autocommit = True
+
+
 def vector_to_pg_format(vector: List[float]) -> str:
     """
     Convert a Python list of floats to PostgreSQL vector format.
@@ -0,0 +1,353 @@
+"""
+zip_stream.py - Read JSONL records straight out of zip archives.
+
+download_data.py used to extract every archive to disk and db_insert.py
+then read the extracted files back. This module reads the archives
+front to back instead, member by member, straight from a file or from
+an HTTP response. Nothing is written to disk, and an archive doesn't need
+to be complete, or even seekable, before its first records arrive.
+
+zipfile.ZipFile can't do this, because it starts from the central
+directory at the end of the archive. Here each member's local header is
+read in order and its data is inflated with zlib as the bytes arrive.
+Every member's CRC-32 is checked against the archive's.
+
+read_central_directory() goes the other way. It lists the members of a
+remote archive from two or three small reads at its end. download_data.py
+uses it to fetch only the members that changed.
+
+Sources can be:
+    data/embeddings.zip                 a zip file
+    https://.../embeddings.zip          a zip archive over HTTP(S), streamed
+    data/                               an extracted directory (read as before)
+
+Usage:
+    from zip_stream import iter_jsonl
+    for name, record in iter_jsonl("data/embeddings.zip", "*.jsonl"):
+        ...
+
+    python zip_stream.py data/raw_data.zip       # list members and line counts
+"""
+
+import sys
+import json
+import zlib
+import struct
+import bisect
+import fnmatch
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Zip format (APPNOTE.TXT 4.3)
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_SIGNATURE = 0x04034B50
+DESCRIPTOR_SIGNATURE = 0x08074B50
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_SIGNATURE = 0x02014B50
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_SIGNATURE = 0x06054B50
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_SIGNATURE = 0x06064B50
+ZIP64_EXTRA = 0x0001
+STORED, DEFLATED = 0, 8
+FLAG_ENCRYPTED, FLAG_DESCRIPTOR = 0x1, 0x8
+
+READ_SIZE = 1024 ** 2  # bytes read from the source at a time
+
+
+class ZipStreamError(Exception):
+    """The archive is damaged or uses a feature that can't be streamed."""
+
+
+class _Reader:
+    """A read(n)-able stream with exact reads and push-back."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.buffer = b""
+        self.position = 0  # bytes consumed from the archive so far
+
+    def read(self, n: int = READ_SIZE) -> bytes:
+        """Up to n bytes; b"" only at the end of the stream."""
+        if self.buffer:
+            data, self.buffer = self.buffer[:n], self.buffer[n:]
+        else:
+            data = self.raw.read(n)
+        self.position += len(data)
+        return data
+
+    def read_exact(self, n: int) -> bytes:
+        parts, remaining = [], n
+        while remaining:
+            data = self.read(remaining)
+            if not data:
+                raise ZipStreamError(f"archive ends early (wanted {n} bytes at offset {self.position:,})")
+            parts.append(data)
+            remaining -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes):
+        self.buffer = data + self.buffer
+        self.position -= len(data)
+
+
+def _zip64_values(extra: bytes, uncompressed: int, compressed: int, offset: int = 0) -> tuple:
+    """
+    Apply a ZIP64 extra field: values the header marks 0xFFFFFFFF are
+    stored there instead, in this order. Returns them plus whether the
+    field was present.
+    """
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, position)
+        if header_id == ZIP64_EXTRA:
+            values = list(struct.unpack_from(f"<{size // 8}Q", extra, position + 4))
+            if uncompressed == 0xFFFFFFFF and values:
+                uncompressed = values.pop(0)
+            if compressed == 0xFFFFFFFF and values:
+                compressed = values.pop(0)
+            if offset == 0xFFFFFFFF and values:
+                offset = values.pop(0)
+            return uncompressed, compressed, offset, True
+        position += 4 + size
+    return uncompressed, compressed, offset, False
+
+
+def _member_data(reader: _Reader, method: int, flags: int, compressed: int,
+                 crc: int, zip64: bool, name: str) -> Iterator[bytes]:
+    """Yield a member's uncompressed bytes, then check its CRC-32."""
+    actual_crc = 0
+    if method == STORED:
+        if flags & FLAG_DESCRIPTOR:
+            raise ZipStreamError(f"{name}: stored member without sizes can't be streamed")
+        remaining = compressed
+        while remaining:
+            data = reader.read(min(READ_SIZE, remaining))
+            if not data:
+                raise ZipStreamError(f"{name}: archive ends inside this member")
+            remaining -= len(data)
+            actual_crc = zlib.crc32(data, actual_crc)
+            yield data
+    elif method == DEFLATED:
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not inflater.eof:
+            data = reader.read()
+            if not data:
+                raise ZipStreamError(f"{name}: archive ends inside this member")
+            data = inflater.decompress(data)
+            if data:
+                actual_crc = zlib.crc32(data, actual_crc)
+                yield data
+        # The last read may have run past the end of the member
+        reader.unread(inflater.unused_data)
+    else:
+        raise ZipStreamError(f"{name}: compression method {method} isn't supported (only stored and deflate)")
+
+    if flags & FLAG_DESCRIPTOR:
+        # crc32, compressed size, uncompressed size, with an optional signature
+        first = struct.unpack("<I", reader.read_exact(4))[0]
+        crc = struct.unpack("<I", reader.read_exact(4))[0] if first == DESCRIPTOR_SIGNATURE else first
+        reader.read_exact(16 if zip64 else 8)
+    if actual_crc != crc:
+        raise ZipStreamError(f"{name}: CRC-32 mismatch ({actual_crc:08x} != {crc:08x})")
+
+
+def iter_members(stream, want: Optional[Callable[[str], bool]] = None) -> Iterator[tuple]:
+    """
+    Walk a zip archive front to back.
+
+    Parameters:
+    -----------
+    stream : binary file-like
+        Anything with read(n): an open file, an HTTP response body, ...
+    want : callable, optional
+        Called with each member name; members it rejects are skipped
+        (and still CRC-checked if they have to be inflated to find their
+        end). Directories are always skipped.
+
+    Returns:
+    --------
+    Iterator[(str, Iterator[bytes])]
+        Member name and its uncompressed data. Each data iterator must be
+        used before the next member is requested; what's left of it is
+        read and discarded then.
+    """
+    reader = _Reader(stream)
+    while True:
+        signature = reader.read(4)
+        if signature and len(signature) < 4:
+            signature += reader.read_exact(4 - len(signature))
+        if signature != struct.pack("<I", LOCAL_SIGNATURE):
+            return  # central directory (or the end): no more members
+        header = signature + reader.read_exact(LOCAL_HEADER.size - 4)
+        (_, _, flags, method, _, _, crc, compressed, uncompressed,
+         name_length, extra_length) = LOCAL_HEADER.unpack(header)
+        name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read_exact(extra_length)
+        uncompressed, compressed, _, zip64 = _zip64_values(extra, uncompressed, compressed)
+        if flags & FLAG_ENCRYPTED:
+            raise ZipStreamError(f"{name}: encrypted members aren't supported")
+
+        if name.endswith("/") or (want is not None and not want(name)):
+            if not flags & FLAG_DESCRIPTOR:
+                # Size known up front: skip the bytes without inflating them
+                remaining = compressed
+                while remaining:
+                    data = reader.read(min(READ_SIZE, remaining))
+                    if not data:
+                        raise ZipStreamError(f"{name}: archive ends inside this member")
+                    remaining -= len(data)
+                continue
+            for _ in _member_data(reader, method, flags, compressed, crc, zip64, name):
+                pass
+            continue
+
+        data = _member_data(reader, method, flags, compressed, crc, zip64, name)
+        yield name, data
+        for _ in data:
+            pass
+
+
+def read_central_directory(read_at: Callable[[int, int], bytes], size: int) -> list:
+    """
+    List an archive's members from its central directory.
+
+    Parameters:
+    -----------
+    read_at : callable
+        read_at(start, length) returns that many bytes of the archive, e.g.
+        with an HTTP Range request.
+    size : int
+        Archive size in bytes.
+
+    Returns:
+    --------
+    list of dict
+        One per member: 'name', 'crc32', 'size' (uncompressed),
+        'compressed', and 'offset' / 'end', the byte range from its local
+        header up to the next member. iter_members() over just that range
+        yields just that member.
+    """
+    # The end record is 22 bytes plus a comment of up to 64 KB, which is
+    # almost always empty: look in the last 4 KB first
+    for tail_length in (4096, END_RECORD.size + 0xFFFF + ZIP64_LOCATOR.size):
+        tail_length = min(size, tail_length)
+        tail = read_at(size - tail_length, tail_length)
+        index = tail.rfind(struct.pack("<I", END_SIGNATURE))
+        if index >= ZIP64_LOCATOR.size or tail_length == size:
+            break
+    if index < 0:
+        raise ZipStreamError("no end of central directory record (not a zip archive?)")
+    _, _, _, _, count, directory_size, directory_offset, _ = END_RECORD.unpack_from(tail, index)
+    if count == 0xFFFF or 0xFFFFFFFF in (directory_size, directory_offset):
+        signature, _, record_offset, _ = ZIP64_LOCATOR.unpack_from(tail, index - ZIP64_LOCATOR.size)
+        if signature != ZIP64_LOCATOR_SIGNATURE:
+            raise ZipStreamError("ZIP64 end record locator missing")
+        record = ZIP64_END_RECORD.unpack(read_at(record_offset, ZIP64_END_RECORD.size))
+        if record[0] != ZIP64_END_SIGNATURE:
+            raise ZipStreamError("ZIP64 end record missing")
+        count, directory_size, directory_offset = record[7], record[8], record[9]
+
+    directory = read_at(directory_offset, directory_size)
+    entries, position = [], 0
+    for _ in range(count):
+        fields = CENTRAL_HEADER.unpack_from(directory, position)
+        if fields[0] != CENTRAL_SIGNATURE:
+            raise ZipStreamError(f"bad central directory entry at offset {directory_offset + position:,}")
+        flags, crc, compressed, uncompressed = fields[3], fields[7], fields[8], fields[9]
+        name_length, extra_length, comment_length, offset = fields[10], fields[11], fields[12], fields[16]
+        start = position + CENTRAL_HEADER.size
+        name = directory[start:start + name_length].decode("utf-8" if flags & 0x800 else "cp437")
+        extra = directory[start + name_length:start + name_length + extra_length]
+        uncompressed, compressed, offset, _ = _zip64_values(extra, uncompressed, compressed, offset)
+        entries.append({"name": name, "crc32": crc, "size": uncompressed,
+                        "compressed": compressed, "offset": offset})
+        position = start + name_length + extra_length + comment_length
+
+    starts = sorted({entry["offset"] for entry in entries} | {directory_offset})
+    for entry in entries:
+        entry["end"] = starts[bisect.bisect_right(starts, entry["offset"])]
+    return entries
+
+
+def iter_lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Split a stream of byte chunks into lines (without line endings)."""
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if pending:
+        yield pending.rstrip(b"\r")
+
+
+@contextmanager
+def open_source(source: str):
+    """Open a zip file path or an http(s) URL as a binary stream."""
+    if str(source).startswith(("http://", "https://")):
+        import requests  # only needed for URLs
+
+        with requests.get(source, stream=True, allow_redirects=True, timeout=30) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield response.raw
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+def iter_jsonl(source: str, pattern: str = "*.jsonl", parse_float: Optional[Callable] = None) -> Iterator[tuple]:
+    """
+    Yield every JSON record in the .jsonl files of a source.
+
+    Parameters:
+    -----------
+    source : str
+        Zip file, http(s) URL of a zip file, or a directory of extracted
+        files (searched recursively).
+    pattern : str
+        fnmatch pattern for file names (not paths), e.g. "batch_request*.jsonl".
+    parse_float : callable, optional
+        Passed to json.loads. `str` keeps numbers as their JSON text, which
+        is much faster when they are only going to be written out again.
+
+    Returns:
+    --------
+    Iterator[(str, dict)]
+        File or member name, and one parsed record.
+
+    Example:
+    --------
+    >>> for name, record in iter_jsonl("data/raw_data.zip", "batch_request*.jsonl"):
+    ...     print(name, record["custom_id"])
+    """
+    def wanted(name: str) -> bool:
+        return fnmatch.fnmatch(name.rsplit("/", 1)[-1], pattern)
+
+    if Path(source).is_dir():
+        for path in sorted(Path(source).rglob("*")):
+            if path.is_file() and wanted(path.name):
+                with open(path, "rb") as f:
+                    for line in f:
+                        if line.strip():
+                            yield str(path), json.loads(line, parse_float=parse_float)
+        return
+
+    with open_source(source) as stream:
+        for name, data in iter_members(stream, wanted):
+            for line in iter_lines(data):
+                if line.strip():
+                    yield name, json.loads(line, parse_float=parse_float)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit(__doc__)
+    with open_source(sys.argv[1]) as stream:
+        for name, data in iter_members(stream):
+            lines = sum(1 for _ in iter_lines(data))
+            print(f"   {name:<50} {lines:>10,} lines")